@@ -0,0 +1,133 @@
+"""
+Throughput and memory of the analytics export, and speed of the vectorized report.
+
+Fills a FakeSupabaseClient with `--messages` chat messages from `--users`
+users over `--days` days, then exports them with AnalyticsExporter at each
+`--page-size`, reporting rows per second and the peak memory traced during
+the export (which should follow the page size, not the table size). Adds
+1% more messages and times the incremental run from the watermark. Finally
+times daily volumes, reply lengths and topic frequencies over the exported
+columns against the same aggregation as a Python loop over the rows.
+
+Usage:
+    python -m benchmarks.bench_analytics_export [--messages 50000] [--page-size 1000 10000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fakes import FakeSupabaseClient
+from benchmarks.load_pipeline import KNOWLEDGE_RECORDS, load_corpus
+from services.analytics import AnalyticsExporter, daily_volumes, load_table, response_lengths, topic_frequencies
+from services.database_service import DatabaseService
+
+TOPICS = [record["topic"] for record in KNOWLEDGE_RECORDS]
+
+
+def _fill(client: FakeSupabaseClient, count: int, options: argparse.Namespace, rng: random.Random,
+          start: datetime) -> None:
+    texts = [message for conversation in load_corpus() for message in conversation]
+    step = timedelta(days=options.days) / max(count, 1)
+    for i in range(count):
+        client._insert_row("chat_history", {
+            "phone_number": f"+9198{rng.randrange(options.users):08d}",
+            "sender": "user" if i % 2 == 0 else "bot",
+            "message_text": rng.choice(texts) if i % 2 == 0 else "Please drink fluids. " * rng.randint(2, 20),
+            "created_at": (start + step * i).isoformat(),
+        })
+
+
+def _python_report(rows: List[Dict[str, Any]]) -> Any:
+    # The same aggregations as a loop over the rows, as one would write them against the API
+    user_messages: Counter = Counter()
+    bot_chars: Dict[Any, List[int]] = defaultdict(list)
+    active = defaultdict(set)
+    topics: Counter = Counter()
+    for row in rows:
+        day = datetime.fromisoformat(row["created_at"]).astimezone(timezone.utc).date()
+        active[day].add(row["phone_number"])
+        if row["sender"] == "user":
+            user_messages[day] += 1
+            text = row["message_text"].lower()
+            for topic in TOPICS:
+                if topic.lower() in text:
+                    topics[topic] += 1
+        else:
+            bot_chars[day].append(len(row["message_text"]))
+    return user_messages, {day: sum(v) / len(v) for day, v in bot_chars.items()}, active, topics
+
+
+def _export(client: FakeSupabaseClient, export_dir: str, page_size: int, trace: bool) -> Dict[str, float]:
+    exporter = AnalyticsExporter(DatabaseService(client=client), export_dir, page_size=page_size)
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    result = asyncio.run(exporter.run(users=False))
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    if trace:
+        tracemalloc.stop()
+    return {"messages": result.messages, "seconds": elapsed, "peak_mb": peak / 1e6}
+
+
+def _directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--page-size", type=int, nargs="+", default=[1000, 10_000])
+    options = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    rng = random.Random(11)
+    client = FakeSupabaseClient()
+    start = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    _fill(client, options.messages, options, rng, start)
+    print(f"{options.messages} chat messages | {options.users} users | {options.days} days")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for page_size in options.page_size:
+            export_dir = os.path.join(workdir, f"pages-{page_size}")
+            timed = _export(client, export_dir, page_size, trace=False)
+            traced = _export(client, export_dir + "-traced", page_size, trace=True)
+            print(f"page size {page_size:>6} | {timed['messages'] / timed['seconds']:>8.0f} rows/s | "
+                  f"peak traced memory {traced['peak_mb']:>6.1f} MB | {_directory_size(export_dir) / 1e6:.1f} MB on disk")
+
+        export_dir = os.path.join(workdir, f"pages-{options.page_size[-1]}")
+        added = options.messages // 100
+        _fill(client, added, options, rng, start + timedelta(days=options.days))
+        client.requests.clear()
+        incremental = _export(client, export_dir, options.page_size[-1], trace=False)
+        print(f"incremental run  | {incremental['messages']} new rows in {incremental['seconds'] * 1000:.0f} ms | "
+              f"{client.requests[('chat_history', 'select')]} page requests")
+
+        started = time.perf_counter()
+        chat = load_table(export_dir)
+        loaded = time.perf_counter() - started
+        started = time.perf_counter()
+        daily_volumes(chat)
+        response_lengths(chat)
+        topic_frequencies(chat, TOPICS)
+        vectorized = time.perf_counter() - started
+        started = time.perf_counter()
+        _python_report(client.tables["chat_history"])
+        looped = time.perf_counter() - started
+        print(f"report over {len(chat['id'])} rows | load {loaded:.2f}s | vectorized {vectorized:.2f}s | "
+              f"Python loop {looped:.2f}s ({looped / vectorized:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
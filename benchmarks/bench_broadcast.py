@@ -0,0 +1,121 @@
+"""
+Throughput of the broadcast engine against the fake Twilio API.
+
+Fills a FakeSupabaseClient with `--users` users in three languages and sends
+a broadcast to those matching a filter, through TwilioHttpSender on an
+in-process FakeTwilioServer with `--twilio-latency` per request. Runs once
+per concurrency level with the rate limit out of the way, then once with
+`--rate` messages per second to check that the limit holds. Reports
+messages per second, database page requests and, for the last run, how
+many recipients got the message twice after an interruption and resume.
+
+Usage:
+    python -m benchmarks.bench_broadcast [--users 5000] [--concurrency 5 20 100] [--twilio-latency 0.02]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.fakes import FakeSupabaseClient, FakeTwilioServer
+from services.broadcast import BroadcastEngine, BroadcastStore
+from services.database_service import DatabaseService
+from services.sms_dispatcher import SmsDispatcher, TwilioHttpSender
+
+TEMPLATES = {
+    "English": "Heatwave alert: drink water often and stay indoors from 12 to 4 pm.",
+    "Hindi": "Loo chetavani: baar baar paani piyen aur dopahar 12 se 4 baje tak ghar ke andar rahen.",
+}
+
+
+def _client(users: int) -> FakeSupabaseClient:
+    client = FakeSupabaseClient()
+    for i in range(users):
+        client.tables["users"].append({
+            "phone_number": f"+9198{i:08d}",
+            "language": ["English", "Hindi", "Tamil"][i % 3],
+            "has_diabetes": i % 4 == 0,
+        })
+    return client
+
+
+def _engine(client: FakeSupabaseClient, server: FakeTwilioServer, workdir: str, concurrency: int,
+            rate: float, page_size: int) -> BroadcastEngine:
+    # A burst of a tenth of a second's worth keeps short rate-limited runs close to the rate
+    sender = TwilioHttpSender("ACbench", "token", base_url="http://twilio.bench",
+                              transport=httpx.ASGITransport(app=server))
+    dispatcher = SmsDispatcher(sender, rate_per_second=rate, burst=max(1.0, rate / 10))
+    return BroadcastEngine(
+        DatabaseService(client=client), dispatcher, BroadcastStore(os.path.join(workdir, "broadcasts.sqlite3")),
+        from_numbers={"": "+10000000000"}, concurrency=concurrency, page_size=page_size,
+    )
+
+
+async def _run(client: FakeSupabaseClient, options: argparse.Namespace, concurrency: int, rate: float,
+               filters: Dict[str, Any], interrupt_after: Optional[int] = None) -> Dict[str, Any]:
+    server = FakeTwilioServer(latency=options.twilio_latency)
+    client.requests.clear()
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = _engine(client, server, workdir, concurrency, rate, options.page_size)
+        await engine.store.create("bench", TEMPLATES, filters)
+        started = time.perf_counter()
+        if interrupt_after is not None:
+            engine.start("bench")
+            while len(server.messages) < interrupt_after:
+                await asyncio.sleep(0.01)
+            await engine.stop()
+            engine = _engine(client, server, workdir, concurrency, rate, options.page_size)
+        result = await engine.run("bench")
+        elapsed = time.perf_counter() - started
+        engine.store.close()
+    recipients = [message["to"] for message in server.messages]
+    return {
+        "sent": result.sent,
+        "messages_per_sec": len(recipients) / elapsed,
+        "page_requests": client.requests[("users", "select")],
+        "duplicates": len(recipients) - len(set(recipients)),
+    }
+
+
+async def _main(options: argparse.Namespace) -> None:
+    client = _client(options.users)
+    filters = {"language": ["English", "Hindi", "Tamil"]}
+    print(f"{options.users} users | pages of {options.page_size} | Twilio latency {options.twilio_latency * 1000:.0f} ms")
+    for concurrency in options.concurrency:
+        result = await _run(client, options, concurrency, 1_000_000, filters)
+        print(f"concurrency {concurrency:>3} | {result['sent']:>6} sent | {result['messages_per_sec']:>7.0f} msgs/s | "
+              f"{result['page_requests']} page requests")
+
+    # With the rate limit, and interrupted halfway through
+    subset = {"has_diabetes": True}
+    matching = sum(1 for row in client.tables["users"] if row["has_diabetes"])
+    count = min(matching, int(options.rate * 5))
+    client.tables["users"] = [row for row in client.tables["users"] if row["has_diabetes"]][:count]
+    result = await _run(client, options, max(options.concurrency), options.rate, subset, interrupt_after=count // 2)
+    print(f"rate {options.rate:.0f}/s    | {result['sent']:>6} sent | {result['messages_per_sec']:>7.0f} msgs/s | "
+          f"interrupted at {count // 2} and resumed: {result['duplicates']} duplicate(s)")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[5, 20, 100])
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--twilio-latency", type=float, default=0.02)
+    parser.add_argument("--rate", type=float, default=200.0)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.disable(logging.WARNING)
+    asyncio.run(_main(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
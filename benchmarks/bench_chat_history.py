@@ -0,0 +1,149 @@
+"""
+Cost of reading recent chat history as chat_history grows, and of archiving old turns.
+
+Fills a SQLite stand-in for the Postgres table with `--users` users and
+`--messages` messages each, spread over `--days` days and interleaved the way
+real traffic arrives; texts are random runs of the words of the load-test
+conversations. Then times the history read of random users three ways: the
+query get_chat_history used to make on the bare table, the same query with
+the composite index of migrations/001_chat_history_retention.sql, and the
+one-row chat_recent lookup it makes now. Finally runs ChatArchiver over
+the stand-in with `--retention-days` and reports archive throughput, bytes
+per archived message and the database file size before and after.
+
+Usage:
+    python -m benchmarks.bench_chat_history [--users 2000] [--messages 200] [--queries 500]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.load_pipeline import load_corpus, percentiles
+from services.chat_archive import ChatArchiver
+
+HISTORY_QUERY = "SELECT * FROM chat_history WHERE phone_number = ? ORDER BY created_at DESC, id DESC LIMIT ?"
+RECENT_QUERY = "SELECT messages FROM chat_recent WHERE phone_number = ?"
+NOW = datetime(2025, 7, 1, tzinfo=timezone.utc)
+
+
+class SQLiteChatStore:
+    """
+    The two DatabaseService methods ChatArchiver uses, on the SQLite stand-in.
+    """
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    async def old_chat_messages(self, before: str, limit: int = 1000) -> List[Dict[str, Any]]:
+        cursor = self.conn.execute(
+            "SELECT * FROM chat_history WHERE created_at < ? ORDER BY created_at, id LIMIT ?", (before, limit)
+        )
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    async def delete_chat_messages(self, ids: List[Any]) -> None:
+        with self.conn:
+            self.conn.executemany("DELETE FROM chat_history WHERE id = ?", [(i,) for i in ids])
+
+
+def _fill(conn: sqlite3.Connection, options: argparse.Namespace) -> None:
+    rng = random.Random(5)
+    words = sorted({word for conversation in load_corpus() for message in conversation for word in message.split()})
+    conn.execute("CREATE TABLE chat_history (id INTEGER PRIMARY KEY, phone_number TEXT, sender TEXT, "
+                 "message_text TEXT, created_at TEXT)")
+    conn.execute("CREATE TABLE chat_recent (phone_number TEXT PRIMARY KEY, messages TEXT)")
+    total = options.users * options.messages
+    start = NOW - timedelta(days=options.days)
+    step = timedelta(days=options.days) / total
+    rows = (
+        (i + 1, f"+9198{rng.randrange(options.users):08d}", "user" if i % 2 == 0 else "bot",
+         " ".join(rng.choices(words, k=rng.randint(5, 40))), (start + step * i).isoformat())
+        for i in range(total)
+    )
+    with conn:
+        conn.executemany("INSERT INTO chat_history VALUES (?, ?, ?, ?, ?)", rows)
+    # The migration's backfill: each user's last `window` messages in one row
+    windows: Dict[str, List[Dict[str, Any]]] = {}
+    for phone, sender, text, created_at in conn.execute(
+            "SELECT phone_number, sender, message_text, created_at FROM chat_history ORDER BY id"):
+        window = windows.setdefault(phone, [])
+        window.append({"phone_number": phone, "sender": sender, "message_text": text, "created_at": created_at})
+        del window[:-options.window]
+    with conn:
+        conn.executemany("INSERT INTO chat_recent VALUES (?, ?)",
+                         ((phone, json.dumps(window)) for phone, window in windows.items()))
+
+
+def _time(read: Callable[[str], object], phones: List[str]) -> Dict[str, float]:
+    timings = []
+    for phone in phones:
+        started = time.perf_counter()
+        read(phone)
+        timings.append(time.perf_counter() - started)
+    return percentiles(timings)
+
+
+def _plan(conn: sqlite3.Connection, query: str, params: tuple) -> str:
+    return "; ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=200, help="messages per user, on average")
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--window", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--retention-days", type=float, default=90)
+    parser.add_argument("--page-size", type=int, default=1000)
+    options = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "chat.sqlite3")
+        conn = sqlite3.connect(db_path)
+        _fill(conn, options)
+        rng = random.Random(9)
+        phones = [f"+9198{rng.randrange(options.users):08d}" for _ in range(options.queries)]
+        rows = options.users * options.messages
+        print(f"{rows} chat_history rows | {options.users} users | window of {options.window}")
+
+        def history(phone: str):
+            return list(reversed(conn.execute(HISTORY_QUERY, (phone, options.window)).fetchall()))
+
+        def recent(phone: str):
+            row = conn.execute(RECENT_QUERY, (phone,)).fetchone()
+            return json.loads(row[0]) if row else []
+
+        results = [("chat_history, no index", _plan(conn, HISTORY_QUERY, ("", 1)), _time(history, phones[:50]))]
+        conn.execute("CREATE INDEX chat_history_phone_created_idx ON chat_history (phone_number, created_at DESC, id DESC)")
+        results.append(("chat_history, composite", _plan(conn, HISTORY_QUERY, ("", 1)), _time(history, phones)))
+        results.append(("chat_recent window", _plan(conn, RECENT_QUERY, ("",)), _time(recent, phones)))
+        for name, plan, latency in results:
+            print(f"{name:<24} | p50 {latency['p50'] * 1e6:>9.0f} us | p99 {latency['p99'] * 1e6:>9.0f} us | {plan}")
+
+        conn.execute("CREATE INDEX chat_history_created_idx ON chat_history (created_at, id)")
+        size_before = os.path.getsize(db_path)
+        archiver = ChatArchiver(SQLiteChatStore(conn), os.path.join(workdir, "archive"),
+                                retention_days=options.retention_days, page_size=options.page_size)
+        started = time.perf_counter()
+        result = asyncio.run(archiver.run(now=NOW))
+        elapsed = time.perf_counter() - started
+        conn.execute("VACUUM")
+        size_after = os.path.getsize(db_path)
+        print(f"archived {result.messages} messages in {elapsed:.1f}s ({result.messages / elapsed:.0f} msgs/s) | "
+              f"{result.files} files, {result.bytes_written / max(result.messages, 1):.0f} bytes/message")
+        print(f"database file {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB after archiving and VACUUM")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,76 @@
+"""
+Emergency reply latency while the normal send pipeline is saturated.
+
+Against an in-process fake Twilio with fixed latency, a large backlog of
+normal replies is pushed through the SmsDispatcher while emergency replies
+arrive at a steady rate. Emergency latency (arrival to Twilio acceptance) is
+measured twice: sent as critical messages through the shared dispatcher,
+and sent on the EmergencyLane with its reserved workers.
+
+Usage:
+    python -m benchmarks.bench_emergency_lane [normal_messages] [emergencies]
+"""
+import asyncio
+import logging
+import sys
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeTwilioServer
+from core.config import settings
+from services.emergency_lane import EmergencyLane, LatencyWindow, load_replies
+from services.sms_dispatcher import SmsDispatcher, TwilioHttpSender
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+TWILIO_LATENCY = 0.05
+DISPATCH_WORKERS = 20
+
+
+async def _run(normal_messages: int, emergencies: int, use_lane: bool) -> None:
+    server = FakeTwilioServer(latency=TWILIO_LATENCY)
+    sender = TwilioHttpSender("AC123", "token", base_url="http://twilio.test", transport=httpx.ASGITransport(app=server))
+    dispatcher = SmsDispatcher(sender, rate_per_second=100_000, burst=1_000, concurrency=DISPATCH_WORKERS)
+    replies = load_replies(settings.CRITICAL_REPLIES_PATH)
+    lane = EmergencyLane(sender, replies, sender_numbers=["+100"], concurrency=4, dispatcher=dispatcher)
+    shared_latency = LatencyWindow()
+
+    async def shared_emergency(to_number: str):
+        started = time.perf_counter()
+        await dispatcher.send("+100", to_number, replies["en"], critical=True)
+        shared_latency.add(time.perf_counter() - started)
+
+    backlog = [asyncio.create_task(dispatcher.send("+100", f"+91{i:06d}", "normal reply"))
+               for i in range(normal_messages)]
+    shared = []
+    start = time.perf_counter()
+    for i in range(emergencies):
+        await asyncio.sleep(0.02)
+        if use_lane:
+            lane.submit("+100", f"+99{i:06d}", "en")
+        else:
+            shared.append(asyncio.create_task(shared_emergency(f"+99{i:06d}")))
+    await asyncio.gather(*shared)
+    await lane.stop()
+    backlog_pending = dispatcher.pending
+    await asyncio.gather(*backlog)
+    elapsed = time.perf_counter() - start
+    await dispatcher.close()
+    await sender.close()
+
+    latency = (lane.latency if use_lane else shared_latency).summary()
+    label = "emergency lane" if use_lane else "shared queue"
+    print(f"{label:>15} | emergency p50 {latency['p50'] * 1000:>7.1f} ms | p99 {latency['p99'] * 1000:>7.1f} ms | "
+          f"max {latency['max'] * 1000:>7.1f} ms | {backlog_pending:>5} normal still queued | {elapsed:>5.1f} s total")
+
+
+def main():
+    normal_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    emergencies = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    for use_lane in (False, True):
+        asyncio.run(_run(normal_messages, emergencies, use_lane))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+How much traffic the local intent router answers without Gemini.
+
+Routes every message in a labelled corpus (benchmarks/data/router_corpus.jsonl:
+profile statements, bare topics and ordinary questions) and reports the share
+of each route, accuracy against the labels and the router's own CPU time.
+Then replays the corpus through main._process_turn on the load-test fakes,
+once with the router disabled and once enabled, one user per message, and
+compares Gemini calls and reply latency with `--gemini-latency` per call.
+
+Usage:
+    python -m benchmarks.bench_intent_router [--repeat 200] [--gemini-latency 0.8]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from benchmarks.load_pipeline import install_fakes, percentiles
+from benchmarks.load_pipeline import parse_args as parse_load_args
+from services.gemini_service import GeminiService
+
+ROUTER_CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "router_corpus.jsonl")
+
+
+def load_router_corpus(path: str = ROUTER_CORPUS_PATH) -> List[Dict[str, str]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _classify(router: Any, corpus: List[Dict[str, str]], repeat: int) -> Dict[str, Any]:
+    routes = Counter()
+    wrong = []
+    for row in corpus:
+        routed = router.route(row["message"])
+        routes[routed.route] += 1
+        if routed.route != row["route"]:
+            wrong.append(f"{row['message']!r}: {routed.route}, expected {row['route']}")
+    timings = []
+    for _ in range(repeat):
+        for row in corpus:
+            started = time.perf_counter()
+            router.route(row["message"])
+            timings.append(time.perf_counter() - started)
+    return {"routes": routes, "wrong": wrong, "latency": percentiles(timings)}
+
+
+async def _replay(app_module: Any, corpus: List[Dict[str, str]], options: argparse.Namespace,
+                  enabled: bool) -> Dict[str, Any]:
+    load_options = parse_load_args([
+        "--gemini-latency", str(options.gemini_latency), "--gemini-jitter", "0", "--gemini-chunk-latency", "0",
+        "--supabase-latency", str(options.supabase_latency), "--twilio-latency", "0",
+    ])
+    with tempfile.TemporaryDirectory() as workdir:
+        # A fresh service for each run, so neither starts with the other's cached replies or concurrency limit
+        app_module.gemini_service = GeminiService(knowledge_base=app_module.gsheets_service)
+        fakes = install_fakes(app_module, load_options, workdir)
+        await app_module.gsheets_service.refresh()
+        app_module.settings.INTENT_ROUTER_ENABLED = enabled
+
+        async def turn(index: int, message: str) -> float:
+            started = time.perf_counter()
+            await app_module._process_turn(f"+9197{index:08d}", message)
+            return time.perf_counter() - started
+
+        latencies = await asyncio.gather(*(turn(i, row["message"]) for i, row in enumerate(corpus)))
+        while app_module.notification_service.dispatcher.pending:
+            await asyncio.sleep(0.01)
+    return {"gemini_calls": len(fakes["gemini"].prompts), "latency": percentiles(latencies),
+            "mean": sum(latencies) / len(latencies)}
+
+
+async def _main(options: argparse.Namespace) -> None:
+    import main as app_module
+
+    corpus = load_router_corpus(options.corpus)
+    before = await _replay(app_module, corpus, options, enabled=False)
+    after = await _replay(app_module, corpus, options, enabled=True)
+    result = _classify(app_module.intent_router, corpus, options.repeat)
+
+    print(f"{len(corpus)} labelled messages")
+    for route, count in sorted(result["routes"].items()):
+        print(f"{route:>13} | {count:>3} ({count / len(corpus):.0%})")
+    local = len(corpus) - result["routes"]["gemini"]
+    print(f"answered locally: {local / len(corpus):.0%} | accuracy {1 - len(result['wrong']) / len(corpus):.0%}")
+    for line in result["wrong"]:
+        print(f"  misrouted {line}")
+    latency = result["latency"]
+    print(f"router CPU: p50 {latency['p50'] * 1e6:.1f} us | p99 {latency['p99'] * 1e6:.1f} us")
+    for name, run in (("before", before), ("after", after)):
+        print(f"{name:>6} | {run['gemini_calls']:>3} Gemini calls | reply mean {run['mean'] * 1000:>6.0f} ms | "
+              f"p50 {run['latency']['p50'] * 1000:>6.0f} ms | p99 {run['latency']['p99'] * 1000:>6.0f} ms")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", default=ROUTER_CORPUS_PATH)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--gemini-latency", type=float, default=0.8)
+    parser.add_argument("--supabase-latency", type=float, default=0.01)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.disable(logging.WARNING)
+    asyncio.run(_main(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
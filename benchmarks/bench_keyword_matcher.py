@@ -0,0 +1,57 @@
+"""
+Microbenchmark for the critical keyword check.
+
+Compares the compiled KeywordMatcher against the previous
+`any(keyword in message.lower() for keyword in keywords)` scan while the
+keyword list grows from 10 to 10,000 entries.
+
+Usage:
+    python -m benchmarks.bench_keyword_matcher
+"""
+import random
+import string
+import timeit
+
+from services.keyword_matcher import KeywordMatcher
+
+MESSAGES = [
+    "What are the symptoms of dengue fever and how long does it last?",
+    "My mother has high blood pressure, what food should she avoid?",
+    "mujhe kal se bukhar hai aur sir dard ho raha hai",
+    "Is it safe to drink water from the village well during monsoon?",
+    "How much insulin should a diabetic person take before meals?",
+]
+
+
+def _random_keywords(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < count:
+        words.add(" ".join(
+            "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9)))
+            for _ in range(rng.randint(1, 2))
+        ))
+    return sorted(words)
+
+
+def _per_message_us(func, number: int) -> float:
+    seconds = timeit.timeit(lambda: [func(m) for m in MESSAGES], number=number)
+    return seconds / (number * len(MESSAGES)) * 1e6
+
+
+def main():
+    print(f"{'keywords':>9} | {'any() scan (us/msg)':>20} | {'automaton (us/msg)':>19}")
+    print("-" * 56)
+    for count in (10, 100, 1_000, 10_000):
+        keywords = _random_keywords(count)
+        matcher = KeywordMatcher((k, k, "en") for k in keywords)
+
+        def naive(message, keywords=keywords):
+            return any(keyword in message.lower() for keyword in keywords)
+
+        number = max(10, 20_000 // count)
+        print(f"{count:>9} | {_per_message_us(naive, number):>20.2f} | {_per_message_us(matcher.search, 200):>19.2f}")
+
+
+if __name__ == "__main__":
+    main()
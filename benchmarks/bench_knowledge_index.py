@@ -0,0 +1,63 @@
+"""
+Benchmark for knowledge-base lookups.
+
+Compares the original linear, lowercase-per-call scan of GSheetsService.records
+with KnowledgeIndex exact and trigram lookups on a synthetic sheet.
+
+Usage:
+    python -m benchmarks.bench_knowledge_index [rows]
+"""
+import random
+import string
+import sys
+import time
+
+from services.knowledge_index import KnowledgeIndex
+
+
+def _linear_lookup(records, topic):
+    # The lookup GSheetsService.get_health_info used before the index existed
+    search_topic = topic.lower()
+    for record in records:
+        if 'topic' in record and isinstance(record['topic'], str) and record['topic'].lower() == search_topic:
+            return record
+    return None
+
+
+def _synthetic_records(rows: int, seed: int = 11):
+    rng = random.Random(seed)
+    records = [{"topic": "Dengue", "advice": "Drink fluids"}]
+    while len(records) < rows:
+        words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))) for _ in range(rng.randint(1, 3))]
+        records.append({"topic": " ".join(words).title(), "advice": "..."})
+    rng.shuffle(records)
+    return records
+
+
+def _ms_per_call(func, queries, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            func(query)
+    return (time.perf_counter() - start) / (repeat * len(queries)) * 1e3
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    records = _synthetic_records(rows)
+
+    start = time.perf_counter()
+    index = KnowledgeIndex(records)
+    build_ms = (time.perf_counter() - start) * 1e3
+
+    topics = [records[i]["topic"] for i in range(0, rows, max(1, rows // 50))]
+    typos = ["dengu fever", "dengeu", "malarya", "heat strok"]
+
+    print(f"rows: {rows}, index build: {build_ms:.1f} ms")
+    print(f"linear scan (exact):   {_ms_per_call(lambda q: _linear_lookup(records, q), topics, 1):.3f} ms/lookup")
+    print(f"index.get (exact):     {_ms_per_call(index.get, topics, 200):.4f} ms/lookup")
+    print(f"index.search (top-5):  {_ms_per_call(index.search, typos, 20):.3f} ms/lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Per-turn cost of turning a cached user profile into its prompt inputs.
+
+10,000 users each take turns. "before" is the previous path: the cache held
+a User, get_user dumped it to a dict, the turn validated it back into a
+User, then built the prompt fragment and response-cache segment. "after"
+is the current path: the cache holds a CachedProfile with both precomputed,
+which the turn uses as is. CPU time is measured with time.process_time and
+the memory allocated during a turn as tracemalloc's peak (a separate pass,
+since tracing slows it down).
+
+Usage:
+    python -m benchmarks.bench_profile_cache [--users 10000] [--turns 5]
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, List, Optional
+
+from models.schemas import User
+from services.profile import CachedProfile, profile_fragment, profile_segment
+
+CONDITIONS = [None, "asthma", "thyroid", "anemia, pregnant"]
+
+
+def _users(count: int, seed: int = 3) -> List[User]:
+    rng = random.Random(seed)
+    return [
+        User(
+            phone_number=f"+9198{i:08d}",
+            language=rng.choice(["English", "Hindi", "Tamil"]),
+            age=rng.choice([None, rng.randint(18, 90)]),
+            has_diabetes=rng.random() < 0.2,
+            has_hypertension=rng.random() < 0.3,
+            other_conditions=rng.choice(CONDITIONS),
+        )
+        for i in range(count)
+    ]
+
+
+def _measure(turn: Callable[[str], object], phones: List[str], turns: int) -> dict:
+    started = time.process_time()
+    for _ in range(turns):
+        for phone in phones:
+            turn(phone)
+    cpu = time.process_time() - started
+
+    # Transient allocations are freed by the end of the turn, so measure each turn's peak
+    tracemalloc.start()
+    allocated = 0
+    for phone in phones:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        turn(phone)
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return {
+        "us_per_turn": cpu / (turns * len(phones)) * 1e6,
+        "bytes_per_turn": allocated / len(phones),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--turns", type=int, default=5)
+    options = parser.parse_args(argv)
+
+    users = _users(options.users)
+    phones = [user.phone_number for user in users]
+    user_cache = {user.phone_number: user for user in users}
+    profile_cache = {user.phone_number: CachedProfile.from_user(user) for user in users}
+    outputs = []
+
+    def before(phone: str):
+        # get_user's model_dump, then User(**data) in the turn
+        user = User(**user_cache[phone].model_dump())
+        outputs.append((profile_fragment(user), profile_segment(user)))
+        outputs.clear()
+
+    def after(phone: str):
+        profile = profile_cache[phone]
+        outputs.append((profile_fragment(profile), profile_segment(profile)))
+        outputs.clear()
+
+    results = {"before": _measure(before, phones, options.turns), "after": _measure(after, phones, options.turns)}
+    print(f"{options.users} users x {options.turns} turns")
+    for name, result in results.items():
+        print(f"{name:>6} | {result['us_per_turn']:>7.2f} us CPU/turn | "
+              f"{result['bytes_per_turn']:>7.0f} peak bytes allocated/turn")
+    print(f"speedup {results['before']['us_per_turn'] / results['after']['us_per_turn']:.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,88 @@
+"""
+Benchmark of prompt sizes before and after the token-budgeted PromptBuilder.
+
+Replays the recorded conversations in benchmarks/data/conversations.jsonl turn
+by turn and compares the estimated input tokens of the original prompt
+(system instruction resent as text, last 5 messages, indented f-string) with
+the prompt built by PromptBuilder (system instruction set on the model, newest
+turns within budget, older turns in a rolling summary).
+
+Usage:
+    python -m benchmarks.bench_prompt_size [max_tokens]
+"""
+import json
+import os
+import sys
+import time
+
+from core.text import estimate_tokens
+from services.gemini_service import SYSTEM_INSTRUCTION
+from services.prompt_builder import PromptBuilder
+
+CONVERSATIONS = os.path.join(os.path.dirname(__file__), "data", "conversations.jsonl")
+
+
+def legacy_prompt(user_message: str, profile_details: str, chat_history) -> str:
+    # The prompt GeminiService.get_ai_response built before PromptBuilder existed
+    history_text = "\n".join([f"{msg['sender'].capitalize()}: {msg['message_text']}" for msg in chat_history])
+    return f"""
+            **System Instruction:**
+            {SYSTEM_INSTRUCTION}
+
+            ---
+
+            **User's Health Profile:**
+            {profile_details}
+
+            ---
+
+            **Recent Conversation History:**
+            {history_text}
+
+            ---
+
+            **Current User Message:**
+            {user_message}
+            """
+
+
+def _profile_details(profile) -> str:
+    details = f"Language: {profile.get('language', 'English')}, Age: {profile.get('age') or 'Not provided'}"
+    if profile.get("has_diabetes"):
+        details += ", Condition: Diabetes"
+    if profile.get("has_hypertension"):
+        details += ", Condition: Hypertension"
+    return details
+
+
+def main():
+    max_tokens = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    builder = PromptBuilder(max_tokens=max_tokens, summary_max_tokens=max_tokens // 5)
+    system_tokens = estimate_tokens(SYSTEM_INSTRUCTION)
+    before = after = turns = 0
+    build_seconds = 0.0
+
+    with open(CONVERSATIONS, encoding="utf-8") as f:
+        conversations = [json.loads(line) for line in f]
+
+    for conversation in conversations:
+        profile = _profile_details(conversation["profile"])
+        history = []
+        for question, answer in conversation["turns"]:
+            before += estimate_tokens(legacy_prompt(question, profile, history[-5:]))
+            start = time.perf_counter()
+            prompt = builder.build(question, profile, history[-20:], conversation_id=conversation["phone_number"])
+            build_seconds += time.perf_counter() - start
+            after += estimate_tokens(prompt)
+            turns += 1
+            history += [{"sender": "user", "message_text": question}, {"sender": "bot", "message_text": answer}]
+
+    print(f"turns replayed:              {turns}")
+    print(f"before (tokens/turn):        {before / turns:.0f}  (system instruction {system_tokens} resent each turn)")
+    print(f"after  (tokens/turn):        {after / turns:.0f}  (budget {max_tokens})")
+    print(f"input token reduction:       {100 * (1 - after / before):.0f}%")
+    print(f"prompt build time:           {build_seconds / turns * 1e6:.0f} us/turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark for knowledge-base retrieval.
+
+Builds a KnowledgeRetriever over a synthetic sheet and reports the build time
+and the per-query latency of the top-k cosine search.
+
+Usage:
+    python -m benchmarks.bench_retrieval [rows]
+"""
+import random
+import sys
+import time
+
+from services.retrieval import KnowledgeRetriever
+
+WORDS = ("fever headache cough cold rash vomiting diarrhoea pain joint chest breath water food mosquito "
+         "child pregnant elderly diet sugar pressure heart skin eye ear tooth infection vaccine clinic "
+         "medicine rest fluids hygiene monsoon heat dengue malaria typhoid cholera jaundice asthma").split()
+
+QUERIES = [
+    "my child has fever and rash since two days",
+    "how do I prevent dengue during monsoon",
+    "what should a pregnant woman eat",
+    "sugar level high what diet",
+]
+
+
+def _synthetic_records(rows: int, seed: int = 3):
+    rng = random.Random(seed)
+    return [
+        {
+            "topic": f"{rng.choice(WORDS).title()} {i}",
+            "symptoms": " ".join(rng.choices(WORDS, k=12)),
+            "advice": " ".join(rng.choices(WORDS, k=25)),
+        }
+        for i in range(rows)
+    ]
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    records = _synthetic_records(rows)
+
+    start = time.perf_counter()
+    retriever = KnowledgeRetriever(records)
+    print(f"rows: {rows}, build: {(time.perf_counter() - start) * 1e3:.0f} ms")
+
+    repeat = 50
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in QUERIES:
+            retriever.search(query, k=3)
+    per_query = (time.perf_counter() - start) / (repeat * len(QUERIES)) * 1e3
+    print(f"search (top-3): {per_query:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Throughput of the message pipeline with 1, 2, 4... worker processes.
+
+Each process runs the real app (worker pool, Gemini, database and Twilio
+services) against the same fakes as benchmarks/load_pipeline.py. All of them
+share one SQLite job queue and one knowledge-base snapshot file in a scratch
+directory. Once every process is ready, a batch of message jobs is queued and
+the time until the queue is drained is measured. The report also shows how
+many processes downloaded the sheet: with a shared snapshot, that should be
+one per run.
+
+Throughput can only scale with the number of processes up to the number of
+CPU cores, which is printed with the results.
+
+Usage:
+    python -m benchmarks.bench_scale_out [--processes 1 2 4] [--jobs 400] [--gemini-latency 0.3]
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.load_pipeline import install_fakes, load_corpus
+from benchmarks.load_pipeline import parse_args as parse_load_args
+from services.job_queue import SQLiteJobQueue
+
+
+def _serve(load_argv: List[str], workdir: str, ready: Any, stop: Any, results: Any) -> None:
+    # Runs in a worker process until `stop` is set
+    logging.disable(logging.ERROR)
+    import main as app_module
+
+    options = parse_load_args(load_argv)
+    # Twilio's per-number limit would cap every run at the same rate; the fake has none
+    app_module.settings.SMS_SENDER_RATE_PER_SECOND = app_module.settings.SMS_SENDER_BURST = 10_000
+    fakes = install_fakes(app_module, options, workdir)
+    app_module.worker_pool.poll_interval = 0.05
+
+    async def run():
+        async with app_module.lifespan(app_module.app):
+            await app_module.dependencies.wait_ready()
+            ready.put(os.getpid())
+            while not stop.is_set():
+                await asyncio.sleep(0.05)
+        app_module.job_queue.close()
+
+    asyncio.run(run())
+    results.put({
+        "gemini_calls": len(fakes["gemini"].prompts),
+        "sheet_downloads": app_module.gsheets_service.backend.fetch_count,
+    })
+
+
+async def _enqueue(job_queue: SQLiteJobQueue, jobs: int, users: int) -> None:
+    corpus = load_corpus()
+    for i in range(jobs):
+        user = i % users
+        conversation = corpus[user % len(corpus)]
+        await job_queue.enqueue("message", key=f"+9198{user:08d}", payload={
+            "user_phone": f"+9198{user:08d}",
+            "user_messages": [conversation[(i // users) % len(conversation)]],
+        })
+
+
+def run(processes: int, options: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Drains `options.jobs` message jobs with `processes` worker processes and returns the result.
+    """
+    load_argv = ["--gemini-latency", str(options.gemini_latency), "--gemini-jitter", "0",
+                 "--gemini-chunk-latency", "0", "--supabase-latency", str(options.supabase_latency),
+                 "--twilio-latency", "0"]
+    context = multiprocessing.get_context("fork")
+    with tempfile.TemporaryDirectory() as workdir:
+        ready, results, stop = context.Queue(), context.Queue(), context.Event()
+        workers = [context.Process(target=_serve, args=(load_argv, workdir, ready, stop, results))
+                   for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        for _ in workers:
+            ready.get(timeout=120)
+
+        job_queue = SQLiteJobQueue(os.path.join(workdir, "jobs.sqlite3"))
+        started = time.perf_counter()
+        asyncio.run(_enqueue(job_queue, options.jobs, options.users))
+        while True:
+            stats = asyncio.run(job_queue.stats())
+            if not stats.get("pending") and not stats.get("running"):
+                break
+            time.sleep(0.02)
+        elapsed = time.perf_counter() - started
+        job_queue.close()
+
+        stop.set()
+        reports = []
+        for _ in workers:
+            try:
+                reports.append(results.get(timeout=60))
+            except queue.Empty:
+                break
+        for worker in workers:
+            worker.join(timeout=10)
+
+    return {
+        "processes": processes,
+        "elapsed_seconds": elapsed,
+        "jobs_per_sec": options.jobs / elapsed,
+        "gemini_calls": sum(report["gemini_calls"] for report in reports),
+        "sheet_downloads": sum(report["sheet_downloads"] for report in reports),
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--jobs", type=int, default=400)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--gemini-latency", type=float, default=0.3)
+    parser.add_argument("--supabase-latency", type=float, default=0.01)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    options = parse_args(argv)
+    print(f"{os.cpu_count()} CPU cores | {options.jobs} jobs for {options.users} users | "
+          f"Gemini latency {options.gemini_latency * 1000:.0f} ms")
+    baseline = None
+    for processes in options.processes:
+        result = run(processes, options)
+        baseline = baseline or result["jobs_per_sec"]
+        print(f"{processes:>2} processes | {result['jobs_per_sec']:>7.1f} jobs/s | "
+              f"speedup {result['jobs_per_sec'] / baseline:>4.2f}x | {result['gemini_calls']} Gemini calls | "
+              f"{result['sheet_downloads']} sheet download(s)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,80 @@
+"""
+Throughput benchmark for outgoing messages against a local fake Twilio server.
+
+Serves FakeTwilioServer with uvicorn on localhost and sends the same batch of
+messages twice: once the old way (a blocking HTTP call per message in the
+default thread pool, new connection each time) and once through the pooled
+async SmsDispatcher. Reports messages per second.
+
+Usage:
+    python -m benchmarks.bench_sms_dispatch [messages] [server_latency_seconds]
+"""
+import asyncio
+import logging
+import sys
+import time
+
+import httpx
+import uvicorn
+
+from benchmarks.fakes import FakeTwilioServer
+from services.sms_dispatcher import SmsDispatcher, TwilioHttpSender
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+HOST, PORT = "127.0.0.1", 8765
+ACCOUNT_SID = "AC00000000000000000000000000000000"
+
+
+def _send_blocking(index: int) -> None:
+    httpx.post(
+        f"http://{HOST}:{PORT}/2010-04-01/Accounts/{ACCOUNT_SID}/Messages.json",
+        data={"From": "+10000000000", "To": f"+9190000{index:05d}", "Body": "hello"},
+        auth=(ACCOUNT_SID, "token"),
+    ).raise_for_status()
+
+
+async def _thread_per_message(messages: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(asyncio.to_thread(_send_blocking, i) for i in range(messages)))
+    return time.perf_counter() - start
+
+
+async def _dispatcher(messages: int) -> float:
+    sender = TwilioHttpSender(ACCOUNT_SID, "token", base_url=f"http://{HOST}:{PORT}", max_connections=100)
+    # Several sender numbers, each with its own rate limit
+    dispatcher = SmsDispatcher(sender, rate_per_second=10_000, burst=1_000, concurrency=100)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        dispatcher.send(f"+1000000000{i % 4}", f"+9190000{i:05d}", "hello") for i in range(messages)
+    ))
+    elapsed = time.perf_counter() - start
+    await dispatcher.close()
+    await sender.close()
+    return elapsed
+
+
+async def _run(messages: int, latency: float):
+    fake = FakeTwilioServer(latency=latency)
+    server = uvicorn.Server(uvicorn.Config(fake, host=HOST, port=PORT, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    for label, run in (("thread/message", _thread_per_message), ("dispatcher", _dispatcher)):
+        elapsed = await run(messages)
+        print(f"{label:>15} | {messages:>6} messages | {elapsed:>6.2f} s | {messages / elapsed:>8.0f} msgs/s")
+
+    server.should_exit = True
+    await serving
+    print(f"server received {fake.requests} requests, accepted {len(fake.messages)} messages")
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    asyncio.run(_run(messages, latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Cold-start time of the app: importing main, serving the first request and
+becoming ready, each measured in a fresh interpreter.
+
+"eager" imports google.generativeai, gspread and supabase up front, as main
+used to do at import time; "lazy" is the current startup, where they are
+imported when the dependencies start in the background. Dummy credentials are
+used, so nothing is contacted except the Google Sheets refresh (which fails
+without affecting readiness).
+
+Usage:
+    python -m benchmarks.bench_startup [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+if sys.argv[1] == "eager":
+    import google.generativeai, gspread, supabase
+import main
+imported = time.perf_counter()
+
+async def run():
+    import httpx
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            (await client.get("/health/live")).raise_for_status()
+            first_request = time.perf_counter()
+            await asyncio.wait_for(main.dependencies.wait_ready(), 60)
+            ready = time.perf_counter()
+            report = (await client.get("/health/ready")).json()
+    return first_request, ready, report
+
+first_request, ready, report = asyncio.run(run())
+print(json.dumps({
+    "import": imported - started,
+    "first_request": first_request - started,
+    "ready": ready - started,
+    "dependencies": {name: dep["startup_seconds"] for name, dep in report["dependencies"].items()},
+}))
+"""
+
+_ENV = {
+    "SUPABASE_URL": "https://bench.supabase.co",
+    "SUPABASE_KEY": "bench",
+    "GEMINI_API_KEY": "bench",
+    "TWILIO_ACCOUNT_SID": "ACbench",
+    "TWILIO_AUTH_TOKEN": "bench",
+    "TWILIO_PHONE_NUMBER": "+10000000000",
+    "TWILIO_WHATSAPP_NUMBER": "+10000000001",
+    "GOOGLE_APPLICATION_CREDENTIALS_JSON": "{}",
+    "JOB_QUEUE_PATH": os.path.join("var", "bench_startup_jobs.sqlite3"),
+}
+
+
+def _probe(mode: str) -> dict:
+    env = dict(os.environ, **_ENV)
+    output = subprocess.run([sys.executable, "-c", _PROBE, mode], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for mode in ("eager", "lazy"):
+        results = [_probe(mode) for _ in range(runs)]
+        median = {key: statistics.median(result[key] for result in results) for key in ("import", "first_request", "ready")}
+        print(f"{mode:>5} | import {median['import']:.2f}s | first request {median['first_request']:.2f}s"
+              f" | ready {median['ready']:.2f}s  (median of {runs})")
+        for name in results[0]["dependencies"]:
+            seconds = [result["dependencies"][name] for result in results if result["dependencies"][name] is not None]
+            if seconds:
+                print(f"      {name:<15} started in {statistics.median(seconds):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
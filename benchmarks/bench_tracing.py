@@ -0,0 +1,34 @@
+"""
+Overhead of the tracing layer per span at different sample rates.
+
+Usage:
+    python -m benchmarks.bench_tracing [spans]
+"""
+import sys
+import time
+
+from services.metrics import MetricsRegistry
+from services.tracing import Tracer
+
+
+def _run(sample_rate: float, spans: int) -> float:
+    tracer = Tracer(MetricsRegistry(), sample_rate=sample_rate, exporter=None)
+    start = time.perf_counter()
+    for _ in range(spans // 4):
+        with tracer.span("job.message"):
+            with tracer.span("db.get_user"):
+                pass
+            with tracer.span("reply") as span:
+                span.set_attribute("characters", 120)
+            tracer.record("gemini.generate", 0.5)
+    return (time.perf_counter() - start) / spans
+
+
+def main():
+    spans = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    for sample_rate in (0.0, 0.01, 0.1, 1.0):
+        print(f"sample rate {sample_rate:>5.2f} | {_run(sample_rate, spans) * 1e6:>6.2f} µs per span")
+
+
+if __name__ == "__main__":
+    main()
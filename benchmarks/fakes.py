@@ -0,0 +1,395 @@
+"""
+In-process stand-ins for the external services, for tests and benchmarks.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+
+class FakeResponse:
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+
+
+class _FakeQuery:
+    """
+    Mimics the chained query builder of the Supabase client:
+    client.table('t').select('*').eq('col', v).order('col', desc=True).limit(n).execute()
+    """
+    def __init__(self, client: "FakeSupabaseClient", table: str):
+        self._client = client
+        self._table = table
+        self._operation = "select"
+        self._payload: List[Dict[str, Any]] = []
+        self._filters: List[Any] = []
+        self._orders: List[Any] = []
+        self._limit: Optional[int] = None
+
+    def select(self, *columns: str) -> "_FakeQuery":
+        self._operation = "select"
+        return self
+
+    def insert(self, data: Any) -> "_FakeQuery":
+        self._operation = "insert"
+        self._payload = data if isinstance(data, list) else [data]
+        return self
+
+    def upsert(self, data: Any, on_conflict: str = "phone_number") -> "_FakeQuery":
+        self._operation = "upsert"
+        self._payload = data if isinstance(data, list) else [data]
+        self._conflict_key = on_conflict
+        return self
+
+    def delete(self) -> "_FakeQuery":
+        self._operation = "delete"
+        return self
+
+    def eq(self, column: str, value: Any) -> "_FakeQuery":
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> "_FakeQuery":
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gt(self, column: str, value: Any) -> "_FakeQuery":
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def lt(self, column: str, value: Any) -> "_FakeQuery":
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "_FakeQuery":
+        # Chained calls sort by each column in turn, like ORDER BY a, b
+        self._orders.append((column, desc))
+        return self
+
+    def limit(self, count: int) -> "_FakeQuery":
+        self._limit = count
+        return self
+
+    async def execute(self) -> FakeResponse:
+        return await self._client._execute(self)
+
+    def _run(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self._operation == "insert":
+            return [self._client._insert_row(self._table, row) for row in self._payload]
+        if self._operation == "upsert":
+            return [self._upsert_row(rows, row) for row in self._payload]
+        if self._operation == "delete":
+            deleted = [row for row in rows if all(check(row) for check in self._filters)]
+            rows[:] = [row for row in rows if not all(check(row) for check in self._filters)]
+            return deleted
+        selected = [row for row in rows if all(check(row) for check in self._filters)]
+        for column, desc in reversed(self._orders):
+            selected.sort(key=lambda row: row.get(column), reverse=desc)
+        if self._limit is not None:
+            selected = selected[:self._limit]
+        return [dict(row) for row in selected]
+
+    def _upsert_row(self, rows: List[Dict[str, Any]], row: Dict[str, Any]) -> Dict[str, Any]:
+        for existing in rows:
+            if existing.get(self._conflict_key) == row.get(self._conflict_key):
+                existing.update(row)
+                return dict(existing)
+        return self._client._insert_row(self._table, row)
+
+
+class _FakeRpc:
+    def __init__(self, client: "FakeSupabaseClient", name: str, params: Dict[str, Any]):
+        self._client = client
+        self._table = "rpc"
+        self._operation = name
+        self._params = params
+
+    async def execute(self) -> FakeResponse:
+        return await self._client._execute(self)
+
+    def _run(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return self._client.functions[self._operation](**self._params)
+
+
+class FakeSupabaseClient:
+    """
+    An in-memory Supabase client with optional per-request latency.
+    Every execute() counts as one database request, per table and operation
+    (rpc calls as ("rpc", name)). Set `error` to make requests fail.
+    The database functions of migrations/ are implemented in `functions`.
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.requests: Counter = Counter()
+        self.error: Optional[Exception] = None
+        self._sequence = 0
+        self._epoch = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        self.functions = {"insert_chat_messages": self._insert_chat_messages}
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.requests.values())
+
+    def table(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> _FakeRpc:
+        return _FakeRpc(self, name, params or {})
+
+    def _insert_chat_messages(self, messages: List[Dict[str, Any]], window_size: int = 20) -> List[Dict[str, Any]]:
+        # Same as the SQL function: insert, then append to each user's chat_recent window
+        recent = {row["phone_number"]: row for row in self.tables["chat_recent"]}
+        for message in messages:
+            stored = self._insert_row("chat_history", message)
+            entry = {key: stored[key] for key in ("id", "phone_number", "sender", "message_text", "created_at")}
+            row = recent.get(stored["phone_number"])
+            if row is None:
+                row = recent[stored["phone_number"]] = {"phone_number": stored["phone_number"], "messages": []}
+                self.tables["chat_recent"].append(row)
+            row["messages"] = (row["messages"] + [entry])[-window_size:]
+            row["updated_at"] = stored["created_at"]
+        return []
+
+    def _insert_row(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        self._sequence += 1
+        stored = {"id": self._sequence, **row}
+        # Strictly increasing timestamps keep ordering by created_at deterministic
+        stored.setdefault("created_at", (self._epoch + timedelta(microseconds=self._sequence)).isoformat())
+        self.tables[table].append(stored)
+        return dict(stored)
+
+    async def _execute(self, query: _FakeQuery) -> FakeResponse:
+        self.requests[(query._table, query._operation)] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error:
+            raise self.error
+        return FakeResponse(query._run(self.tables[query._table]))
+
+
+class FakeUsageMetadata:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeGeminiResponse:
+    def __init__(self, text: str, usage_metadata: Optional[FakeUsageMetadata] = None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeGeminiStream:
+    """
+    An async iterator of response chunks, like a streamed Gemini response.
+    """
+    def __init__(self, chunks: List[str], chunk_latency: float, error: Optional[Exception] = None,
+                 usage_metadata: Optional[FakeUsageMetadata] = None):
+        self._chunks = chunks
+        self._chunk_latency = chunk_latency
+        self._error = error
+        self._usage_metadata = usage_metadata
+
+    async def __aiter__(self):
+        for number, chunk in enumerate(self._chunks, start=1):
+            if self._chunk_latency:
+                await asyncio.sleep(self._chunk_latency)
+            yield FakeGeminiResponse(chunk, self._usage_metadata if number == len(self._chunks) else None)
+        if self._error:
+            raise self._error
+
+
+class FakeGeminiModel:
+    """
+    Stands in for google.generativeai.GenerativeModel.
+    Replies after `latency` seconds (plus up to `jitter`) and records every prompt.
+    With stream=True the reply arrives in `chunk_size`-character chunks,
+    `chunk_latency` seconds apart; `stream_error` is raised after the last chunk.
+    With probability `spike_probability` a call takes `spike_latency` instead,
+    like an overloaded API; `max_in_flight` records the most concurrent calls.
+    """
+    def __init__(self, reply: str = "Please drink plenty of fluids and consult a doctor.",
+                 latency: float = 0.0, jitter: float = 0.0, chunk_size: int = 40, chunk_latency: float = 0.0,
+                 spike_probability: float = 0.0, spike_latency: float = 0.0):
+        self.reply = reply
+        self.latency = latency
+        self.jitter = jitter
+        self.spike_probability = spike_probability
+        self.spike_latency = spike_latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.stream_error: Optional[Exception] = None
+        self.prompts: List[Any] = []
+        self.error: Optional[Exception] = None
+
+    async def generate_content_async(self, prompt: Any, stream: bool = False, **kwargs: Any) -> Any:
+        self.prompts.append(prompt)
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if self.spike_probability and random.random() < self.spike_probability:
+            delay = self.spike_latency
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+        if self.error:
+            raise self.error
+        # Roughly four characters per token, like the real tokenizer on English text
+        usage = FakeUsageMetadata(len(str(prompt)) // 4, len(self.reply) // 4)
+        if stream:
+            chunks = [self.reply[i:i + self.chunk_size] for i in range(0, len(self.reply), self.chunk_size)]
+            return FakeGeminiStream(chunks, self.chunk_latency, self.stream_error, usage)
+        return FakeGeminiResponse(self.reply, usage)
+
+
+class FakeTwilioServer:
+    """
+    A minimal Twilio Messages API as an ASGI app.
+
+    Use it in-process through httpx.ASGITransport, or serve it with uvicorn
+    (see benchmarks/bench_sms_dispatch.py) and point TWILIO_API_BASE_URL at it.
+    Each sender number may send `max_per_second` messages per second; more are
+    answered with 429. Statuses queued in `failures` are returned first.
+    """
+    def __init__(self, latency: float = 0.0, max_per_second: Optional[float] = None):
+        self.latency = latency
+        self.max_per_second = max_per_second
+        self.messages: List[Dict[str, str]] = []
+        self.failures: List[int] = []
+        self.requests = 0
+        self.throttled = 0
+        self._windows: Dict[str, List[float]] = defaultdict(list)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            event = await receive()
+            body += event.get("body", b"")
+            if not event.get("more_body"):
+                break
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        form = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        status, payload, headers = self._respond(scope, form)
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json")] + headers,
+        })
+        await send({"type": "http.response.body", "body": json.dumps(payload).encode()})
+
+    def _respond(self, scope, form):
+        if scope["method"] != "POST" or not scope["path"].endswith("/Messages.json"):
+            return 404, {"message": "Not found"}, []
+        if self.failures:
+            return self.failures.pop(0), {"message": "Injected failure"}, []
+        if self.max_per_second:
+            now = time.monotonic()
+            window = self._windows[form.get("From", "")]
+            while window and window[0] <= now - 1.0:
+                window.pop(0)
+            if len(window) >= self.max_per_second:
+                self.throttled += 1
+                return 429, {"code": 20429, "message": "Too Many Requests"}, [(b"retry-after", b"1")]
+            window.append(now)
+        sid = f"SM{len(self.messages):032d}"
+        self.messages.append({"sid": sid, "from": form.get("From", ""), "to": form.get("To", ""),
+                              "body": form.get("Body", ""), "accepted_at": time.perf_counter()})
+        return 201, {"sid": sid, "status": "queued"}, []
+
+
+class FakeRedis:
+    """
+    Mimics the subset of redis.asyncio.Redis (decode_responses=True) used by
+    RedisSharedState: GET, SET with NX/PX, DEL, INCR, PEXPIRE, PING and EVAL
+    of the lock release script. Every command counts as one round trip.
+    """
+    def __init__(self, latency: float = 0.0, clock: Any = time.monotonic):
+        self.latency = latency
+        self._clock = clock
+        self._values: Dict[str, Any] = {}
+        self._expires: Dict[str, float] = {}
+        self.commands = 0
+
+    async def _round_trip(self) -> None:
+        self.commands += 1
+        await asyncio.sleep(self.latency)
+
+    def _live(self, name: str) -> Any:
+        expires_at = self._expires.get(name)
+        if expires_at is not None and expires_at <= self._clock():
+            self._values.pop(name, None)
+            self._expires.pop(name, None)
+        return self._values.get(name)
+
+    async def ping(self) -> bool:
+        await self._round_trip()
+        return True
+
+    async def get(self, name: str) -> Optional[str]:
+        await self._round_trip()
+        value = self._live(name)
+        return None if value is None else str(value)
+
+    async def set(self, name: str, value: Any, px: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+        await self._round_trip()
+        if nx and self._live(name) is not None:
+            return None
+        self._values[name] = str(value)
+        self._expires.pop(name, None)
+        if px is not None:
+            self._expires[name] = self._clock() + px / 1000
+        return True
+
+    async def delete(self, *names: str) -> int:
+        await self._round_trip()
+        deleted = 0
+        for name in names:
+            if self._live(name) is not None:
+                deleted += 1
+            self._values.pop(name, None)
+            self._expires.pop(name, None)
+        return deleted
+
+    async def incr(self, name: str) -> int:
+        await self._round_trip()
+        value = int(self._live(name) or 0) + 1
+        self._values[name] = str(value)
+        return value
+
+    async def pexpire(self, name: str, milliseconds: int) -> bool:
+        await self._round_trip()
+        if self._live(name) is None:
+            return False
+        self._expires[name] = self._clock() + milliseconds / 1000
+        return True
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args: str) -> int:
+        from services.shared_state import RELEASE_LOCK_SCRIPT
+
+        await self._round_trip()
+        if script != RELEASE_LOCK_SCRIPT:
+            raise NotImplementedError("FakeRedis only runs the lock release script.")
+        name, token = keys_and_args
+        if self._live(name) == token:
+            self._values.pop(name, None)
+            self._expires.pop(name, None)
+            return 1
+        return 0
+
+    async def aclose(self) -> None:
+        pass
@@ -0,0 +1,56 @@
+"""
+Load test for chat_history writes against the in-process fake Supabase.
+
+Simulates many concurrent conversations, each saving a user message and a
+bot reply per turn, once with direct inserts and once with the write-behind
+BatchWriter, and reports database requests per turn.
+
+Usage:
+    python -m benchmarks.load_chat_writes [conversations] [turns]
+"""
+import asyncio
+import random
+import sys
+import time
+
+from benchmarks.fakes import FakeSupabaseClient
+from models.schemas import ChatMessage
+from services.database_service import DatabaseService
+
+
+async def _conversation(db_service: DatabaseService, phone: str, turns: int):
+    for turn in range(turns):
+        # Users do not all type at the same moment
+        await asyncio.sleep(random.uniform(0, 0.05))
+        await db_service.save_chat_message(ChatMessage(phone_number=phone, sender="user", message_text=f"question {turn}"))
+        await db_service.save_chat_message(ChatMessage(phone_number=phone, sender="bot", message_text=f"answer {turn}"))
+
+
+async def _run(conversations: int, turns: int, write_behind: bool):
+    client = FakeSupabaseClient(latency=0.02)
+    db_service = DatabaseService(client=client)
+    if write_behind:
+        await db_service.start()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_conversation(db_service, f"+9190000{i:05d}", turns) for i in range(conversations)))
+    await db_service.close()
+    elapsed = time.perf_counter() - start
+
+    inserts = client.requests[("chat_history", "insert")]
+    rows = len(client.tables["chat_history"])
+    total_turns = conversations * turns
+    label = "write-behind" if write_behind else "direct"
+    print(f"{label:>12} | {total_turns:>6} turns | {rows:>6} rows | {inserts:>6} inserts | "
+          f"{inserts / total_turns:>6.3f} requests/turn | {elapsed:>6.2f} s")
+
+
+def main():
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    for write_behind in (False, True):
+        asyncio.run(_run(conversations, turns, write_behind))
+
+
+if __name__ == "__main__":
+    main()
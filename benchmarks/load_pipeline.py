@@ -0,0 +1,345 @@
+"""
+End-to-end load test of the webhook and the background pipeline.
+
+Runs the real FastAPI app and worker pool in-process with fakes for Supabase,
+Gemini (configurable latency and jitter), Twilio and Google Sheets. A traffic
+generator replays SMS sessions from benchmarks/data/conversations.jsonl as
+Poisson arrivals; some users send bursts of two or three messages and a few
+messages contain critical keywords. Reports webhook and end-to-end
+throughput, p50/p95/p99 latency per pipeline stage, reply latency (webhook to
+first SMS accepted by Twilio) and peak memory.
+
+Regression mode compares the run with a saved baseline and exits with status
+1 if throughput, a p99 latency or memory got worse by more than the threshold.
+
+Usage:
+    python -m benchmarks.load_pipeline [--rate 50] [--duration 10] [--gemini-latency 0.8]
+    python -m benchmarks.load_pipeline --write-baseline benchmarks/baseline.json
+    python -m benchmarks.load_pipeline --baseline benchmarks/baseline.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import httpx
+import numpy as np
+
+from benchmarks.fakes import FakeGeminiModel, FakeSupabaseClient, FakeTwilioServer
+from services.gsheets_service import FakeSheetBackend
+from services.idempotency import MessageDeduplicator, SQLiteSeenStore
+from services.job_queue import SQLiteJobQueue
+from services.notification_service import NotificationService
+from services.sms_dispatcher import TwilioHttpSender
+from services.tracing import tracer
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "conversations.jsonl")
+CRITICAL_MESSAGES = ["I have severe chest pain", "saans nahi aa rahi", "my father is unconscious"]
+KNOWLEDGE_RECORDS = [
+    {"topic": "Dengue", "symptoms": "high fever, headache, joint pain, rash", "advice": "Drink fluids, test for NS1."},
+    {"topic": "Diabetes", "symptoms": "thirst, frequent urination, tiredness", "advice": "Regular meals, monitor sugar."},
+    {"topic": "Hypertension", "symptoms": "headache, dizziness", "advice": "Less salt, take medicines on time."},
+    {"topic": "Diarrhoea", "symptoms": "loose stools, dehydration", "advice": "ORS and zinc, safe drinking water."},
+]
+
+# (path to the report field, True if higher is better, differences smaller than this are noise)
+REGRESSION_CHECKS = [
+    (("throughput_msgs_per_sec",), True, 1.0),
+    (("webhook_latency", "p99"), False, 0.005),
+    (("reply_latency", "p99"), False, 0.005),
+    (("peak_rss_mb",), False, 10.0),
+]
+
+
+class Arrival(NamedTuple):
+    at: float
+    phone: str
+    body: str
+
+
+def load_corpus(path: str = CORPUS_PATH) -> List[List[str]]:
+    """
+    The user messages of each conversation in the corpus.
+    """
+    with open(path, encoding="utf-8") as f:
+        return [[turn[0] for turn in json.loads(line)["turns"]] for line in f if line.strip()]
+
+
+def generate_traffic(
+    users: int,
+    rate: float,
+    duration: float,
+    seed: int = 7,
+    burst_probability: float = 0.3,
+    critical_fraction: float = 0.01,
+    corpus: Optional[List[List[str]]] = None,
+) -> List[Arrival]:
+    """
+    Builds a replayable list of arrivals, about `rate` messages per second for `duration` seconds.
+
+    Sessions start as a Poisson process. A session is one message, or with
+    `burst_probability` a burst of two or three messages a fraction of a second
+    apart, the way people send SMS.
+    """
+    rng = random.Random(seed)
+    corpus = corpus or load_corpus()
+    mean_session_size = 1 + burst_probability * 1.5
+    positions: Dict[str, int] = defaultdict(int)
+    arrivals: List[Arrival] = []
+    t = rng.expovariate(rate / mean_session_size)
+    while t < duration:
+        user = rng.randrange(users)
+        phone = f"+9198{user:08d}"
+        conversation = corpus[user % len(corpus)]
+        size = rng.choice((2, 3)) if rng.random() < burst_probability else 1
+        at = t
+        for _ in range(size):
+            if rng.random() < critical_fraction:
+                body = rng.choice(CRITICAL_MESSAGES)
+            else:
+                body = conversation[positions[phone] % len(conversation)]
+                positions[phone] += 1
+            arrivals.append(Arrival(at, phone, body))
+            at += rng.uniform(0.1, 0.8)
+        t += rng.expovariate(rate / mean_session_size)
+    return sorted(arrivals)
+
+
+def percentiles(values: Sequence[float]) -> Dict[str, float]:
+    if not len(values):
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+    p50, p95, p99 = np.percentile(np.asarray(values, dtype=np.float64), [50, 95, 99])
+    return {"count": len(values), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def install_fakes(app_module: Any, options: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    """
+    Points the app's services at in-process fakes and a scratch job queue.
+    """
+    supabase = FakeSupabaseClient(latency=options.supabase_latency)
+    model = FakeGeminiModel(latency=options.gemini_latency, jitter=options.gemini_jitter,
+                            chunk_latency=options.gemini_chunk_latency)
+    twilio = FakeTwilioServer(latency=options.twilio_latency)
+    sender = TwilioHttpSender("ACload", "token", base_url="http://twilio.load", transport=httpx.ASGITransport(app=twilio))
+
+    app_module.db_service.supabase = supabase
+    app_module.gsheets_service.backend = FakeSheetBackend(KNOWLEDGE_RECORDS)
+    app_module.gsheets_service.snapshot_path = os.path.join(workdir, "healthdb_snapshot.json")
+    app_module.gsheets_service.refresh_interval = 0
+    app_module.gemini_service.model = model
+    app_module.notification_service = NotificationService(
+        sender=sender, on_emergency_failure=app_module.enqueue_critical_reply
+    )
+    app_module.job_queue = SQLiteJobQueue(os.path.join(workdir, "jobs.sqlite3"))
+    app_module.worker_pool.queue = app_module.job_queue
+    app_module.deduplicator = MessageDeduplicator(store=SQLiteSeenStore(os.path.join(workdir, "seen.sqlite3"), 3600))
+    app_module.worker_pool.handlers["critical"] = app_module.notification_service.send_critical_sms
+    app_module.settings.MESSAGE_DEBOUNCE_SECONDS = options.debounce
+    return {"supabase": supabase, "gemini": model, "twilio": twilio}
+
+
+async def _drain(app_module: Any, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        stats = await app_module.job_queue.stats()
+        busy = [stats.get("pending"), stats.get("running"),
+                app_module.notification_service.dispatcher.pending, app_module.db_service.chat_writer.pending]
+        if not any(busy):
+            return
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"The pipeline did not drain within {timeout:.0f}s")
+
+
+async def _replay(client: httpx.AsyncClient, arrivals: List[Arrival], posted_at: List[float],
+                  webhook_latency: List[float]) -> None:
+    # Posts each arrival to the webhook at its offset from the start, recording when it was posted
+    async def post(index: int, arrival: Arrival):
+        started = time.perf_counter()
+        posted_at[index] = started
+        response = await client.post("/api/message", data={
+            "From": arrival.phone, "Body": arrival.body, "MessageSid": f"SM{index:032x}",
+        })
+        response.raise_for_status()
+        webhook_latency.append(time.perf_counter() - started)
+
+    posted_at.extend([0.0] * len(arrivals))
+    start = time.perf_counter()
+    posts = []
+    for index, arrival in enumerate(arrivals):
+        delay = start + arrival.at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        posts.append(asyncio.create_task(post(index, arrival)))
+    await asyncio.gather(*posts)
+
+
+def _reply_latencies(arrivals: List[Arrival], posted_at: List[float], messages: List[Dict[str, Any]]) -> List[float]:
+    # From each webhook call to the first SMS to that user accepted after it
+    sent_by_phone: Dict[str, List[float]] = defaultdict(list)
+    for message in messages:
+        sent_by_phone[message["to"]].append(message["accepted_at"])
+    reply_latency = []
+    for arrival, at in zip(arrivals, posted_at):
+        later = [accepted for accepted in sent_by_phone[arrival.phone] if accepted >= at]
+        if later:
+            reply_latency.append(min(later) - at)
+    return reply_latency
+
+
+async def run_load(options: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Replays the generated traffic against the app and returns the report.
+    """
+    import main as app_module
+
+    arrivals = generate_traffic(options.users, options.rate, options.duration, seed=options.seed,
+                                burst_probability=options.burst_probability)
+    stage_durations: Dict[str, List[float]] = defaultdict(list)
+    webhook_latency: List[float] = []
+    posted_at: List[float] = []
+    saved = (tracer.sample_rate, tracer.exporter, app_module.settings.MESSAGE_DEBOUNCE_SECONDS)
+    tracer.sample_rate = 1.0
+    tracer.exporter = lambda span: stage_durations[span.name].append(span.duration)
+    if options.tracemalloc:
+        tracemalloc.start()
+
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            fakes = install_fakes(app_module, options, workdir)
+            async with app_module.lifespan(app_module.app):
+                transport = httpx.ASGITransport(app=app_module.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+                    start = time.perf_counter()
+                    await _replay(client, arrivals, posted_at, webhook_latency)
+                    webhook_elapsed = time.perf_counter() - start
+                    await _drain(app_module, options.drain_timeout)
+                    elapsed = time.perf_counter() - start
+            app_module.job_queue.close()
+            app_module.deduplicator.close()
+            fakes["twilio_messages"] = list(fakes["twilio"].messages)
+    finally:
+        tracer.sample_rate, tracer.exporter, app_module.settings.MESSAGE_DEBOUNCE_SECONDS = saved
+
+    heap_peak = tracemalloc.get_traced_memory()[1] if options.tracemalloc else None
+    if options.tracemalloc:
+        tracemalloc.stop()
+
+    reply_latency = _reply_latencies(arrivals, posted_at, fakes["twilio_messages"])
+    report = {
+        "messages": len(arrivals),
+        "elapsed_seconds": elapsed,
+        "webhook_msgs_per_sec": len(arrivals) / webhook_elapsed if webhook_elapsed else 0.0,
+        "throughput_msgs_per_sec": len(arrivals) / elapsed if elapsed else 0.0,
+        "webhook_latency": percentiles(webhook_latency),
+        "reply_latency": percentiles(reply_latency),
+        "unanswered": len(arrivals) - len(reply_latency),
+        "stages": {name: percentiles(values) for name, values in sorted(stage_durations.items())},
+        "gemini_calls": len(fakes["gemini"].prompts),
+        "database_requests": fakes["supabase"].request_count,
+        "sms_sent": len(fakes["twilio_messages"]),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if heap_peak is not None:
+        report["python_heap_peak_mb"] = heap_peak / 2 ** 20
+    return report
+
+
+def _lookup(report: Dict[str, Any], path: Sequence[str]) -> Optional[float]:
+    value: Any = report
+    for part in path:
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return float(value)
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.2) -> List[str]:
+    """
+    Returns a description of every metric that is worse than the baseline by more than `threshold`.
+    Stage p99s present in the baseline are checked too.
+    """
+    checks = list(REGRESSION_CHECKS)
+    checks += [(("stages", stage, "p99"), False, 0.005) for stage in baseline.get("stages", {})]
+    regressions = []
+    for path, higher_is_better, noise in checks:
+        old, new = _lookup(baseline, path), _lookup(report, path)
+        if old is None or new is None or old <= 0:
+            continue
+        change = (old - new) if higher_is_better else (new - old)
+        if change > noise and change / old > threshold:
+            regressions.append(f"{'.'.join(path)}: {old:.4g} -> {new:.4g} ({change / old:+.0%} worse)")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{report['messages']} messages in {report['elapsed_seconds']:.1f}s | "
+          f"webhook {report['webhook_msgs_per_sec']:.0f} msgs/s | end to end {report['throughput_msgs_per_sec']:.1f} msgs/s | "
+          f"{report['gemini_calls']} Gemini calls | {report['sms_sent']} SMS | {report['unanswered']} unanswered | "
+          f"peak RSS {report['peak_rss_mb']:.0f} MB")
+    rows = [("webhook call", report["webhook_latency"]), ("webhook to first SMS", report["reply_latency"])]
+    rows += list(report["stages"].items())
+    print(f"{'stage':>24} | {'count':>6} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+    for name, stats in rows:
+        print(f"{name:>24} | {stats['count']:>6} | {stats['p50'] * 1000:>8.1f} | "
+              f"{stats['p95'] * 1000:>8.1f} | {stats['p99'] * 1000:>8.1f}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=50.0, help="messages per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of traffic")
+    parser.add_argument("--burst-probability", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--debounce", type=float, default=0.3, help="MESSAGE_DEBOUNCE_SECONDS for the run")
+    parser.add_argument("--gemini-latency", type=float, default=0.8)
+    parser.add_argument("--gemini-jitter", type=float, default=0.4)
+    parser.add_argument("--gemini-chunk-latency", type=float, default=0.05)
+    parser.add_argument("--supabase-latency", type=float, default=0.02)
+    parser.add_argument("--twilio-latency", type=float, default=0.05)
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slower)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--baseline", help="fail if the run is worse than this report")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--write-baseline", help="save the report as the new baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    options = parse_args(argv)
+    # Expected noise, such as the real clients failing to initialize without credentials
+    logging.disable(logging.ERROR)
+    report = asyncio.run(run_load(options))
+    logging.disable(logging.NOTSET)
+
+    if options.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if options.write_baseline:
+        with open(options.write_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {options.write_baseline}")
+    if options.baseline:
+        with open(options.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), options.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {options.threshold:.0%}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,10 @@
+from pathlib import Path
+
 from pydantic_settings import BaseSettings
 
+# Root of the repository, used to resolve bundled data files
+BASE_DIR = Path(__file__).resolve().parent.parent
+
 class Settings(BaseSettings):
     """
     Loads and validates environment variables from the .env file.
@@ -17,10 +22,136 @@ class Settings(BaseSettings):
     TWILIO_PHONE_NUMBER: str
     TWILIO_WHATSAPP_NUMBER: str
 
+    # In-process cache of user profiles and recent chat history
+    USER_CACHE_MAX_ENTRIES: int = 10000
+    USER_CACHE_TTL_SECONDS: float = 300.0
+    USER_CACHE_HISTORY_SIZE: int = 20
+
+    # Write-behind batching of chat_history inserts
+    CHAT_WRITE_BATCH_SIZE: int = 100
+    CHAT_WRITE_FLUSH_SECONDS: float = 0.2
+    CHAT_WRITE_QUEUE_SIZE: int = 10000
+    CHAT_WRITE_MAX_BUFFERED: int = 50000
+
+    # Chat history retention. With the recent window enabled (after applying
+    # migrations/001_chat_history_retention.sql), writes also keep the last
+    # CHAT_RECENT_WINDOW_SIZE messages of each user in chat_recent and replies only read that row.
+    # `python -m services.chat_archive` moves turns older than CHAT_RETENTION_DAYS to CHAT_ARCHIVE_DIR
+    CHAT_RECENT_WINDOW_ENABLED: bool = False
+    CHAT_RECENT_WINDOW_SIZE: int = 20
+    CHAT_RETENTION_DAYS: int = 90
+    CHAT_ARCHIVE_DIR: str = str(BASE_DIR / "var" / "chat_archive")
+    CHAT_ARCHIVE_PAGE_SIZE: int = 1000
+
+    # Offline analytics: `python -m services.analytics export` copies new chat_history rows and a
+    # snapshot of users to partitioned NumPy files under ANALYTICS_EXPORT_DIR; `report` aggregates them
+    ANALYTICS_EXPORT_DIR: str = str(BASE_DIR / "var" / "analytics")
+    ANALYTICS_PAGE_SIZE: int = 5000
+    # Rows newer than this are left for the next export, so ones still being committed are not skipped
+    ANALYTICS_SETTLE_SECONDS: float = 300.0
+
+    # Durable background job queue (SQLite) and its workers
+    JOB_QUEUE_PATH: str = str(BASE_DIR / "var" / "jobs.sqlite3")
+    JOB_RUN_IN_PROCESS: bool = True  # False when separate `python worker.py` processes run the jobs
+    JOB_WORKERS: int = 16
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_SECONDS: float = 2.0
+    JOB_LEASE_SECONDS: float = 120.0
+    # Messages from one user within this window are answered together
+    MESSAGE_DEBOUNCE_SECONDS: float = 1.5
+    MESSAGE_COALESCE_MAX_WAIT_SECONDS: float = 5.0
+
+    # Cache of AI answers; a similarity threshold of 0 disables the TF-IDF tier
+    RESPONSE_CACHE_MAX_ENTRIES: int = 5000
+    RESPONSE_CACHE_TTL_SECONDS: float = 3600.0
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD: float = 0.9
+
+    # Knowledge-base rows added to each prompt, and their token budget
+    RAG_TOP_K: int = 3
+    RAG_MAX_CONTEXT_TOKENS: int = 400
+
+    # Gemini call guards: adaptive concurrency limit (AIMD), deadlines, and the circuit breaker
+    GEMINI_CONCURRENCY_INITIAL: int = 8
+    GEMINI_CONCURRENCY_MIN: int = 1
+    GEMINI_CONCURRENCY_MAX: int = 64
+    GEMINI_LATENCY_TARGET_SECONDS: float = 8.0
+    GEMINI_QUEUE_TIMEOUT_SECONDS: float = 5.0
+    GEMINI_FIRST_CHUNK_TIMEOUT_SECONDS: float = 10.0
+    GEMINI_TIMEOUT_SECONDS: float = 20.0
+    GEMINI_BREAKER_FAILURES: int = 5
+    GEMINI_BREAKER_RESET_SECONDS: float = 30.0
+
+    # Prompt size control: total budget (excluding the system instruction),
+    # budget for the rolling summary of older turns, and history fetched per turn
+    PROMPT_MAX_TOKENS: int = 1200
+    PROMPT_SUMMARY_MAX_TOKENS: int = 150
+    PROMPT_SUMMARY_CACHE_SIZE: int = 10000
+    PROMPT_HISTORY_MESSAGES: int = 20
+
+    # Streamed replies are sent in parts as they are generated; the first part goes out early
+    SMS_SEGMENT_MAX_CHARS: int = 320
+    WHATSAPP_SEGMENT_MAX_CHARS: int = 1500
+    SEGMENT_FIRST_MIN_CHARS: int = 120
+
+    # Outgoing messages: pooled HTTP client, per-sender-number rate limits and retries
+    TWILIO_API_BASE_URL: str = "https://api.twilio.com"
+    SMS_HTTP_MAX_CONNECTIONS: int = 100
+    SMS_SENDER_RATE_PER_SECOND: float = 10.0
+    SMS_SENDER_BURST: float = 20.0
+    SMS_DISPATCH_CONCURRENCY: int = 50
+    SMS_MAX_ATTEMPTS: int = 4
+    SMS_RETRY_BASE_SECONDS: float = 0.5
+
+    # Emergency (108) replies: reserved workers, pre-rendered per-language replies, latency target
+    EMERGENCY_CONCURRENCY: int = 4
+    EMERGENCY_MAX_ATTEMPTS: int = 3
+    EMERGENCY_P99_TARGET_SECONDS: float = 1.0
+
+    # Dependency startup: per-attempt timeout and delay before retrying a failed dependency
+    DEPENDENCY_START_TIMEOUT_SECONDS: float = 30.0
+    DEPENDENCY_RETRY_SECONDS: float = 10.0
+
+    # State shared by worker processes (conversation locks, user cache, SMS rate limits).
+    # Empty keeps it in-process (one worker); redis://host:6379/0 shares it between workers.
+    SHARED_STATE_URL: str = ""
+
+    # Deduplication of Twilio webhook retries by MessageSid. Seen SIDs are also stored
+    # in this SQLite file (shared by the worker processes on the host); empty keeps them in memory only
+    IDEMPOTENCY_WINDOW_SECONDS: float = 3600.0
+    IDEMPOTENCY_MAX_ENTRIES: int = 100000
+    IDEMPOTENCY_DB_PATH: str = str(BASE_DIR / "var" / "seen_messages.sqlite3")
+
+    # Local intent router: profile statements and bare topic questions are answered without Gemini
+    INTENT_ROUTER_ENABLED: bool = True
+    INTENT_TOPIC_MIN_SCORE: float = 0.6
+
+    # Bulk broadcasts (public-health alerts). They share each sender number's SMS_SENDER_RATE_PER_SECOND
+    # with chat replies, which go first; the endpoints are disabled while BROADCAST_API_TOKEN is empty
+    BROADCAST_API_TOKEN: str = ""
+    BROADCAST_DB_PATH: str = str(BASE_DIR / "var" / "broadcasts.sqlite3")
+    BROADCAST_CONCURRENCY: int = 20
+    BROADCAST_PAGE_SIZE: int = 1000
+    BROADCAST_LEASE_SECONDS: float = 120.0
+    BROADCAST_DEFAULT_LANGUAGE: str = "English"
+
+    # Fraction of message traces recorded as full spans; stage latency histograms always cover all traffic
+    TRACE_SAMPLE_RATE: float = 0.01
+
     # Google Cloud Service Account (for Google Sheets)
     # This should be the JSON content as a string
     GOOGLE_APPLICATION_CREDENTIALS_JSON: str
 
+    # Local copy of the last good knowledge-base download, served at startup
+    GSHEETS_SNAPSHOT_PATH: str = str(BASE_DIR / "var" / "healthdb_snapshot.json")
+    # Seconds between background refreshes of the sheet (0 = refresh once at startup)
+    GSHEETS_REFRESH_SECONDS: float = 300.0
+    # Seconds between checks for a new snapshot by worker processes that do not download the sheet
+    GSHEETS_FOLLOW_SECONDS: float = 5.0
+
+    # Versioned critical keyword set (with normalized and transliterated variants)
+    CRITICAL_KEYWORDS_PATH: str = str(BASE_DIR / "data" / "critical_keywords.json")
+    CRITICAL_REPLIES_PATH: str = str(BASE_DIR / "data" / "critical_replies.json")
+
     class Config:
         # This tells pydantic to load variables from a .env file
         env_file = ".env"
@@ -0,0 +1,27 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Iterator, Optional
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "wb", encoding: Optional[str] = None) -> Iterator[IO]:
+    """
+    Opens a temporary file next to `path` and renames it to `path` when the
+    block exits, so readers see either the old file or the complete new one,
+    never a partial write. The directory is created if needed; if the block
+    raises, the temporary file is removed and `path` is left as it was.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    f = tempfile.NamedTemporaryFile(mode, dir=directory, suffix=".tmp", delete=False, encoding=encoding)
+    try:
+        with f:
+            yield f
+        os.replace(f.name, path)
+    except BaseException:
+        try:
+            os.unlink(f.name)
+        except FileNotFoundError:
+            pass
+        raise
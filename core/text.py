@@ -0,0 +1,91 @@
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+
+# Words that carry no meaning for matching questions (English and common Hinglish)
+STOPWORDS = frozenset("""
+a an the is are was were be been am i me my we our you your he she his her of to in on at for with
+about what whats which who how when where why can could should would do does did please tell
+and or but so if any some give know want need hai ka ki ke ko mein kya
+""".split())
+
+# Characters that are dropped entirely rather than turned into a space,
+# so that "can't" and "cant" normalize to the same text.
+_DROPPED_CHARS = {"'", "’", "‘", "`"}
+
+
+def normalize_with_offsets(text: str) -> Tuple[str, List[int]]:
+    """
+    Normalizes free text for matching and keeps track of where each output
+    character came from in the original string.
+
+    Normalization applies NFKC, case-folds, drops apostrophes, turns any other
+    punctuation or symbol into a space and collapses runs of whitespace.
+    Combining marks are kept so that Devanagari and Odia text is preserved.
+
+    Returns:
+        A tuple of (normalized_text, offsets) where offsets[i] is the index in
+        the original text of the character that produced normalized_text[i].
+    """
+    chars: List[str] = []
+    offsets: List[int] = []
+    for index, char in enumerate(text):
+        if char in _DROPPED_CHARS:
+            continue
+        for folded in unicodedata.normalize("NFKC", char).casefold():
+            category = unicodedata.category(folded)
+            if folded.isspace() or category[0] in ("P", "S", "C"):
+                folded = " "
+            if folded == " " and (not chars or chars[-1] == " "):
+                continue
+            chars.append(folded)
+            offsets.append(index)
+
+    if chars and chars[-1] == " ":
+        chars.pop()
+        offsets.pop()
+    return "".join(chars), offsets
+
+
+class _FoldTable(dict):
+    """
+    A str.translate table that applies the per-character rules of
+    normalize_with_offsets, filled lazily as new characters are seen.
+    """
+    def __missing__(self, codepoint: int) -> Optional[str]:
+        char = chr(codepoint)
+        if char in _DROPPED_CHARS:
+            folded = None
+        else:
+            folded = "".join(
+                " " if c.isspace() or unicodedata.category(c)[0] in ("P", "S", "C") else c
+                for c in unicodedata.normalize("NFKC", char).casefold()
+            )
+        self[codepoint] = folded
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+_SPACES = re.compile(r" {2,}")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes free text for matching. See normalize_with_offsets for the rules;
+    this gives the same result without tracking offsets, and is much faster.
+    """
+    return _SPACES.sub(" ", text.translate(_FOLD_TABLE)).strip(" ")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into normalized word tokens, leaving out stopwords.
+    """
+    return [token for token in re.findall(r"\w+", normalize_text(text)) if token not in STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    A cheap estimate of the number of model tokens in a string (about 4 characters per token).
+    """
+    return (len(text) + 3) // 4
@@ -1,33 +1,142 @@
+import asyncio
 import logging
-from fastapi import FastAPI, Form, BackgroundTasks, Response
+import time
+from contextlib import asynccontextmanager
+import secrets
+import sqlite3
+from typing import List, Optional
+from fastapi import FastAPI, Form, Header, HTTPException, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 # Import your data models (schemas) and service classes
-from models.schemas import User, ChatMessage
+from core.config import settings
+from models.schemas import BroadcastRequest, User, ChatMessage
 from services.database_service import DatabaseService
 from services.gsheets_service import GSheetsService
 from services.gemini_service import GeminiService
 from services.notification_service import NotificationService
+from services.keyword_matcher import KeywordMatcher
+from services.job_queue import Job, SQLiteJobQueue, WorkerPool, current_job
+from services.conversation import combine_messages
+from services.lifecycle import Dependencies
+from services.broadcast import BroadcastEngine, BroadcastStore
+from services.idempotency import MessageDeduplicator, SQLiteSeenStore
+from services.shared_state import SharedRateLimiter, create_shared_state
+from services.user_cache import SharedUserCache
+from services.profile import CachedProfile
+from services.sms_segmenter import deliver_stream, split_message
+from services.intent_router import IntentRouter, apply_profile_updates
+from services.metrics import registry
+from services.tracing import tracer
 
 # --- Global Setup ---
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Instantiate the FastAPI app
-app = FastAPI(title="Arogya Mitra AI Assistant")
+# Conversation locks, the user cache and SMS rate limits are shared by all worker
+# processes when SHARED_STATE_URL is set; otherwise they live in this process
+shared_state = create_shared_state(settings.SHARED_STATE_URL)
+scale_out = bool(settings.SHARED_STATE_URL)
 
-# Instantiate all service classes at the global level
-db_service = DatabaseService()
+# Instantiate all service classes at the global level; they connect when the app starts
+db_service = DatabaseService(shared_cache=SharedUserCache(
+    shared_state,
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+    history_size=settings.USER_CACHE_HISTORY_SIZE,
+) if scale_out else None)
 gsheets_service = GSheetsService()
-gemini_service = GeminiService()
-notification_service = NotificationService()
-
-# Define critical keywords for immediate safety response
-CRITICAL_KEYWORDS = [
-    'suicide', 'kill myself', 'want to die', 'heart attack', 'chest pain',
-    'can\'t breathe', 'unconscious', 'poison', 'accident', 'bleeding heavily'
-]
-CRITICAL_RESPONSE_MESSAGE = "This seems like a critical situation. Please contact emergency services immediately by calling 108. This is an AI assistant and not a substitute for a medical professional."
+gemini_service = GeminiService(knowledge_base=gsheets_service)
+intent_router = IntentRouter(knowledge_base=gsheets_service, topic_min_score=settings.INTENT_TOPIC_MIN_SCORE)
+
+
+async def enqueue_critical_reply(to_number: str, message_body: str):
+    """
+    Durable fallback for emergency replies the fast lane could not send.
+    """
+    await job_queue.enqueue("critical", key=f"critical:{to_number}",
+                            payload={"to_number": to_number, "message_body": message_body})
+    worker_pool.notify()
+
+
+notification_service = NotificationService(
+    on_emergency_failure=enqueue_critical_reply,
+    shared_limiter=SharedRateLimiter(shared_state, settings.SMS_SENDER_RATE_PER_SECOND) if scale_out else None,
+)
+
+# Bulk public-health alerts, streamed from the users table and checkpointed so they resume after a restart
+broadcast_engine = BroadcastEngine(
+    db_service,
+    notification_service.dispatcher,
+    BroadcastStore(settings.BROADCAST_DB_PATH, lease_seconds=settings.BROADCAST_LEASE_SECONDS),
+    from_numbers={"": settings.TWILIO_PHONE_NUMBER, "whatsapp:": f"whatsapp:{settings.TWILIO_WHATSAPP_NUMBER}"},
+    concurrency=settings.BROADCAST_CONCURRENCY,
+    page_size=settings.BROADCAST_PAGE_SIZE,
+    default_language=settings.BROADCAST_DEFAULT_LANGUAGE,
+)
+
+# Durable queue for background work; survives restarts and can be shared by worker processes
+job_queue = SQLiteJobQueue(settings.JOB_QUEUE_PATH, lease_seconds=settings.JOB_LEASE_SECONDS)
+
+# Drops Twilio webhook retries (same MessageSid) before any work is queued
+deduplicator = MessageDeduplicator(
+    window_seconds=settings.IDEMPOTENCY_WINDOW_SECONDS,
+    max_entries=settings.IDEMPOTENCY_MAX_ENTRIES,
+    store=SQLiteSeenStore(
+        settings.IDEMPOTENCY_DB_PATH, window_seconds=settings.IDEMPOTENCY_WINDOW_SECONDS
+    ) if settings.IDEMPOTENCY_DB_PATH else None,
+)
+
+
+# External dependencies, started concurrently and retried in the background until they are up.
+# The lambdas look the services up at call time so they can be swapped out (see benchmarks/load_pipeline.py).
+dependencies = Dependencies(
+    start_timeout=settings.DEPENDENCY_START_TIMEOUT_SECONDS,
+    retry_interval=settings.DEPENDENCY_RETRY_SECONDS,
+)
+# Dependencies stop in reverse order: the database after the services that write to it,
+# which flushes chat messages that are still queued
+dependencies.add("shared_state", lambda: shared_state.start(), lambda: shared_state.close())
+dependencies.add("database", lambda: db_service.start(), lambda: db_service.close())
+# The knowledge base is served from its local snapshot and refreshed in the background
+dependencies.add("knowledge_base", lambda: gsheets_service.start(), lambda: gsheets_service.stop(), required=False)
+dependencies.add("gemini", lambda: gemini_service.start())
+dependencies.add("twilio", lambda: notification_service.start(), lambda: notification_service.close())
+
+
+async def start_services():
+    """
+    Starts the dependencies, then the in-process workers once the required ones are ready.
+    """
+    await dependencies.start()
+    if settings.JOB_RUN_IN_PROCESS:
+        await worker_pool.start()
+        # Broadcasts interrupted by a restart carry on from their last checkpoint
+        broadcast_engine.start()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts the services in the background when the app starts and stops them on shutdown.
+
+    The app accepts requests right away: webhook messages are queued until the
+    workers start, and /health/ready reports 503 until then.
+    """
+    startup = asyncio.create_task(start_services())
+    yield
+    startup.cancel()
+    await asyncio.gather(startup, return_exceptions=True)
+    await broadcast_engine.stop()
+    await worker_pool.stop()
+    await dependencies.stop()
+
+
+# Instantiate the FastAPI app
+app = FastAPI(title="Arogya Mitra AI Assistant", lifespan=lifespan)
+
+# Compile the critical keyword set once for immediate safety response
+critical_keyword_matcher = KeywordMatcher.from_file(settings.CRITICAL_KEYWORDS_PATH)
 # --- End Global Setup ---
 
 
@@ -35,47 +144,151 @@ CRITICAL_RESPONSE_MESSAGE = "This seems like a critical situation. Please contac
 async def process_message_logic(user_phone: str, user_message: str):
     """
     This function contains the core logic for handling a non-critical message.
-    It runs in the background to avoid timing out the Twilio webhook.
+    It runs as a queued job to avoid timing out the Twilio webhook; unexpected
+    errors are re-raised so that the job is retried, unless part of the reply
+    was already sent.
+    """
+    # Serializes turns per phone number, across worker processes, so replies never race on stale history
+    async with shared_state.lock(f"conversation:{user_phone}", timeout=settings.JOB_LEASE_SECONDS):
+        # The job row records that its reply went out, so a retry after an error, a restart or an
+        # expired lease in another process does not send it again
+        job = current_job.get()
+        if job is not None and await job_queue.delivered(job):
+            logger.info(f"Reply for {user_phone} was already sent by an earlier attempt; not sending it again.")
+            return
+        await _process_turn(user_phone, user_message, job)
+
+
+async def process_queued_messages(user_phone: str, user_messages: List[str]):
     """
+    Job handler for queued messages. Messages a user sent within the debounce
+    window arrive here together and are answered with a single AI call.
+    """
+    await process_message_logic(user_phone, combine_messages(user_messages))
+
+
+async def _get_or_create_profile(user_phone: str) -> CachedProfile:
+    with tracer.span("db.get_user"):
+        user_profile = await db_service.get_profile(user_phone)
+    if user_profile is None:
+        # Create a default profile for the new user
+        new_user = User(phone_number=user_phone)
+        with tracer.span("db.create_user"):
+            await db_service.create_or_update_user(new_user)
+        user_profile = CachedProfile.from_user(new_user)
+        logger.info(f"Created new user profile for {user_phone}")
+    return user_profile
+
+
+async def _route_message(user_message: str, user_profile: CachedProfile):
+    """
+    Routes the message and saves any profile statements in it; returns the route and the profile to use.
+    """
+    with tracer.span("router") as span:
+        routed = intent_router.route(user_message)
+        span.set_attribute("route", routed.route)
+    if routed.updates:
+        updated_user = apply_profile_updates(user_profile, routed.updates)
+        with tracer.span("db.update_user"):
+            await db_service.create_or_update_user(updated_user)
+        user_profile = CachedProfile.from_user(updated_user)
+    return routed, user_profile
+
+
+async def _process_turn(user_phone: str, user_message: str, job: Optional[Job] = None):
+    delivering = False
     try:
-        # a. Fetch User Profile
-        user_profile_data = await db_service.get_user(user_phone)
+        # a. Fetch User Profile, b. creating it for new users
+        user_profile = await _get_or_create_profile(user_phone)
 
-        # b. Handle New Users
-        if user_profile_data:
-            user_profile = User(**user_profile_data)
-        else:
-            # Create a default profile for the new user
-            user_profile = User(phone_number=user_phone)
-            # You might want to save this new user profile to the DB immediately
-            await db_service.create_or_update_user(user_profile)
-            logger.info(f"Created new user profile for {user_phone}")
-
-        # c. Fetch Chat History
-        history = await db_service.get_chat_history(user_phone)
-
-        # d. Call AI Service
-        ai_response_text = await gemini_service.get_ai_response(
-            user_message=user_message,
-            user_profile=user_profile,
-            chat_history=history
+        max_chars = (
+            settings.WHATSAPP_SEGMENT_MAX_CHARS if user_phone.startswith('whatsapp:') else settings.SMS_SEGMENT_MAX_CHARS
         )
 
-        # e. Save Conversation to DB
-        # Save user's message
-        await db_service.save_chat_message(
-            ChatMessage(phone_number=user_phone, sender='user', message_text=user_message)
-        )
-        # Save bot's response
-        await db_service.save_chat_message(
-            ChatMessage(phone_number=user_phone, sender='bot', message_text=ai_response_text)
-        )
+        async def send_segment(segment: str):
+            nonlocal delivering
+            if not delivering:
+                delivering = True
+                if job is not None:
+                    await job_queue.mark_delivered(job)
+            await notification_service.send_sms(to_number=user_phone, message_body=segment)
+
+        # c. Save profile statements ("my age is 54") and answer them, or bare topics, locally
+        routed = None
+        if settings.INTENT_ROUTER_ENABLED:
+            routed, user_profile = await _route_message(user_message, user_profile)
+
+        if routed is not None and routed.reply is not None:
+            with tracer.span("reply.local"):
+                for segment in split_message(routed.reply, max_chars=max_chars):
+                    await send_segment(segment)
+            ai_response_text = routed.reply
+        else:
+            # d. Fetch Chat History
+            with tracer.span("db.get_chat_history") as span:
+                history = await db_service.get_chat_history(user_phone, limit=settings.PROMPT_HISTORY_MESSAGES)
+                span.set_attribute("messages", len(history))
 
-        # f. Send AI Reply back to the user
-        await notification_service.send_sms(to_number=user_phone, message_body=ai_response_text)
+            # e. Stream the AI reply and send it in parts as it is generated
+            with tracer.span("reply") as span:
+                ai_response_text = await deliver_stream(
+                    gemini_service.stream_ai_response(
+                        user_message=user_message,
+                        user_profile=user_profile,
+                        chat_history=history
+                    ),
+                    send=send_segment,
+                    max_chars=max_chars,
+                    first_min_chars=settings.SEGMENT_FIRST_MIN_CHARS,
+                )
+                span.set_attribute("characters", len(ai_response_text))
+
+        # f. Save Conversation to DB, with the full reply as one message
+        with tracer.span("db.save_chat_messages"):
+            # Save user's message
+            await db_service.save_chat_message(
+                ChatMessage(phone_number=user_phone, sender='user', message_text=user_message)
+            )
+            # Save bot's response
+            await db_service.save_chat_message(
+                ChatMessage(phone_number=user_phone, sender='bot', message_text=ai_response_text)
+            )
 
     except Exception as e:
         logger.error(f"Error processing message for {user_phone}: {e}")
+        # Once the user has part of the reply, a retry would send it again
+        if not delivering:
+            raise
+
+
+# Workers run queued jobs; jobs for the same phone number run one at a time, in order
+worker_pool = WorkerPool(
+    job_queue,
+    handlers={
+        "message": process_queued_messages,
+        "critical": notification_service.send_critical_sms,
+    },
+    concurrency=settings.JOB_WORKERS,
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+    retry_base_delay=settings.JOB_RETRY_BASE_SECONDS,
+)
+
+# Service counters that are read when /metrics is scraped
+registry.gauge("chat_writes_pending", "Chat messages waiting to be written to the database.",
+               lambda: db_service.chat_writer.pending)
+registry.gauge("response_cache_hit_ratio", "Fraction of AI answers served from the response cache.",
+               lambda: gemini_service.response_cache.stats()["hit_rate"])
+registry.gauge("sms_dispatch_pending", "Outgoing messages queued or waiting for a retry.",
+               lambda: notification_service.dispatcher.pending)
+registry.gauge("webhook_seen_message_sids", "MessageSids remembered in memory for deduplication.",
+               lambda: len(deduplicator.seen))
+registry.gauge("gemini_concurrency_limit", "Current adaptive limit on concurrent Gemini calls.",
+               lambda: int(gemini_service.limiter.limit))
+registry.gauge("gemini_in_flight", "Gemini calls in progress.", lambda: gemini_service.limiter.in_flight)
+registry.gauge("gemini_circuit_open", "1 while the Gemini circuit breaker refuses calls.",
+               lambda: int(gemini_service.breaker.state != gemini_service.breaker.CLOSED))
+registry.gauge("emergency_reply_p99_seconds", "p99 latency of recent emergency replies, webhook to Twilio.",
+               lambda: notification_service.emergency.latency.percentile(99))
 # --- End Background Task Logic ---
 
 
@@ -85,31 +298,100 @@ async def root():
     """Root endpoint to check if the service is running."""
     return {"status": "Arogya Mitra is running"}
 
+@app.get("/health/live", tags=["Status"])
+async def liveness():
+    """Liveness probe: the process is up and serving requests."""
+    return {"status": "alive"}
+
+@app.get("/health/ready", tags=["Status"])
+async def readiness():
+    """Readiness probe: 200 once every required dependency has started, 503 before. Reports each dependency."""
+    report = dependencies.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@app.get("/metrics", tags=["Status"], response_class=PlainTextResponse)
+async def metrics():
+    """Stage latency and queue time histograms and service gauges, in the Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/api/message", tags=["Webhook"])
 async def handle_message(
-    background_tasks: BackgroundTasks,
     From: str = Form(...),
-    Body: str = Form(...)
+    Body: str = Form(...),
+    MessageSid: Optional[str] = Form(None)
 ):
     """
     Main webhook endpoint to receive incoming SMS messages from Twilio.
+    Twilio's retries of a message that was already received are acknowledged and dropped.
     """
+    received_at = time.perf_counter()
     user_phone = From
     user_message = Body.strip()
-    logger.info(f"Received message from {user_phone}: '{user_message}'")
+    logger.info(f"Received message {MessageSid} from {user_phone}: '{user_message}'")
+
+    if MessageSid and not await deduplicator.first_delivery(MessageSid):
+        return Response(status_code=204)
 
     # Critical Keyword Check (Safety First)
-    if any(keyword in user_message.lower() for keyword in CRITICAL_KEYWORDS):
-        logger.warning(f"Critical keyword detected from {user_phone}. Sending immediate response.")
-        background_tasks.add_task(
-            notification_service.send_sms,
-            to_number=user_phone,
-            message_body=CRITICAL_RESPONSE_MESSAGE
+    critical_match = critical_keyword_matcher.search(user_message)
+    if critical_match:
+        logger.warning(
+            f"Critical keyword '{critical_match.keyword}' ({critical_match.language}) detected from {user_phone} "
+            f"at {critical_match.start}-{critical_match.end}. Sending immediate response."
         )
+        # The emergency reply goes out on its own fast lane, in the language of the matched keyword
+        notification_service.send_emergency(user_phone, critical_match.language, received_at)
     else:
-        # Process Normal Message in the background
-        background_tasks.add_task(process_message_logic, user_phone, user_message)
-    
+        # Queue Normal Message for the background workers; a burst of messages
+        # from the same user is coalesced into one job within the debounce window
+        try:
+            await job_queue.enqueue(
+                "message",
+                key=user_phone,
+                payload={"user_phone": user_phone, "user_messages": [user_message]},
+                coalesce_within=settings.MESSAGE_DEBOUNCE_SECONDS,
+                max_wait=settings.MESSAGE_COALESCE_MAX_WAIT_SECONDS,
+            )
+        except Exception:
+            # Nothing was queued, so Twilio's retry of this message must not be dropped
+            if MessageSid:
+                await deduplicator.forget(MessageSid)
+            raise
+    worker_pool.notify()
+
     # Return an empty response to Twilio immediately to prevent timeouts
     return Response(status_code=204)
+
+
+def _check_broadcast_token(token: Optional[str]):
+    # The broadcast endpoints are off unless a token is configured
+    if not settings.BROADCAST_API_TOKEN:
+        raise HTTPException(status_code=404)
+    if not token or not secrets.compare_digest(token, settings.BROADCAST_API_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid broadcast token.")
+
+@app.post("/api/broadcasts", tags=["Broadcast"], status_code=202)
+async def create_broadcast(request: BroadcastRequest, x_broadcast_token: Optional[str] = Header(None)):
+    """
+    Starts sending a public-health alert to every matching user. Returns the broadcast and its progress.
+    """
+    _check_broadcast_token(x_broadcast_token)
+    try:
+        broadcast = await broadcast_engine.create(request.templates, request.filters, broadcast_id=request.id)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=409, detail=f"Broadcast {request.id} already exists.")
+    return broadcast.report()
+
+@app.get("/api/broadcasts/{broadcast_id}", tags=["Broadcast"])
+async def get_broadcast(broadcast_id: str, x_broadcast_token: Optional[str] = Header(None)):
+    """
+    Reports a broadcast's progress as of its last checkpoint.
+    """
+    _check_broadcast_token(x_broadcast_token)
+    broadcast = await broadcast_engine.store.get(broadcast_id)
+    if broadcast is None:
+        raise HTTPException(status_code=404, detail="Unknown broadcast.")
+    return broadcast.report()
 # --- End API Endpoints ---
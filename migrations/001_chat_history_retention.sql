@@ -0,0 +1,121 @@
+-- Chat history retention: a per-user window of recent messages, and the indexes
+-- that keep history reads and archiving off full-table scans.
+--
+-- Apply with psql before setting CHAT_RECENT_WINDOW_ENABLED=true, passing the
+-- window size: psql -v window_size=$CHAT_RECENT_WINDOW_SIZE -f 001_chat_history_retention.sql
+-- Running it again, or after the flag is on, is safe: the backfill merges with
+-- the windows the app has written since (see chat_recent_backfill).
+-- The index statements use CONCURRENTLY so they do not block writes; run them
+-- outside a transaction.
+
+-- Reads that still go to chat_history (recent-window backfill, support queries)
+-- filter on phone_number and sort by created_at: one index range scan per user.
+create index concurrently if not exists chat_history_phone_created_idx
+    on chat_history (phone_number, created_at desc, id desc);
+
+-- The archiver takes the oldest rows first: services/chat_archive.py.
+create index concurrently if not exists chat_history_created_idx
+    on chat_history (created_at, id);
+
+-- The last messages of each user, oldest first, as the replies need them.
+create table if not exists chat_recent (
+    phone_number text primary key,
+    messages jsonb not null default '[]'::jsonb,
+    updated_at timestamptz not null default now()
+);
+
+-- The last `window_size` elements of a JSON array.
+create or replace function chat_recent_trim(messages jsonb, window_size integer)
+returns jsonb
+language sql
+immutable
+as $$
+    select coalesce(jsonb_agg(e order by n), '[]'::jsonb)
+    from jsonb_array_elements(messages) with ordinality as t(e, n)
+    where n > jsonb_array_length(messages) - window_size;
+$$;
+
+-- Two windows of the same user merged: each message once (by id), oldest first,
+-- the last `window_size` kept. Ties on created_at are ordered by id, like reads
+-- of chat_history; a message without an id is matched on its whole content.
+create or replace function chat_recent_merge(existing jsonb, additions jsonb, window_size integer)
+returns jsonb
+language sql
+stable
+as $$
+    select chat_recent_trim(
+        coalesce(jsonb_agg(e order by (e->>'created_at')::timestamptz, e->'id'), '[]'::jsonb),
+        window_size
+    )
+    from (
+        select distinct on (coalesce(e->'id', e)) e
+        from jsonb_array_elements(existing || additions) as t(e)
+        order by coalesce(e->'id', e)
+    ) deduped;
+$$;
+
+-- Inserts a batch of chat messages and appends them to each user's window in the
+-- same transaction, keeping the last `window_size`. Called by DatabaseService as
+-- rpc('insert_chat_messages', {messages, window_size}); concurrent batches for the
+-- same user serialize on the chat_recent row.
+create or replace function insert_chat_messages(messages jsonb, window_size integer default 20)
+returns void
+language plpgsql
+as $$
+begin
+    with inserted as (
+        insert into chat_history (phone_number, sender, message_text)
+        select m->>'phone_number', m->>'sender', m->>'message_text'
+        from jsonb_array_elements(messages) with ordinality as t(m, n)
+        order by n
+        returning id, phone_number, sender, message_text, created_at
+    ), appended as (
+        select phone_number,
+               jsonb_agg(jsonb_build_object(
+                   'id', id, 'phone_number', phone_number, 'sender', sender,
+                   'message_text', message_text, 'created_at', created_at
+               ) order by id) as messages
+        from inserted
+        group by phone_number
+    )
+    insert into chat_recent as r (phone_number, messages, updated_at)
+    select phone_number, chat_recent_trim(messages, window_size), now()
+    from appended
+    on conflict (phone_number) do update
+        set messages = chat_recent_trim(r.messages || excluded.messages, window_size),
+            updated_at = now();
+end;
+$$;
+
+-- Fills each user's window from existing history (uses chat_history_phone_created_idx).
+-- A user whose window insert_chat_messages already started (the flag was turned on
+-- first, or messages arrived while this ran) gets both merged, so no message is
+-- lost or repeated whichever runs first.
+create or replace function chat_recent_backfill(window_size integer)
+returns void
+language sql
+as $$
+    insert into chat_recent as r (phone_number, messages)
+    select phone_number,
+           jsonb_agg(jsonb_build_object(
+               'id', id, 'phone_number', phone_number, 'sender', sender,
+               'message_text', message_text, 'created_at', created_at
+           ) order by created_at, id)
+    from (
+        select h.*, row_number() over (partition by phone_number order by created_at desc, id desc) as recency
+        from chat_history h
+    ) recent
+    where recency <= window_size
+    group by phone_number
+    on conflict (phone_number) do update
+        set messages = chat_recent_merge(r.messages, excluded.messages, window_size),
+            updated_at = now();
+$$;
+
+-- window_size must match CHAT_RECENT_WINDOW_SIZE (20 unless set); writes trim
+-- to the size DatabaseService passes, reads take what the row holds.
+\if :{?window_size}
+\else
+    \set window_size 20
+\endif
+select chat_recent_backfill(:window_size);
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
 
 class User(BaseModel):
     """
@@ -21,3 +21,13 @@ class ChatMessage(BaseModel):
     phone_number: str
     sender: str  # Can be 'user' or 'bot'
     message_text: str
+
+class BroadcastRequest(BaseModel):
+    """
+    A message to send to every user whose profile matches `filters`,
+    e.g. {"language": ["Hindi", "English"], "has_diabetes": True}.
+    `templates` holds the message text by language.
+    """
+    templates: Dict[str, str]
+    filters: Dict[str, Any] = Field(default_factory=dict)
+    id: Optional[str] = None
@@ -0,0 +1,457 @@
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import shutil
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from core.config import settings
+from core.files import atomic_write
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHAT_COLUMNS = ("id", "phone_number", "sender", "message_text", "created_at", "length")
+WATERMARK_FILE = "_watermark.json"
+
+
+class ExportRun(NamedTuple):
+    messages: int
+    users: int
+    files: int
+    last_id: Optional[int]
+
+
+class TextColumn:
+    """
+    A column of variable-length strings stored the way Arrow stores them: the
+    UTF-8 bytes of all values in one buffer, and n + 1 offsets into it. Unlike
+    a fixed-width NumPy string array, nothing is padded to the longest value,
+    and a search runs over the whole buffer at once.
+    """
+    __slots__ = ("data", "offsets")
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, values: Iterable[str]) -> "TextColumn":
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.array([len(value) for value in encoded], dtype=np.int64), out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    @classmethod
+    def concatenate(cls, columns: Sequence["TextColumn"]) -> "TextColumn":
+        starts = np.cumsum([0] + [len(column.data) for column in columns[:-1]])
+        offsets = [columns[0].offsets[:1]] + [column.offsets[1:] + start for column, start in zip(columns, starts)]
+        return cls(np.concatenate([column.data for column in columns]), np.concatenate(offsets))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, (int, np.integer)):
+            return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+        # Gather the selected values' bytes with one fancy index
+        indices = np.arange(len(self))[index]
+        starts, lengths = self.offsets[indices], self.offsets[indices + 1] - self.offsets[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return TextColumn(self.data[positions], offsets)
+
+    def tolist(self) -> List[str]:
+        return [self[i] for i in range(len(self))]
+
+    def lower(self) -> "TextColumn":
+        """
+        The values with ASCII letters lowercased (other scripts are unchanged).
+        """
+        return TextColumn(np.frombuffer(self.data.tobytes().lower(), dtype=np.uint8), self.offsets)
+
+    def contains(self, needle: str) -> np.ndarray:
+        """
+        Whether each value contains `needle`.
+        """
+        found = np.zeros(len(self), dtype=bool)
+        buffer, pattern = self.data.tobytes(), needle.encode("utf-8")
+        start = buffer.find(pattern)
+        while start >= 0:
+            row = int(np.searchsorted(self.offsets, start, side="right")) - 1
+            # A match running across the end of a value into the next one does not count
+            if start + len(pattern) <= self.offsets[row + 1]:
+                found[row] = True
+                start = buffer.find(pattern, self.offsets[row + 1])
+            else:
+                start = buffer.find(pattern, start + 1)
+        return found
+
+
+def _timestamp(value: Any) -> datetime:
+    # Supabase returns ISO 8601 strings with an offset; the export stores naive UTC
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _strings(rows: List[Dict[str, Any]], column: str) -> np.ndarray:
+    return np.array([row.get(column) or "" for row in rows], dtype=str)
+
+
+def chat_columns(rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    A page of chat_history rows as one array per column.
+    """
+    texts = [row.get("message_text") or "" for row in rows]
+    return {
+        "id": np.array([row["id"] for row in rows], dtype=np.int64),
+        "phone_number": _strings(rows, "phone_number"),
+        "sender": _strings(rows, "sender"),
+        "message_text": TextColumn.from_strings(texts),
+        "created_at": np.array([_timestamp(row["created_at"]) for row in rows], dtype="datetime64[us]"),
+        "length": np.array([len(text) for text in texts], dtype=np.int32),
+    }
+
+
+def user_columns(rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    A page of users rows as one array per column; a missing age is NaN.
+    """
+    return {
+        "phone_number": _strings(rows, "phone_number"),
+        "language": _strings(rows, "language"),
+        "age": np.array([row.get("age") if row.get("age") is not None else np.nan for row in rows], dtype=np.float64),
+        "has_diabetes": np.array([bool(row.get("has_diabetes")) for row in rows], dtype=bool),
+        "has_hypertension": np.array([bool(row.get("has_hypertension")) for row in rows], dtype=bool),
+        "other_conditions": _strings(rows, "other_conditions"),
+    }
+
+
+def _write_part(directory: str, name: str, columns: Dict[str, Any]) -> None:
+    arrays = {}
+    for column, values in columns.items():
+        if isinstance(values, TextColumn):
+            arrays[column + ".data"], arrays[column + ".offsets"] = values.data, values.offsets
+        else:
+            arrays[column] = values
+    with atomic_write(os.path.join(directory, name + ".npz")) as f:
+        np.savez_compressed(f, **arrays)
+
+
+class AnalyticsExporter:
+    """
+    Copies chat_history and users out of the database for offline analysis,
+    so analysts never query the production tables.
+
+    chat_history is read incrementally: pages are fetched by id after the
+    watermark of the last run, written as compressed NumPy column files
+    partitioned by day (`chat_history/date=2025-01-05/part-<first id>.npz`),
+    and the watermark is advanced once a page's files are in place. Memory
+    is bounded by the page size.
+
+    A row can commit after a row with a higher id, and a watermark past it
+    would skip it for good. So the export stops at the first row created
+    less than `settle_seconds` ago: every row below the watermark is older
+    than that, and so committed as long as no insert takes that long.
+
+    The users table has no change timestamp, so it is streamed in pages
+    into a fresh snapshot that replaces the last one.
+
+    Run it from cron in one process, more often than the chat archiver's
+    retention period: `python -m services.analytics export`.
+    """
+    def __init__(self, db_service: Any, export_dir: str, page_size: int = 5000, settle_seconds: float = 300.0):
+        self.db_service = db_service
+        self.export_dir = export_dir
+        self.page_size = page_size
+        self.settle_seconds = settle_seconds
+
+    @property
+    def watermark_path(self) -> str:
+        return os.path.join(self.export_dir, WATERMARK_FILE)
+
+    def watermark(self) -> Optional[int]:
+        """
+        The id of the last exported chat_history row, or None before the first run.
+        """
+        try:
+            with open(self.watermark_path, encoding="utf-8") as f:
+                return json.load(f)["chat_history_last_id"]
+        except FileNotFoundError:
+            return None
+
+    def _save_watermark(self, last_id: int) -> None:
+        with atomic_write(self.watermark_path, "w", encoding="utf-8") as f:
+            json.dump({"chat_history_last_id": last_id, "updated_at": datetime.now(timezone.utc).isoformat()}, f)
+
+    async def run(self, max_pages: Optional[int] = None, users: bool = True,
+                  now: Optional[datetime] = None) -> ExportRun:
+        """
+        Exports the settled chat_history rows added since the last run (at
+        most `max_pages` pages of them) and, with `users`, a new users snapshot.
+        """
+        messages, files, last_id = await self._export_chat(max_pages, now or datetime.now(timezone.utc))
+        user_count = 0
+        if users:
+            user_count, user_files = await self._export_users()
+            files += user_files
+        logger.info(f"Exported {messages} chat messages up to id {last_id} and {user_count} users in {files} files.")
+        return ExportRun(messages, user_count, files, last_id)
+
+    async def _export_chat(self, max_pages: Optional[int], now: datetime):
+        cutoff = np.datetime64(_timestamp(now - timedelta(seconds=self.settle_seconds)), "us")
+        last_id = self.watermark()
+        messages = files = pages = 0
+        async for page in self.db_service.iter_chat_messages(after_id=last_id, page_size=self.page_size):
+            columns = chat_columns(page)
+            unsettled = np.flatnonzero(columns["created_at"] >= cutoff)
+            if len(unsettled):
+                settled = np.arange(len(page)) < unsettled[0]
+                columns = {name: values[settled] for name, values in columns.items()}
+            if len(columns["id"]):
+                files += await self._write_chat_page(columns)
+                last_id = int(columns["id"][-1])
+                await asyncio.to_thread(self._save_watermark, last_id)
+                messages += len(columns["id"])
+            pages += 1
+            if len(unsettled) or (max_pages is not None and pages >= max_pages):
+                break
+        return messages, files, last_id
+
+    async def _write_chat_page(self, columns: Dict[str, Any]) -> int:
+        days = columns["created_at"].astype("datetime64[D]")
+        unique_days = np.unique(days)
+        for day in unique_days:
+            selected = days == day
+            part = {name: values[selected] for name, values in columns.items()}
+            directory = os.path.join(self.export_dir, "chat_history", f"date={day}")
+            await asyncio.to_thread(_write_part, directory, f"part-{part['id'][0]}", part)
+        return len(unique_days)
+
+    async def _export_users(self):
+        final = os.path.join(self.export_dir, "users")
+        staging, previous = final + ".tmp", final + ".old"
+        shutil.rmtree(staging, ignore_errors=True)
+        count = files = 0
+        async for page in self.db_service.iter_users(columns='*', page_size=self.page_size):
+            await asyncio.to_thread(_write_part, staging, f"part-{files:06d}", user_columns(page))
+            count += len(page)
+            files += 1
+        os.makedirs(staging, exist_ok=True)
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(final):
+            os.rename(final, previous)
+        os.rename(staging, final)
+        shutil.rmtree(previous, ignore_errors=True)
+        return count, files
+
+
+def load_table(
+    export_dir: str,
+    table: str = "chat_history",
+    columns: Optional[Sequence[str]] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Reads exported columns back into arrays, reading only the `columns` asked
+    for and, for chat_history, only the day partitions from `since` to
+    `until` ("2025-01-05", both inclusive). Rows exported twice (after an
+    interrupted run) are dropped. Returns {} if nothing matches.
+
+    message_text is returned as a TextColumn, the other columns as arrays.
+    """
+    paths = []
+    for path in sorted(glob.glob(os.path.join(export_dir, table, "**", "*.npz"), recursive=True)):
+        partition = os.path.basename(os.path.dirname(path))
+        if partition.startswith("date="):
+            day = partition[len("date="):]
+            if (since and day < since) or (until and day > until):
+                continue
+        paths.append(path)
+    loaded: Dict[str, List[Any]] = {}
+    for path in paths:
+        with np.load(path) as data:
+            names = columns or list(dict.fromkeys(key.rsplit(".", 1)[0] for key in data.files))
+            for column in names:
+                if column + ".data" in data.files:
+                    values = TextColumn(data[column + ".data"], data[column + ".offsets"])
+                else:
+                    values = data[column]
+                loaded.setdefault(column, []).append(values)
+    result = {
+        column: TextColumn.concatenate(parts) if isinstance(parts[0], TextColumn) else np.concatenate(parts)
+        for column, parts in loaded.items()
+    }
+    if "id" in result:
+        _, first = np.unique(result["id"], return_index=True)
+        if len(first) < len(result["id"]):
+            result = {column: values[np.sort(first)] for column, values in result.items()}
+    return result
+
+
+def daily_volumes(chat: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Per day: user messages, bot replies, distinct active users and mean reply length.
+    Needs the created_at, sender, phone_number and length columns.
+    """
+    days, day_index = np.unique(chat["created_at"].astype("datetime64[D]"), return_inverse=True)
+    n = len(days)
+    is_user = chat["sender"] == "user"
+    is_bot = chat["sender"] == "bot"
+    user_messages = np.bincount(day_index, weights=is_user, minlength=n).astype(np.int64)
+    bot_messages = np.bincount(day_index, weights=is_bot, minlength=n).astype(np.int64)
+    _, phone_index = np.unique(chat["phone_number"], return_inverse=True)
+    phones = int(phone_index.max()) + 1 if len(phone_index) else 1
+    active_pairs = np.unique(day_index.astype(np.int64) * phones + phone_index)
+    active_users = np.bincount(active_pairs // phones, minlength=n)
+    reply_chars = np.bincount(day_index, weights=np.where(is_bot, chat["length"], 0), minlength=n)
+    mean_reply = np.divide(reply_chars, bot_messages, out=np.zeros(n), where=bot_messages > 0)
+    return {"day": days, "user_messages": user_messages, "bot_messages": bot_messages,
+            "active_users": active_users, "mean_reply_chars": mean_reply}
+
+
+def response_lengths(chat: Dict[str, np.ndarray]) -> Dict[str, float]:
+    """
+    Length in characters of the bot's replies: count, mean, p50, p95 and max.
+    """
+    lengths = chat["length"][chat["sender"] == "bot"]
+    if not len(lengths):
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    p50, p95 = np.percentile(lengths, [50, 95])
+    return {"count": int(len(lengths)), "mean": float(lengths.mean()), "p50": float(p50), "p95": float(p95),
+            "max": float(lengths.max())}
+
+
+def topic_frequencies(chat: Dict[str, np.ndarray], topics: Iterable[str]) -> Dict[str, int]:
+    """
+    How many user messages mention each knowledge-base topic (substring
+    match, ignoring ASCII case), most frequent first, plus "(none)" for messages that
+    mention none of them.
+    """
+    texts = chat["message_text"][chat["sender"] == "user"].lower()
+    matched = np.zeros(len(texts), dtype=bool)
+    counts = {}
+    for topic in dict.fromkeys(str(t).strip() for t in topics if str(t).strip()):
+        hits = texts.contains(topic.lower())
+        counts[topic] = int(np.count_nonzero(hits))
+        matched |= hits
+    counts = dict(sorted(counts.items(), key=lambda item: -item[1]))
+    counts["(none)"] = int(np.count_nonzero(~matched))
+    return counts
+
+
+def read_spans(path: str) -> List[Dict[str, Any]]:
+    """
+    Sampled spans from a file of span JSON, one per line, as written by the
+    tracer's log_span exporter (log prefixes before the JSON are ignored).
+    """
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            start = line.find("{")
+            if start < 0:
+                continue
+            try:
+                span = json.loads(line[start:])
+            except ValueError:
+                continue
+            if isinstance(span, dict) and "name" in span and "duration" in span:
+                spans.append(span)
+    return spans
+
+
+def stage_latency(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """
+    Count and p50/p95/p99 duration in seconds of each stage in `spans`.
+    """
+    if not spans:
+        return {}
+    names, index = np.unique(np.array([span["name"] for span in spans], dtype=str), return_inverse=True)
+    durations = np.array([span["duration"] for span in spans], dtype=np.float64)
+    result = {}
+    for i, name in enumerate(names):
+        values = durations[index == i]
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        result[str(name)] = {"count": int(len(values)), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+    return result
+
+
+async def _export(options: argparse.Namespace) -> ExportRun:
+    from services.database_service import DatabaseService
+
+    exporter = AnalyticsExporter(DatabaseService(), options.export_dir, options.page_size, options.settle_seconds)
+    return await exporter.run(max_pages=options.max_pages, users=not options.skip_users)
+
+
+def _report(options: argparse.Namespace) -> None:
+    from services.gsheets_service import GSheetsService
+
+    chat = load_table(options.export_dir, "chat_history", since=options.since, until=options.until,
+                      columns=CHAT_COLUMNS)
+    if not chat:
+        print(f"No exported chat history in {options.export_dir}.")
+        return
+    volumes = daily_volumes(chat)
+    print("day        | user msgs | replies | active users | mean reply chars")
+    for i, day in enumerate(volumes["day"]):
+        print(f"{day} | {volumes['user_messages'][i]:>9} | {volumes['bot_messages'][i]:>7} | "
+              f"{volumes['active_users'][i]:>12} | {volumes['mean_reply_chars'][i]:>16.0f}")
+
+    lengths = response_lengths(chat)
+    print(f"\nreply length: {lengths['count']} replies | mean {lengths['mean']:.0f} | p50 {lengths['p50']:.0f} | "
+          f"p95 {lengths['p95']:.0f} | max {lengths['max']:.0f} characters")
+
+    records = GSheetsService(snapshot_path=options.topics_from).records
+    topics = [record.get("topic") for record in records if record.get("topic")]
+    if topics:
+        print("\ntopic | user messages")
+        for topic, count in topic_frequencies(chat, topics).items():
+            print(f"{topic} | {count}")
+    else:
+        print(f"\nNo knowledge-base topics in {options.topics_from}; skipping topic frequencies.")
+
+    if options.spans:
+        print("\nstage | spans | p50 ms | p95 ms | p99 ms")
+        for name, latency in sorted(stage_latency(read_spans(options.spans)).items()):
+            print(f"{name} | {latency['count']} | {latency['p50'] * 1000:.1f} | {latency['p95'] * 1000:.1f} | "
+                  f"{latency['p99'] * 1000:.1f}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export chat history for offline analysis and report on it.")
+    parser.add_argument("--export-dir", default=settings.ANALYTICS_EXPORT_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="copy new chat_history rows and a users snapshot")
+    export.add_argument("--page-size", type=int, default=settings.ANALYTICS_PAGE_SIZE)
+    export.add_argument("--max-pages", type=int, default=None)
+    export.add_argument("--settle-seconds", type=float, default=settings.ANALYTICS_SETTLE_SECONDS)
+    export.add_argument("--skip-users", action="store_true")
+    report = commands.add_parser("report", help="daily volumes, reply lengths, topics and stage latency")
+    report.add_argument("--since", help="first day, e.g. 2025-01-01")
+    report.add_argument("--until", help="last day, inclusive")
+    report.add_argument("--topics-from", default=settings.GSHEETS_SNAPSHOT_PATH,
+                        help="knowledge-base snapshot whose topics are counted")
+    report.add_argument("--spans", help="file of span JSON lines (tracer log) for per-stage latency")
+    options = parser.parse_args(argv)
+
+    if options.command == "export":
+        result = asyncio.run(_export(options))
+        print(f"exported {result.messages} messages (up to id {result.last_id}) and {result.users} users "
+              f"in {result.files} files")
+    else:
+        _report(options)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
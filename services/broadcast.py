@@ -0,0 +1,398 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from services.metrics import registry
+from services.profile import PROFILE_FIELDS
+from services.sms_dispatcher import SendError, SmsDispatcher
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BROADCAST_MESSAGES = registry.counter(
+    "broadcast_messages_total", "Broadcast messages by outcome (sent, failed, skipped).", ("outcome",)
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id TEXT PRIMARY KEY,
+    templates TEXT NOT NULL,
+    filters TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    cursor TEXT,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class Broadcast(NamedTuple):
+    """
+    A broadcast and its progress. `cursor` is the last phone number up to
+    which every recipient has been handled; a resumed run starts after it.
+    """
+    id: str
+    templates: Dict[str, str]
+    filters: Dict[str, Any]
+    status: str
+    cursor: Optional[str]
+    sent: int
+    failed: int
+    skipped: int
+
+    def report(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in ("id", "status", "cursor", "sent", "failed", "skipped")}
+
+
+class BroadcastStore:
+    """
+    Broadcasts and their checkpoints in a local SQLite file, so an interrupted
+    broadcast can be resumed where it stopped, by this or another process.
+
+    A running broadcast is leased by one process at a time; every checkpoint
+    extends the lease, and a broadcast whose lease expired can be claimed again.
+    """
+    def __init__(self, path: str, lease_seconds: float = 120.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _row_to_broadcast(row: Tuple[Any, ...]) -> Broadcast:
+        return Broadcast(row[0], json.loads(row[1]), json.loads(row[2]), *row[3:])
+
+    def _create(self, broadcast_id: str, templates: Dict[str, str], filters: Dict[str, Any]) -> Broadcast:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO broadcasts (id, templates, filters, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (broadcast_id, json.dumps(templates), json.dumps(filters), now, now),
+            )
+        return Broadcast(broadcast_id, templates, filters, "pending", None, 0, 0, 0)
+
+    def _get(self, broadcast_id: str) -> Optional[Broadcast]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, templates, filters, status, cursor, sent, failed, skipped FROM broadcasts WHERE id = ?",
+                (broadcast_id,),
+            ).fetchone()
+        return self._row_to_broadcast(row) if row else None
+
+    def _claim(self, broadcast_id: Optional[str]) -> Optional[Broadcast]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, templates, filters, status, cursor, sent, failed, skipped FROM broadcasts "
+                    "WHERE status IN ('pending', 'running') AND lease_until <= ? AND (? IS NULL OR id = ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now, broadcast_id, broadcast_id),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE broadcasts SET status = 'running', lease_until = ?, updated_at = ? WHERE id = ?",
+                        (now + self.lease_seconds, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._row_to_broadcast(row)._replace(status="running") if row else None
+
+    def _checkpoint(self, broadcast_id: str, cursor: Optional[str], sent: int, failed: int, skipped: int,
+                    status: str) -> None:
+        now = time.time()
+        # A finished broadcast releases its lease at once
+        lease_until = now + self.lease_seconds if status == "running" else 0
+        with self._lock:
+            self._conn.execute(
+                "UPDATE broadcasts SET cursor = ?, sent = ?, failed = ?, skipped = ?, status = ?, "
+                "lease_until = ?, updated_at = ? WHERE id = ?",
+                (cursor, sent, failed, skipped, status, lease_until, now, broadcast_id),
+            )
+
+    async def create(self, broadcast_id: str, templates: Dict[str, str], filters: Dict[str, Any]) -> Broadcast:
+        """
+        Records a new broadcast. Raises sqlite3.IntegrityError if the id is taken.
+        """
+        return await asyncio.to_thread(self._create, broadcast_id, templates, filters)
+
+    async def get(self, broadcast_id: str) -> Optional[Broadcast]:
+        return await asyncio.to_thread(self._get, broadcast_id)
+
+    async def claim(self, broadcast_id: Optional[str] = None) -> Optional[Broadcast]:
+        """
+        Leases a pending or interrupted broadcast (the given one, or the oldest).
+        Returns None if there is none, or it is leased by another process.
+        """
+        return await asyncio.to_thread(self._claim, broadcast_id)
+
+    async def checkpoint(self, broadcast_id: str, cursor: Optional[str], sent: int, failed: int, skipped: int,
+                         status: str = "running") -> None:
+        await asyncio.to_thread(self._checkpoint, broadcast_id, cursor, sent, failed, skipped, status)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class _Batch:
+    # Consecutive recipients that are checkpointed together
+    __slots__ = ("last_phone", "remaining", "outcomes")
+
+    def __init__(self, last_phone: str, remaining: int):
+        self.last_phone = last_phone
+        self.remaining = remaining
+        self.outcomes: Dict[str, int] = {"sent": 0, "failed": 0, "skipped": 0}
+
+
+class _BroadcastRun:
+    """
+    One claimed broadcast being sent: a producer streams recipients into a
+    bounded queue, workers send to them, and finished batches are checkpointed
+    oldest first.
+    """
+    def __init__(self, engine: "BroadcastEngine", broadcast: Broadcast):
+        self.engine = engine
+        self.broadcast = broadcast
+        self.counts = {"sent": broadcast.sent, "failed": broadcast.failed, "skipped": broadcast.skipped}
+        self.cursor = broadcast.cursor
+        self.rendered: Dict[Tuple[str, str], bytes] = {}
+        self.batches: List[_Batch] = []
+        self.recipients: asyncio.Queue = asyncio.Queue(maxsize=engine.concurrency * 4)
+        self._checkpointing = asyncio.Lock()
+
+    async def send(self) -> None:
+        """
+        Sends to every recipient after the cursor. If the producer or a worker
+        fails, the others are cancelled and the error is raised, so the
+        producer never waits on a queue that no worker reads any more.
+        """
+        workers = [asyncio.create_task(self.work()) for _ in range(self.engine.concurrency)]
+        tasks = [asyncio.create_task(self.produce(len(workers)))] + workers
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def produce(self, workers: int) -> None:
+        async for rows in self.engine.db_service.iter_users(
+            self.broadcast.filters, page_size=self.engine.page_size, after=self.broadcast.cursor
+        ):
+            for start in range(0, len(rows), self.engine.checkpoint_every):
+                chunk = rows[start:start + self.engine.checkpoint_every]
+                batch = _Batch(chunk[-1]["phone_number"], len(chunk))
+                self.batches.append(batch)
+                for row in chunk:
+                    await self.recipients.put((row, batch))
+        for _ in range(workers):
+            await self.recipients.put(None)
+
+    async def work(self) -> None:
+        while True:
+            item = await self.recipients.get()
+            if item is None:
+                return
+            row, batch = item
+            try:
+                outcome = await self.engine._deliver(self.broadcast, row, self.rendered)
+            except Exception as e:
+                # _deliver handles SendError; anything else (a limiter or shared-state error) fails this recipient only
+                logger.warning(f"Broadcast {self.broadcast.id} to {row['phone_number']} failed: {type(e).__name__}: {e}")
+                outcome = "failed"
+            BROADCAST_MESSAGES.inc(outcome=outcome)
+            await self.handled(batch, outcome)
+
+    async def handled(self, batch: _Batch, outcome: str) -> None:
+        batch.outcomes[outcome] += 1
+        batch.remaining -= 1
+        if not self.batches or self.batches[0].remaining:
+            return
+        # Checkpoint the longest run of finished batches, oldest first
+        async with self._checkpointing:
+            finished = None
+            while self.batches and self.batches[0].remaining == 0:
+                finished = self.batches.pop(0)
+                for name, count in finished.outcomes.items():
+                    self.counts[name] += count
+            if finished is not None:
+                self.cursor = finished.last_phone
+                await self.checkpoint()
+
+    async def checkpoint(self, status: str = "running") -> None:
+        await self.engine.store.checkpoint(self.broadcast.id, self.cursor, self.counts["sent"], self.counts["failed"],
+                                           self.counts["skipped"], status=status)
+
+
+class BroadcastEngine:
+    """
+    Sends a message to every user matching a profile filter, such as a
+    dengue or heatwave alert.
+
+    Recipients are streamed from the database in keyset-paginated pages, so
+    memory stays flat however many users match. The message for each
+    language is rendered once per sender number, and `concurrency` workers
+    send it, retrying rate limiting and server errors. Sends draw from the
+    dispatcher's per-number rate limit (see SmsDispatcher.acquire_bulk), so
+    a broadcast and chat replies together stay within it, and chat and
+    critical messages go first. Users whose language has no template get
+    the `default_language` one.
+
+    Progress is checkpointed whenever `checkpoint_every` consecutive
+    recipients have been handled, so a broadcast interrupted by a restart
+    resumes after the last checkpoint. Recipients after the checkpoint that
+    were already sent to (fewer than `checkpoint_every` plus `concurrency`)
+    get the message again.
+    """
+    def __init__(
+        self,
+        db_service: Any,
+        dispatcher: SmsDispatcher,
+        store: BroadcastStore,
+        from_numbers: Dict[str, str],
+        concurrency: int = 20,
+        page_size: int = 1000,
+        checkpoint_every: int = 100,
+        max_attempts: int = 4,
+        retry_base_delay: float = 0.5,
+        default_language: str = "English",
+    ):
+        """
+        Args:
+            dispatcher: The SmsDispatcher that sends chat replies. Its sender (a
+                TwilioHttpSender, or a stand-in with the same render and
+                send_rendered methods) sends the broadcast.
+            from_numbers: Sender number by destination prefix: "" for SMS, "whatsapp:" for WhatsApp.
+        """
+        self.db_service = db_service
+        self.dispatcher = dispatcher
+        self.sender = dispatcher.sender
+        self.store = store
+        self.from_numbers = from_numbers
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.checkpoint_every = checkpoint_every
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.default_language = default_language
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def validate(templates: Dict[str, str], filters: Dict[str, Any]) -> None:
+        """
+        Raises ValueError for an empty template set or a filter on an unknown profile field.
+        """
+        if not templates or not all(isinstance(body, str) and body.strip() for body in templates.values()):
+            raise ValueError("A broadcast needs at least one non-empty template.")
+        unknown = set(filters) - set(PROFILE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown filter fields: {', '.join(sorted(unknown))}")
+
+    async def create(self, templates: Dict[str, str], filters: Optional[Dict[str, Any]] = None,
+                     broadcast_id: Optional[str] = None) -> Broadcast:
+        """
+        Records a broadcast and starts sending it in the background.
+        """
+        filters = filters or {}
+        self.validate(templates, filters)
+        broadcast = await self.store.create(broadcast_id or uuid.uuid4().hex, templates, filters)
+        self.start(broadcast.id)
+        return broadcast
+
+    def start(self, broadcast_id: Optional[str] = None) -> None:
+        """
+        Runs a broadcast in the background: the given one, or every unfinished one
+        (those interrupted by a restart) when no id is given.
+        """
+        async def run_logged():
+            try:
+                if broadcast_id:
+                    await self.run(broadcast_id)
+                else:
+                    while await self.run() is not None:
+                        pass
+            except Exception as e:
+                logger.error(f"Broadcast {broadcast_id or ''} stopped: {type(e).__name__}: {e}")
+
+        key = broadcast_id or "*"
+        if key not in self._tasks or self._tasks[key].done():
+            self._tasks[key] = asyncio.create_task(run_logged())
+
+    async def stop(self) -> None:
+        """
+        Stops running broadcasts; they resume from their last checkpoint when started again.
+        """
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    async def run(self, broadcast_id: Optional[str] = None) -> Optional[Broadcast]:
+        """
+        Claims a broadcast (see BroadcastStore.claim), sends it to completion and
+        returns its final state, or returns None if there was nothing to claim.
+        """
+        broadcast = await self.store.claim(broadcast_id)
+        if broadcast is None:
+            return None
+        logger.info(f"Broadcast {broadcast.id} {'resumed after ' + broadcast.cursor if broadcast.cursor else 'started'}.")
+        started = time.perf_counter()
+        run = _BroadcastRun(self, broadcast)
+        try:
+            await run.send()
+        except BaseException:
+            # Stopping leaves the broadcast leased until the lease expires; release it for a quick resume
+            await asyncio.shield(run.checkpoint(status="pending"))
+            raise
+        await run.checkpoint(status="done")
+        elapsed = time.perf_counter() - started
+        logger.info(f"Broadcast {broadcast.id} done in {elapsed:.1f}s: {run.counts}.")
+        return broadcast._replace(status="done", cursor=run.cursor, **run.counts)
+
+    def _from_number(self, to_number: str) -> Optional[str]:
+        prefix = "whatsapp:" if to_number.startswith("whatsapp:") else ""
+        return self.from_numbers.get(prefix)
+
+    async def _deliver(self, broadcast: Broadcast, row: Dict[str, Any], rendered: Dict[Tuple[str, str], bytes]) -> str:
+        to_number = row["phone_number"]
+        from_number = self._from_number(to_number)
+        language = row.get("language") if row.get("language") in broadcast.templates else self.default_language
+        if from_number is None or language not in broadcast.templates:
+            return "skipped"
+        payload = rendered.get((language, from_number))
+        if payload is None:
+            payload = rendered[(language, from_number)] = self.sender.render(from_number, broadcast.templates[language])
+
+        for attempt in range(1, self.max_attempts + 1):
+            await self.dispatcher.acquire_bulk(from_number)
+            try:
+                await self.sender.send_rendered(payload, to_number)
+                return "sent"
+            except SendError as e:
+                if not e.retryable or attempt == self.max_attempts:
+                    logger.warning(f"Broadcast {broadcast.id} to {to_number} failed: {e}")
+                    return "failed"
+                delay = self.retry_base_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.0)
+                await asyncio.sleep(max(delay, e.retry_after or 0.0))
+        return "failed"
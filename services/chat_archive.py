@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+from core.config import settings
+from core.files import atomic_write
+from services.metrics import registry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHAT_ARCHIVED = registry.counter(
+    "chat_archived_messages_total", "Chat messages moved from chat_history to the archive."
+)
+
+
+class ArchiveRun(NamedTuple):
+    messages: int
+    files: int
+    bytes_written: int
+
+
+def iter_archive(archive_dir: str, months: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    The archived messages, month by month ("2025-01"), optionally only `months`.
+
+    A run interrupted between writing a file and deleting its rows writes them
+    again on the next run, to the same file name; readers that need exact
+    counts should still de-duplicate on `id`.
+    """
+    for partition in sorted(glob.glob(os.path.join(archive_dir, "month=*"))):
+        if months is not None and os.path.basename(partition)[len("month="):] not in months:
+            continue
+        for path in sorted(glob.glob(os.path.join(partition, "*.jsonl.gz"))):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line)
+
+
+class ChatArchiver:
+    """
+    Moves chat turns older than the retention period out of chat_history.
+
+    The oldest rows are taken a page at a time, written to gzip-compressed
+    JSON Lines files partitioned by month (`month=2025-01/part-<first id>.jsonl.gz`),
+    and only deleted once their file is in place, so an interrupted run loses
+    nothing. Replies never need these turns: they read the per-user recent
+    window (see DatabaseService), which archiving leaves alone.
+
+    Run it from cron in one process: `python -m services.chat_archive`.
+    """
+    def __init__(
+        self,
+        db_service: Any,
+        archive_dir: str,
+        retention_days: float = 90,
+        page_size: int = 1000,
+        compresslevel: int = 6,
+    ):
+        self.db_service = db_service
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.page_size = page_size
+        self.compresslevel = compresslevel
+
+    def cutoff(self, now: Optional[datetime] = None) -> str:
+        now = now or datetime.now(timezone.utc)
+        return (now - timedelta(days=self.retention_days)).isoformat()
+
+    async def run(self, now: Optional[datetime] = None, max_pages: Optional[int] = None) -> ArchiveRun:
+        """
+        Archives every turn created before the cutoff, or `max_pages` pages of them.
+        """
+        before = self.cutoff(now)
+        messages = files = bytes_written = pages = 0
+        while max_pages is None or pages < max_pages:
+            rows = await self.db_service.old_chat_messages(before, limit=self.page_size)
+            if not rows:
+                break
+            by_month: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+            for row in rows:
+                by_month[str(row["created_at"])[:7]].append(row)
+            for month, month_rows in by_month.items():
+                bytes_written += await asyncio.to_thread(self._write_file, month, month_rows)
+                files += 1
+            await self.db_service.delete_chat_messages([row["id"] for row in rows])
+            CHAT_ARCHIVED.inc(len(rows))
+            messages += len(rows)
+            pages += 1
+            if len(rows) < self.page_size:
+                break
+        if messages:
+            logger.info(f"Archived {messages} chat messages older than {before} in {files} files.")
+        return ArchiveRun(messages, files, bytes_written)
+
+    def _write_file(self, month: str, rows: List[Dict[str, Any]]) -> int:
+        path = os.path.join(self.archive_dir, f"month={month}", f"part-{rows[0]['id']}.jsonl.gz")
+        with atomic_write(path) as f:
+            with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=self.compresslevel, mtime=0) as archive:
+                for row in rows:
+                    archive.write(json.dumps(row, separators=(",", ":"), default=str).encode("utf-8") + b"\n")
+            size = f.tell()
+        return size
+
+
+async def _archive(options: argparse.Namespace) -> ArchiveRun:
+    from services.database_service import DatabaseService
+
+    db_service = DatabaseService()
+    archiver = ChatArchiver(db_service, options.archive_dir, options.retention_days, options.page_size)
+    return await archiver.run(max_pages=options.max_pages)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Move old chat_history turns to compressed archive files.")
+    parser.add_argument("--archive-dir", default=settings.CHAT_ARCHIVE_DIR)
+    parser.add_argument("--retention-days", type=float, default=settings.CHAT_RETENTION_DAYS)
+    parser.add_argument("--page-size", type=int, default=settings.CHAT_ARCHIVE_PAGE_SIZE)
+    parser.add_argument("--max-pages", type=int, default=None)
+    result = asyncio.run(_archive(parser.parse_args(argv)))
+    print(f"archived {result.messages} messages in {result.files} files ({result.bytes_written} bytes)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
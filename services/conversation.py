@@ -0,0 +1,39 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Tuple
+
+
+class ConversationLocks:
+    """
+    One asyncio lock per conversation (phone number), so that a user's turns
+    never run concurrently in this process. Locks are created on demand and
+    dropped as soon as nobody holds or waits for them.
+    """
+    def __init__(self):
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+
+def combine_messages(messages: List[str]) -> str:
+    """
+    Joins messages a user sent in quick succession into a single turn.
+    """
+    return "\n".join(message for message in messages if message)
@@ -1,34 +1,167 @@
+import asyncio
 import logging
-from typing import Any, Dict, Optional, List
-
-from supabase import create_client, AsyncClient
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Optional, List
 
 from core.config import settings
 from models.schemas import User, ChatMessage
+from services.profile import CachedProfile
+from services.user_cache import SharedUserCache, UserCache
+from services.write_behind import BatchWriter
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
 
 # Configure logging for better debugging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Marks a client that has not been created yet (None means creating it failed)
+_UNSET = object()
+
 class DatabaseService:
     """
     Manages all asynchronous interactions with the Supabase database.
+    Reads of user profiles and recent chat history go through a write-through
+    UserCache, so returning users are usually served without a round trip.
+    Once started, chat messages are written behind through a BatchWriter that
+    turns messages from many conversations into bulk inserts.
+
+    With several worker processes, pass a SharedUserCache: it replaces the
+    in-process cache so that all processes see the same profiles and history.
+
+    With a `recent_window_size`, messages are written through the
+    insert_chat_messages database function, which also keeps each user's
+    last messages in one chat_recent row (migrations/001_chat_history_retention.sql),
+    and history is read from that row alone, however long chat_history grows.
+
+    The Supabase client library is imported and the client created on first
+    use, not at import time; `start()` does this off the event loop.
     """
-    def __init__(self):
+    def __init__(
+        self,
+        client: Optional["AsyncClient"] = None,
+        cache: Optional[UserCache] = None,
+        shared_cache: Optional[SharedUserCache] = None,
+        recent_window_size: Optional[int] = None,
+    ):
+        """
+        Args:
+            recent_window_size: Messages kept per user in chat_recent; 0 reads and
+                writes chat_history only. Defaults to CHAT_RECENT_WINDOW_SIZE if
+                CHAT_RECENT_WINDOW_ENABLED is set.
+        """
+        self.cache = cache or UserCache(
+            max_entries=settings.USER_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+            history_size=settings.USER_CACHE_HISTORY_SIZE,
+        )
+        self.shared_cache = shared_cache
+        if recent_window_size is None:
+            recent_window_size = settings.CHAT_RECENT_WINDOW_SIZE if settings.CHAT_RECENT_WINDOW_ENABLED else 0
+        self.recent_window_size = recent_window_size
+        self.chat_writer = BatchWriter(
+            self._insert_chat_messages,
+            name="chat_history",
+            max_batch_size=settings.CHAT_WRITE_BATCH_SIZE,
+            flush_interval=settings.CHAT_WRITE_FLUSH_SECONDS,
+            max_queue_size=settings.CHAT_WRITE_QUEUE_SIZE,
+            max_buffered=settings.CHAT_WRITE_MAX_BUFFERED,
+        )
+        self.init_error: Optional[str] = None
+        self._client = client if client is not None else _UNSET
+
+    @property
+    def supabase(self) -> Optional["AsyncClient"]:
+        """
+        The Supabase client, created on first access; None if it could not be created.
+        """
+        if self._client is _UNSET:
+            self._client = self._create_client()
+        return self._client
+
+    @supabase.setter
+    def supabase(self, client: Optional["AsyncClient"]) -> None:
+        self._client = client
+
+    def _create_client(self) -> Optional["AsyncClient"]:
         try:
+            from supabase import AsyncClient
+
             # FIX: Create an AsyncClient directly for all async operations
-            self.supabase: AsyncClient = AsyncClient(
-                settings.SUPABASE_URL, settings.SUPABASE_KEY
-            )
+            client = AsyncClient(settings.SUPABASE_URL, settings.SUPABASE_KEY)
             logger.info("Successfully initialized Supabase AsyncClient.")
+            self.init_error = None
+            return client
         except Exception as e:
             logger.error(f"Failed to initialize Supabase AsyncClient: {e}")
-            self.supabase = None
+            self.init_error = f"{type(e).__name__}: {e}"
+            return None
+
+    async def start(self) -> None:
+        """
+        Creates the client in a worker thread and starts the write-behind flusher
+        for chat messages. Raises RuntimeError if the client could not be created;
+        calling start() again retries.
+        """
+        if self._client is None:
+            self._client = _UNSET
+        if await asyncio.to_thread(lambda: self.supabase) is None:
+            raise RuntimeError(f"Supabase client unavailable ({self.init_error})")
+        self.chat_writer.start()
+
+    async def close(self) -> None:
+        """
+        Flushes queued chat messages to the database and stops the flusher.
+        """
+        await self.chat_writer.close()
+
+    # The cache is the in-process UserCache, or the SharedUserCache when one is given
+    async def _cached_user(self, phone_number: str) -> Optional[CachedProfile]:
+        if self.shared_cache is not None:
+            return await self.shared_cache.get_user(phone_number)
+        return self.cache.get_user(phone_number)
+
+    async def _cache_user(self, user: CachedProfile) -> None:
+        if self.shared_cache is not None:
+            await self.shared_cache.put_user(user)
+        else:
+            self.cache.put_user(user)
+
+    async def _cached_history(self, phone_number: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        if self.shared_cache is not None:
+            return await self.shared_cache.get_history(phone_number, limit)
+        return self.cache.get_history(phone_number, limit)
+
+    async def _cache_history(self, phone_number: str, history: List[Dict[str, Any]]) -> None:
+        if self.shared_cache is not None:
+            await self.shared_cache.set_history(phone_number, history)
+        else:
+            self.cache.set_history(phone_number, history)
+
+    async def _cache_message(self, message: ChatMessage) -> None:
+        if self.shared_cache is not None:
+            await self.shared_cache.append_message(message.phone_number, message.model_dump())
+        else:
+            self.cache.append_message(message.phone_number, message.model_dump())
+
+    async def get_profile(self, phone_number: str) -> Optional[CachedProfile]:
+        """
+        Like get_user, but returns the cached profile object itself, so returning
+        users' profiles are neither validated nor formatted again.
+        """
+        cached_user = await self._cached_user(phone_number)
+        if cached_user is not None:
+            return cached_user
+        return await self._fetch_user(phone_number)
 
     async def get_user(self, phone_number: str) -> Optional[Dict[str, Any]]:
         """
         Retrieves a user's profile from the 'users' table by their phone number.
         """
+        profile = await self.get_profile(phone_number)
+        return profile.to_dict() if profile is not None else None
+
+    async def _fetch_user(self, phone_number: str) -> Optional[CachedProfile]:
         if not self.supabase:
             logger.error("Supabase client not available.")
             return None
@@ -37,7 +170,9 @@ class DatabaseService:
             response = await self.supabase.table('users').select('*').eq('phone_number', phone_number).execute()
             if response.data:
                 logger.info(f"User found for phone number: {phone_number}")
-                return response.data[0]
+                profile = CachedProfile.from_row(response.data[0])
+                await self._cache_user(profile)
+                return profile
             else:
                 logger.info(f"No user found for phone number: {phone_number}")
                 return None
@@ -49,6 +184,7 @@ class DatabaseService:
         """
         Creates a new user or updates an existing one based on the phone number.
         This is also known as an 'upsert' operation.yoo
+        The cached profile is only replaced if the profile actually changed.
         """
         if not self.supabase:
             logger.error("Supabase client not available.")
@@ -58,20 +194,110 @@ class DatabaseService:
             # model_dump() converts the Pydantic model to a dictionary
             # upsert() will insert if the record doesn't exist, or update it if it does.
             await self.supabase.table('users').upsert(user_data.model_dump()).execute()
+            await self._cache_user(CachedProfile.from_user(user_data))
             logger.info(f"Upserted user profile for: {user_data.phone_number}")
         except Exception as e:
             logger.error(f"Database error during user upsert for {user_data.phone_number}: {e}")
 
+    async def iter_users(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        columns: str = 'phone_number, language',
+        page_size: int = 1000,
+        after: Optional[str] = None,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Streams the 'users' table in pages of `page_size` rows, ordered by phone number.
+
+        Pages are fetched with keyset pagination (phone_number > the last one
+        seen) rather than offsets, so each query is an index range scan and
+        the whole table is never held in memory. Rows changed during the scan
+        are seen at most once.
+
+        Args:
+            filters: Column values to match; a list or tuple value matches any of its items.
+            after: Start after this phone number, e.g. to resume a scan.
+
+        Raises:
+            RuntimeError: The Supabase client is not available.
+        """
+        if not self.supabase:
+            raise RuntimeError("Supabase client not available.")
+        while True:
+            query = self.supabase.table('users').select(columns)
+            for column, value in (filters or {}).items():
+                query = query.in_(column, list(value)) if isinstance(value, (list, tuple)) else query.eq(column, value)
+            if after is not None:
+                query = query.gt('phone_number', after)
+            response = await query.order('phone_number').limit(page_size).execute()
+            if response.data:
+                yield response.data
+            if len(response.data) < page_size:
+                return
+            after = response.data[-1]['phone_number']
+
+    async def iter_chat_messages(
+        self,
+        after_id: Optional[int] = None,
+        page_size: int = 1000,
+        columns: str = 'id, phone_number, sender, message_text, created_at',
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Streams the 'chat_history' table in pages of `page_size` rows, ordered by id.
+
+        Like iter_users, pages are fetched by keyset (id > the last one seen),
+        so a scan can be resumed from the last id it handled and only sees
+        rows inserted since.
+
+        Raises:
+            RuntimeError: The Supabase client is not available.
+        """
+        if not self.supabase:
+            raise RuntimeError("Supabase client not available.")
+        while True:
+            query = self.supabase.table('chat_history').select(columns)
+            if after_id is not None:
+                query = query.gt('id', after_id)
+            response = await query.order('id').limit(page_size).execute()
+            if response.data:
+                yield response.data
+            if len(response.data) < page_size:
+                return
+            after_id = response.data[-1]['id']
+
+    async def _write_chat_rows(self, rows: List[Dict[str, Any]]) -> None:
+        if self.recent_window_size:
+            params = {'messages': rows, 'window_size': self.recent_window_size}
+            await self.supabase.rpc('insert_chat_messages', params).execute()
+        else:
+            await self.supabase.table('chat_history').insert(rows).execute()
+
+    async def _insert_chat_messages(self, rows: List[Dict[str, Any]]) -> None:
+        # Called by the BatchWriter; errors propagate so the batch is retried
+        if not self.supabase:
+            logger.error(f"Supabase client not available; discarding {len(rows)} chat messages.")
+            return
+        await self._write_chat_rows(rows)
+        logger.info(f"Saved a batch of {len(rows)} messages to chat history.")
+
     async def save_chat_message(self, message: ChatMessage) -> None:
         """
-        Saves a single chat message to the 'chat_history' table.hi
+        Saves a single chat message to the 'chat_history' table.
+        While the write-behind flusher is running the message is queued for a
+        bulk insert instead; this only waits if the queue is full.
         """
+        if self.chat_writer.running:
+            await self.chat_writer.put(message.model_dump())
+            await self._cache_message(message)
+            return
+
         if not self.supabase:
             logger.error("Supabase client not available.")
             return
 
         try:
-            await self.supabase.table('chat_history').insert(message.model_dump()).execute()
+            await self._write_chat_rows([message.model_dump()])
+            await self._cache_message(message)
             logger.info(f"Saved message from '{message.sender}' to chat history.")
         except Exception as e:
             logger.error(f"Database error while saving chat message: {e}")
@@ -80,21 +306,75 @@ class DatabaseService:
         """
         Retrieves the most recent chat history for a given user.
         """
+        cached_history = await self._cached_history(phone_number, limit)
+        if cached_history is not None:
+            return cached_history
+
         if not self.supabase:
             logger.error("Supabase client not available.")
             return []
 
         try:
+            if self.recent_window_size:
+                response = (
+                    await self.supabase.table('chat_recent')
+                    .select('messages')
+                    .eq('phone_number', phone_number)
+                    .limit(1)
+                    .execute()
+                )
+                history = list(response.data[0]['messages']) if response.data else []
+                await self._cache_history(phone_number, history)
+                return history[-limit:] if limit > 0 else []
+
+            # Fetch at least a full cache window so later turns can be served from memory
+            fetch_limit = max(limit, self.cache.history_size)
             response = (
                 await self.supabase.table('chat_history')
                 .select('*')
                 .eq('phone_number', phone_number)
                 .order('created_at', desc=True)
-                .limit(limit)
+                # A turn's user and bot rows are inserted together and can share created_at
+                .order('id', desc=True)
+                .limit(fetch_limit)
                 .execute()
             )
             # The records are fetched in descending order, so we reverse them to get chronological order
-            return list(reversed(response.data))
+            history = list(reversed(response.data))
+            await self._cache_history(phone_number, history)
+            return history[-limit:] if limit > 0 else []
         except Exception as e:
             logger.error(f"Database error while getting chat history for {phone_number}: {e}")
             return []
+
+    async def old_chat_messages(self, before: str, limit: int = 1000) -> List[Dict[str, Any]]:
+        """
+        The oldest `limit` chat_history rows created before the `before` timestamp,
+        oldest first (an index range scan on created_at, id).
+
+        Raises:
+            RuntimeError: The Supabase client is not available.
+        """
+        if not self.supabase:
+            raise RuntimeError("Supabase client not available.")
+        response = (
+            await self.supabase.table('chat_history')
+            .select('*')
+            .lt('created_at', before)
+            .order('created_at')
+            .order('id')
+            .limit(limit)
+            .execute()
+        )
+        return response.data
+
+    async def delete_chat_messages(self, ids: List[Any]) -> None:
+        """
+        Deletes chat_history rows by id, e.g. once they have been archived.
+
+        Raises:
+            RuntimeError: The Supabase client is not available.
+        """
+        if not self.supabase:
+            raise RuntimeError("Supabase client not available.")
+        await self.supabase.table('chat_history').delete().in_('id', list(ids)).execute()
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from services.sms_dispatcher import SendError
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANGUAGE = "en"
+
+
+def load_replies(path: Union[str, Path]) -> Dict[str, str]:
+    """
+    Reads the emergency replies by language code from a JSON file.
+    """
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)["replies"]
+
+
+class LatencyWindow:
+    """
+    The most recent `size` latencies, for percentiles such as the p99.
+    """
+    def __init__(self, size: int = 1000):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, q: float) -> float:
+        """
+        The q-th percentile (0-100) of the window, or 0.0 if it is empty.
+        """
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": max(self._samples, default=0.0),
+        }
+
+
+class EmergencyLane:
+    """
+    A dedicated send path for emergency (108) replies.
+
+    The lane has its own queue and `concurrency` reserved workers that never
+    carry normal traffic, so an emergency reply does not wait behind AI
+    turns or queued chat replies. Reply payloads are rendered once per
+    language and sender number up front. Latency is measured from webhook
+    receipt to Twilio accepting the message and compared with `p99_target`.
+
+    Messages that still fail after `max_attempts` are handed to `on_failure`,
+    normally a durable job, so that no emergency reply is lost.
+    """
+    def __init__(
+        self,
+        sender: Any,
+        replies: Dict[str, str],
+        sender_numbers: List[str],
+        concurrency: int = 4,
+        max_attempts: int = 3,
+        retry_base_delay: float = 0.2,
+        p99_target: float = 1.0,
+        dispatcher: Optional[Any] = None,
+        on_failure: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    ):
+        self.sender = sender
+        self.replies = replies
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.p99_target = p99_target
+        self.dispatcher = dispatcher
+        self.on_failure = on_failure
+        self._rendered: Dict[Tuple[str, str], bytes] = {
+            (number, language): sender.render(number, text)
+            for number in sender_numbers
+            for language, text in replies.items()
+        }
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self.latency = LatencyWindow()
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not worker.done() for worker in self._workers)
+
+    def reply_for(self, language: str) -> str:
+        return self.replies.get(language) or self.replies[DEFAULT_LANGUAGE]
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """
+        Sends what is queued, then stops the workers.
+        """
+        if not self.running:
+            return
+        for _ in self._workers:
+            self._queue.put_nowait(None)
+        _, still_running = await asyncio.wait(self._workers, timeout=timeout)
+        for worker in still_running:
+            worker.cancel()
+        self._workers = []
+
+    def submit(self, from_number: str, to_number: str, language: str, received_at: Optional[float] = None) -> None:
+        """
+        Queues the emergency reply and returns at once.
+
+        Args:
+            received_at: time.perf_counter() when the webhook received the message.
+        """
+        self.start()
+        language = language if (from_number, language) in self._rendered else DEFAULT_LANGUAGE
+        self._queue.put_nowait((from_number, to_number, language, received_at or time.perf_counter()))
+
+    def stats(self) -> Dict[str, Any]:
+        latency = self.latency.summary()
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "latency_seconds": latency,
+            "p99_target_seconds": self.p99_target,
+            "p99_target_met": latency["p99"] <= self.p99_target,
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            await self._deliver(*item)
+
+    async def _deliver(self, from_number: str, to_number: str, language: str, received_at: float) -> None:
+        rendered = self._rendered.get((from_number, language))
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if self.dispatcher is not None:
+                    self.dispatcher.borrow(from_number)
+                if rendered is not None:
+                    await self.sender.send_rendered(rendered, to_number)
+                else:
+                    await self.sender.send(from_number, to_number, self.reply_for(language))
+            except Exception as e:
+                retryable = isinstance(e, SendError) and e.retryable
+                if retryable and attempt < self.max_attempts:
+                    # Short backoff: an emergency reply should not wait for Retry-After
+                    await asyncio.sleep(self.retry_base_delay * attempt * random.uniform(0.5, 1.0))
+                    continue
+                await self._fail(to_number, language, e)
+                return
+            else:
+                elapsed = time.perf_counter() - received_at
+                self.latency.add(elapsed)
+                self.sent += 1
+                if elapsed > self.p99_target:
+                    logger.warning(f"Emergency reply to {to_number} took {elapsed:.2f}s (target {self.p99_target:.2f}s)")
+                return
+
+    async def _fail(self, to_number: str, language: str, error: Exception) -> None:
+        self.failed += 1
+        logger.error(f"Emergency reply to {to_number} failed: {error}")
+        if self.on_failure is not None:
+            try:
+                await self.on_failure(to_number, self.reply_for(language))
+            except Exception as e:
+                logger.error(f"Could not hand over emergency reply to {to_number}: {e}")
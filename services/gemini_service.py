@@ -1,9 +1,17 @@
+import asyncio
 import logging
-import google.generativeai as genai
-from typing import List, Dict, Any
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Iterator, List, Dict, Any, Optional
 
 from core.config import settings
-from models.schemas import User
+from services.profile import AnyProfile, profile_fragment
+from services.response_cache import ResponseCache
+from services.resilience import AdaptiveLimiter, CircuitBreaker, Overloaded, is_overload
+from services.retrieval import build_context, format_record
+from services.prompt_builder import PromptBuilder
+from services.metrics import registry
+from services.tracing import tracer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -11,72 +19,281 @@ logger = logging.getLogger(__name__)
 
 # Define the system instruction as a constant for clarity
 SYSTEM_INSTRUCTION = """You are Arogya Mitra, a friendly, empathetic, and helpful AI public health assistant for the people of Odisha. Your goal is to provide safe, general health information and guidance... Always conclude your health-related advice with a clear disclaimer to consult a registered medical practitioner. **Crucially, keep your responses concise and to the point, ideally under 1500 characters.**"""
+UNAVAILABLE_MESSAGE = "I'm sorry, my AI service is currently unavailable. Please try again later."
+ERROR_MESSAGE = "I'm sorry, I was unable to process your request. Please ask in a different way or try again later."
+# Sent with a vetted knowledge-base row when Gemini is overloaded or down
+FALLBACK_PREFIX = "Our AI assistant is very busy right now. Here is vetted health information that may help:\n"
+FALLBACK_DISCLAIMER = "\nPlease consult a registered medical practitioner for advice about your situation."
+
+# Marks a model that has not been created yet (None means creating it failed)
+_UNSET = object()
+
+GEMINI_TOKENS = registry.counter("gemini_tokens_total", "Gemini tokens used, from the response usage metadata.", ("type",))
+GEMINI_DEGRADED = registry.counter(
+    "gemini_degraded_total", "AI answers replaced by a knowledge-base or apology message, by reason.", ("reason",)
+)
+
+
+def record_usage(response: Any, span: Any = None) -> None:
+    """
+    Adds the prompt and completion token counts of a response to the metrics (and the span, if given).
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    completion_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    GEMINI_TOKENS.inc(prompt_tokens, type="prompt")
+    GEMINI_TOKENS.inc(completion_tokens, type="completion")
+    if span is not None:
+        span.set_attribute("prompt_tokens", prompt_tokens)
+        span.set_attribute("completion_tokens", completion_tokens)
+
+
 class GeminiService:
     """
     Manages all interactions with the Google Gemini API.
+    Answers are cached (see ResponseCache) so repeated questions skip the API,
+    and prompts include the vetted knowledge-base rows relevant to the message.
+    Prompts are assembled within a token budget by PromptBuilder; the system
+    instruction is set once on the model instead of being resent every turn.
+
+    Calls are guarded: an AdaptiveLimiter caps concurrent calls, every call
+    has a deadline, and a CircuitBreaker stops calling Gemini while it keeps
+    failing. Answers that cannot be generated for those reasons are replaced
+    by the best matching knowledge-base row (see `fallback_answer`).
+
+    The google.generativeai client is imported and configured on first use,
+    not at import time; `start()` does this off the event loop at startup.
     """
-    def __init__(self):
+    def __init__(
+        self,
+        model: Optional[Any] = None,
+        response_cache: Optional[ResponseCache] = None,
+        knowledge_base: Optional[Any] = None,
+        prompt_builder: Optional[PromptBuilder] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
         """
-        Configures the Generative AI client and initializes the model.
+        Sets up the service. The Gemini model is created on first use (or by start()).
+
+        Args:
+            knowledge_base: Optional object with a retrieve(message, k) method,
+                normally the GSheetsService.
+        """
+        self.knowledge_base = knowledge_base
+        self.prompt_builder = prompt_builder or PromptBuilder(
+            max_tokens=settings.PROMPT_MAX_TOKENS,
+            summary_max_tokens=settings.PROMPT_SUMMARY_MAX_TOKENS,
+            summary_cache_size=settings.PROMPT_SUMMARY_CACHE_SIZE,
+        )
+        self.response_cache = response_cache or ResponseCache(
+            max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+            similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD or None,
+        )
+        self.limiter = limiter or AdaptiveLimiter(
+            initial_limit=settings.GEMINI_CONCURRENCY_INITIAL,
+            min_limit=settings.GEMINI_CONCURRENCY_MIN,
+            max_limit=settings.GEMINI_CONCURRENCY_MAX,
+            latency_target=settings.GEMINI_LATENCY_TARGET_SECONDS,
+        )
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=settings.GEMINI_BREAKER_FAILURES,
+            reset_timeout=settings.GEMINI_BREAKER_RESET_SECONDS,
+        )
+        self.timeout = settings.GEMINI_TIMEOUT_SECONDS
+        self.first_chunk_timeout = settings.GEMINI_FIRST_CHUNK_TIMEOUT_SECONDS
+        self.queue_timeout = settings.GEMINI_QUEUE_TIMEOUT_SECONDS
+        self.init_error: Optional[str] = None
+        self._model = model if model is not None else _UNSET
+
+    @property
+    def model(self) -> Optional[Any]:
         """
+        The Gemini model, created on first access; None if it could not be configured.
+        """
+        if self._model is _UNSET:
+            self._model = self._create_model()
+        return self._model
+
+    @model.setter
+    def model(self, model: Optional[Any]) -> None:
+        self._model = model
+
+    def _create_model(self) -> Optional[Any]:
         try:
+            # Imported here: loading the client library takes over a second
+            import google.generativeai as genai
+
             genai.configure(api_key=settings.GEMINI_API_KEY)
             # CORRECT
-            self.model = genai.GenerativeModel('gemini-1.5-flash-latest')
+            model = genai.GenerativeModel('gemini-1.5-flash-latest', system_instruction=SYSTEM_INSTRUCTION)
             logger.info("Gemini Pro model initialized successfully.")
+            self.init_error = None
+            return model
         except Exception as e:
             logger.error(f"Failed to configure Gemini client: {e}")
-            self.model = None
+            self.init_error = f"{type(e).__name__}: {e}"
+            return None
 
-    async def get_ai_response(self, user_message: str, user_profile: User, chat_history: List[Dict[str, Any]]) -> str:
+    async def start(self) -> None:
         """
-        Constructs a detailed prompt and gets a response from the Gemini API.
+        Creates the model in a worker thread. Raises RuntimeError if it could not be
+        configured; calling start() again retries.
         """
-        if not self.model:
-            logger.error("Gemini model not available.")
-            return "I'm sorry, my AI service is currently unavailable. Please try again later."
+        if self._model is None:
+            self._model = _UNSET
+        if await asyncio.to_thread(lambda: self.model) is None:
+            raise RuntimeError(f"Gemini client unavailable ({self.init_error})")
 
-        try:
-            # 1. Format the user's health profile for the AI
-            profile_details = f"Language: {user_profile.language}, Age: {user_profile.age or 'Not provided'}"
-            if user_profile.has_diabetes:
-                profile_details += ", Condition: Diabetes"
-            if user_profile.has_hypertension:
-                profile_details += ", Condition: Hypertension"
-            if user_profile.other_conditions:
-                profile_details += f", Other Conditions: {user_profile.other_conditions}"
+    def _knowledge_context(self, user_message: str) -> str:
+        if self.knowledge_base is None:
+            return ""
+        rows = self.knowledge_base.retrieve(user_message, k=settings.RAG_TOP_K)
+        return build_context(rows, settings.RAG_MAX_CONTEXT_TOKENS)
 
-            # 2. Format the recent chat history for context
-            history_text = "\n".join([f"{msg['sender'].capitalize()}: {msg['message_text']}" for msg in chat_history])
+    def fallback_answer(self, user_message: str, reason: str) -> str:
+        """
+        The answer sent instead of Gemini's: the most relevant knowledge-base row, or an apology.
+        """
+        GEMINI_DEGRADED.inc(reason=reason)
+        logger.warning(f"Answering without Gemini ({reason}).")
+        rows = self.knowledge_base.retrieve(user_message, k=1) if self.knowledge_base is not None else []
+        if not rows:
+            return UNAVAILABLE_MESSAGE
+        return FALLBACK_PREFIX + format_record(rows[0].record) + FALLBACK_DISCLAIMER
 
-            # 3. Construct the final, multi-part prompt
-            full_prompt = f"""
-            **System Instruction:**
-            {SYSTEM_INSTRUCTION}
+    def _record_outcome(self, error: Optional[BaseException]) -> None:
+        # Only overload and outages count against the breaker; a bad request still means the API is up
+        if error is not None and is_overload(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
 
-            ---
+    def _build_prompt(self, user_message: str, user_profile: AnyProfile, chat_history: List[Dict[str, Any]]) -> str:
+        # 1. Format the user's health profile for the AI (precomputed for cached profiles)
+        profile_details = profile_fragment(user_profile)
 
-            **User's Health Profile:**
-            {profile_details}
+        # 2. Find vetted knowledge-base rows for the message, within the token budget
+        knowledge_text = self._knowledge_context(user_message)
 
-            ---
+        # 3. Construct the prompt; older history is summarized to fit the budget
+        return self.prompt_builder.build(
+            user_message=user_message,
+            profile_details=profile_details,
+            chat_history=chat_history,
+            knowledge_text=knowledge_text,
+            conversation_id=user_profile.phone_number,
+        )
 
-            **Recent Conversation History:**
-            {history_text}
+    async def get_ai_response(self, user_message: str, user_profile: AnyProfile, chat_history: List[Dict[str, Any]]) -> str:
+        """
+        Constructs a detailed prompt and gets the whole response from the Gemini API (see stream_ai_response).
+        """
+        return "".join([part async for part in self.stream_ai_response(user_message, user_profile, chat_history)])
 
-            ---
+    async def stream_ai_response(
+        self, user_message: str, user_profile: AnyProfile, chat_history: List[Dict[str, Any]]
+    ) -> AsyncIterator[str]:
+        """
+        Yields the answer in pieces while Gemini generates it.
+        Cached answers are yielded in one piece. If the API fails before any text
+        was generated, the usual apology (or fallback answer) is yielded instead.
+        The first chunk must arrive within `first_chunk_timeout` and the whole
+        answer within `timeout` seconds.
+        """
+        answer = self._answer_without_gemini(user_message, user_profile, chat_history)
+        if answer is not None:
+            yield answer
+            return
 
-            **Current User Message:**
-            {user_message}
-            """
+        # allow() may have handed out the breaker's single half-open trial; every way out releases it
+        parts: List[str] = []
+        try:
+            with self._settling_trial(lambda error: self.breaker.record_failure()):
+                full_prompt = self._build_prompt(user_message, user_profile, chat_history)
+            with self._settling_trial(self._record_outcome):
+                async with self.limiter.slot(self.queue_timeout):
+                    started = time.perf_counter()
+                    async for text in self._stream_chunks(full_prompt):
+                        parts.append(text)
+                        yield text
+                    latency = time.perf_counter() - started
+                self._record_outcome(None)
+            self.response_cache.put(user_message, user_profile, chat_history, "".join(parts), latency=latency)
+        except Overloaded:
+            yield self.fallback_answer(user_message, "overloaded")
+        except Exception as e:
+            # Handle API errors, including safety blocks; text already sent to the user stays sent
+            logger.error(f"An error occurred with the Gemini API: {type(e).__name__}: {e}")
+            if not parts:
+                yield self._error_answer(user_message, e)
 
-            # 4. Send the prompt to the API asynchronously
-            response = await self.model.generate_content_async(full_prompt)
-            
-            # 5. Safely extract and return the text
-            return response.text
+    def _answer_without_gemini(
+        self, user_message: str, user_profile: AnyProfile, chat_history: List[Dict[str, Any]]
+    ) -> Optional[str]:
+        # The answer when Gemini is not asked at all: no model, a cached answer, or an open breaker
+        if not self.model:
+            logger.error("Gemini model not available.")
+            return UNAVAILABLE_MESSAGE
+        cached_response = self.response_cache.get(user_message, user_profile, chat_history)
+        if cached_response is not None:
+            logger.info("Answered from the response cache.")
+            return cached_response
+        if not self.breaker.allow():
+            return self.fallback_answer(user_message, "circuit_open")
+        return None
 
+    @contextmanager
+    def _settling_trial(self, on_error: Callable[[Exception], None]) -> Iterator[None]:
+        """
+        Reports to the breaker how the block ended, if it did not finish: `on_error`
+        for an exception, and a skipped call when no slot was free, when the
+        consumer closed the stream or when the task was cancelled.
+        """
+        try:
+            yield
+        except Overloaded:
+            self.breaker.record_skipped()
+            raise
         except Exception as e:
-            # Handle API errors, including safety blocks
-            logger.error(f"An error occurred with the Gemini API: {e}")
-            return "I'm sorry, I was unable to process your request. Please ask in a different way or try again later."
+            on_error(e)
+            raise
+        except BaseException:
+            self.breaker.record_skipped()
+            raise
+
+    def _error_answer(self, user_message: str, error: Exception) -> str:
+        if is_overload(error):
+            return self.fallback_answer(user_message, "timeout" if isinstance(error, asyncio.TimeoutError) else "error")
+        return ERROR_MESSAGE
+
+    async def _stream_chunks(self, full_prompt: str) -> AsyncIterator[str]:
+        """
+        Yields the text of each chunk Gemini streams, within the first-chunk and
+        overall deadlines.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        deadline = loop.time() + self.timeout
+        first_deadline = loop.time() + min(self.first_chunk_timeout, self.timeout)
+        last_chunk = None
+        response = await asyncio.wait_for(
+            self.model.generate_content_async(full_prompt, stream=True), first_deadline - loop.time()
+        )
+        chunks = response.__aiter__()
+        while True:
+            remaining = (deadline if last_chunk is not None else first_deadline) - loop.time()
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), max(remaining, 0.0))
+            except StopAsyncIteration:
+                break
+            if last_chunk is None:
+                tracer.record("gemini.first_chunk", time.perf_counter() - started)
+            last_chunk = chunk
+            yield chunk.text
+        # Streamed responses report usage on the final chunk
+        tracer.record("gemini.generate", time.perf_counter() - started)
+        record_usage(last_chunk)
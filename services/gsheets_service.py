@@ -1,51 +1,284 @@
-import gspread
+import asyncio
+import fcntl
+import hashlib
 import json
 import logging
-from typing import Dict, Optional, List, Any
+import mmap
+import os
+import time
+from typing import Dict, NamedTuple, Optional, List, Any, Tuple
 
 from core.config import settings
+from core.files import atomic_write
+from services.knowledge_index import KnowledgeIndex, SearchResult
+from services.retrieval import KnowledgeRetriever, RetrievedRow
 
 # Configure logging for better debugging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class GSheetsService:
+class GspreadSheetBackend:
     """
-    Manages connection to and retrieval of data from the Google Sheet knowledge base.
-    The sheet data is loaded into memory on initialization for fast lookups.
+    Reads the knowledge base from a Google Sheet through gspread.
+    gspread is imported and authentication happens on the first fetch, never at import time.
     """
     def __init__(self, sheet_name: str = "HealthDB"):
+        self.sheet_name = sheet_name
+        self._worksheet = None
+
+    def fetch_records(self) -> List[Dict[str, Any]]:
         """
-        Initializes the service by authenticating with Google Sheets and .
-        loading the entire first worksheet into an in-memory list.
+        Downloads every row of the first worksheet. This is a blocking call.
         """
-        self.records: List[Dict[str, Any]] = []
-        try:
+        if self._worksheet is None:
+            import gspread
+
             # Parse the JSON string from the environment variable into a dict
             creds_json = json.loads(settings.GOOGLE_APPLICATION_CREDENTIALS_JSON)
-            
+
             # Authenticate with Google Sheets using the parsed credentials
             gc = gspread.service_account_from_dict(creds_json)
-            
+
             # Open the workbook and select the first sheet
-            spreadsheet = gc.open(sheet_name)
-            worksheet = spreadsheet.sheet1
-            
-            # Load all records from the worksheet into a list of dictionaries
-            self.records = worksheet.get_all_records()
-            
-            logger.info(f"Successfully loaded {len(self.records)} records from Google Sheet '{sheet_name}'.")
+            try:
+                self._worksheet = gc.open(self.sheet_name).sheet1
+            except gspread.exceptions.SpreadsheetNotFound:
+                raise LookupError(f"Google Sheet '{self.sheet_name}' not found. Check the name and sharing settings.")
+
+        # Load all records from the worksheet into a list of dictionaries
+        return self._worksheet.get_all_records()
+
+
+class FakeSheetBackend:
+    """
+    An in-memory stand-in for the Google Sheet, for tests and local runs.
+    Set `error` to make the next fetches raise it.
+    """
+    def __init__(self, records: Optional[List[Dict[str, Any]]] = None):
+        self.records: List[Dict[str, Any]] = list(records or [])
+        self.error: Optional[Exception] = None
+        self.fetch_count = 0
+
+    def fetch_records(self) -> List[Dict[str, Any]]:
+        self.fetch_count += 1
+        if self.error:
+            raise self.error
+        return [dict(record) for record in self.records]
+
+
+class KnowledgeSnapshot(NamedTuple):
+    """
+    One consistent view of the knowledge base. Replaced as a whole on refresh.
+    """
+    records: List[Dict[str, Any]]
+    index: KnowledgeIndex
+    retriever: KnowledgeRetriever
+    digest: str
+
+    @classmethod
+    def build(cls, records: List[Dict[str, Any]], digest: Optional[str] = None) -> "KnowledgeSnapshot":
+        return cls(records, KnowledgeIndex(records), KnowledgeRetriever(records), digest or _digest(records))
+
+
+def _digest(records: List[Dict[str, Any]]) -> str:
+    payload = json.dumps(records, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GSheetsService:
+    """
+    Manages connection to and retrieval of data from the Google Sheet knowledge base.
+    The sheet data is kept in memory and indexed once per load: KnowledgeIndex
+    for exact and typo-tolerant topic lookups, KnowledgeRetriever for finding
+    the rows relevant to a free-text message.
+
+    Startup never waits on Google: `start()` loads the last good snapshot from a
+    local file and refreshes from the sheet in the background. The snapshot is
+    also loaded on first use if the service was never started.
+    Each refresh builds a new index off the event loop and swaps it in atomically.
+
+    Worker processes share the snapshot file: the one that holds the lock on
+    '<snapshot>.lock' downloads the sheet, and the others reload the
+    memory-mapped file whenever it changes, instead of each downloading it.
+    """
+    def __init__(
+        self,
+        sheet_name: str = "HealthDB",
+        backend: Optional[Any] = None,
+        snapshot_path: Optional[str] = None,
+        refresh_interval: Optional[float] = None,
+        follow_interval: Optional[float] = None,
+    ):
+        """
+        Initializes the service. Nothing is read until first use or start().
+
+        Args:
+            sheet_name: Name of the Google Sheet workbook.
+            backend: Object with a blocking fetch_records() method. Defaults to gspread.
+            snapshot_path: Where the last good snapshot is stored. Defaults to settings.
+            refresh_interval: Seconds between background refreshes. Defaults to settings.
+            follow_interval: Seconds between checks of the snapshot file by processes
+                that do not download the sheet. Defaults to settings.
+        """
+        self.sheet_name = sheet_name
+        self.backend = backend or GspreadSheetBackend(sheet_name)
+        self.snapshot_path = snapshot_path or settings.GSHEETS_SNAPSHOT_PATH
+        self.refresh_interval = refresh_interval if refresh_interval is not None else settings.GSHEETS_REFRESH_SECONDS
+        self.follow_interval = follow_interval if follow_interval is not None else settings.GSHEETS_FOLLOW_SECONDS
+        self._snapshot: Optional[KnowledgeSnapshot] = None
+        self._snapshot_version: Optional[Tuple[int, int]] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._lock_file: Optional[Any] = None
+
+    def _current(self) -> KnowledgeSnapshot:
+        if self._snapshot is None:
+            self._snapshot_version = self._file_version()
+            records = self._read_snapshot()
+            if records is None:
+                self._snapshot = KnowledgeSnapshot.build([])
+            else:
+                self._snapshot = KnowledgeSnapshot.build(records)
+                logger.info(f"Loaded {len(records)} records from snapshot '{self.snapshot_path}'.")
+        return self._snapshot
+
+    @property
+    def records(self) -> List[Dict[str, Any]]:
+        return self._current().records
+
+    @property
+    def index(self) -> KnowledgeIndex:
+        return self._current().index
+
+    def _file_version(self) -> Optional[Tuple[int, int]]:
+        # Snapshots are replaced by rename, so a new file also has a new inode
+        try:
+            stat = os.stat(self.snapshot_path)
+            return stat.st_ino, stat.st_mtime_ns
+        except OSError:
+            return None
+
+    def _reload_if_changed(self) -> bool:
+        """
+        Loads the snapshot file again if another process has replaced it.
+        """
+        version = self._file_version()
+        if version is None or version == self._snapshot_version:
+            return False
+        self._snapshot_version = version
+        records = self._read_snapshot()
+        if records is None:
+            return False
+        digest = _digest(records)
+        if self._snapshot is not None and digest == self._snapshot.digest:
+            return False
+        self._snapshot = KnowledgeSnapshot.build(records, digest)
+        logger.info(f"Reloaded {len(records)} records from snapshot '{self.snapshot_path}'.")
+        return True
+
+    def _try_lead(self) -> bool:
+        # Whether this process downloads the sheet; the lock is held until stop()
+        if self._lock_file is not None:
+            return True
+        os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+        lock_file = open(self.snapshot_path + ".lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info(f"This process refreshes '{self.snapshot_path}' from Google Sheets.")
+        return True
+
+    def _read_snapshot(self) -> Optional[List[Dict[str, Any]]]:
+        try:
+            with open(self.snapshot_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return json.loads(mapped[:])["records"]
+        except FileNotFoundError:
+            logger.info(f"No knowledge-base snapshot at '{self.snapshot_path}' yet.")
+        except (ValueError, KeyError, OSError) as e:
+            logger.error(f"Ignoring unreadable knowledge-base snapshot '{self.snapshot_path}': {e}")
+        return None
+
+    def _write_snapshot(self, records: List[Dict[str, Any]]) -> None:
+        payload = {"sheet": self.sheet_name, "saved_at": time.time(), "records": records}
+        with atomic_write(self.snapshot_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"), default=str)
+        self._snapshot_version = self._file_version()
+
+    async def refresh(self) -> bool:
+        """
+        Downloads the sheet and swaps in a new index if the content changed.
 
+        Returns:
+            True if a new snapshot was installed, False if the sheet was unchanged
+            or could not be read (the previous snapshot is kept in that case).
+        """
+        try:
+            records = await asyncio.to_thread(self.backend.fetch_records)
         except json.JSONDecodeError:
             logger.error("Failed to parse GOOGLE_APPLICATION_CREDENTIALS_JSON. Check the .env file format.")
-        except gspread.exceptions.SpreadsheetNotFound:
-            logger.error(f"Google Sheet '{sheet_name}' not found. Check the name and sharing settings.")
+            return False
+        except LookupError as e:
+            logger.error(str(e))
+            return False
         except Exception as e:
             logger.error(f"An unexpected error occurred while connecting to Google Sheets: {e}")
+            return False
+
+        digest = _digest(records)
+        if digest == (await asyncio.to_thread(self._current)).digest:
+            logger.info(f"Google Sheet '{self.sheet_name}' is unchanged; keeping the current index.")
+            return False
+
+        self._snapshot = await asyncio.to_thread(KnowledgeSnapshot.build, records, digest)
+        logger.info(f"Successfully loaded {len(records)} records from Google Sheet '{self.sheet_name}'.")
+
+        try:
+            await asyncio.to_thread(self._write_snapshot, records)
+        except OSError as e:
+            logger.error(f"Failed to save knowledge-base snapshot '{self.snapshot_path}': {e}")
+        return True
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            leader = await asyncio.to_thread(self._try_lead)
+            if leader:
+                await self.refresh()
+            else:
+                await asyncio.to_thread(self._reload_if_changed)
+            if self.refresh_interval <= 0:
+                return
+            await asyncio.sleep(self.refresh_interval if leader else min(self.refresh_interval, self.follow_interval))
+
+    async def start(self) -> None:
+        """
+        Loads the local snapshot off the event loop and starts refreshing from the
+        sheet (or following the snapshot file) in the background. Does not wait for Google.
+        """
+        await asyncio.to_thread(self._current)
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        """
+        Stops the background refresh task and lets another process take over refreshing.
+        """
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
 
     async def get_health_info(self, topic: str) -> Optional[Dict[str, Any]]:
         """
         Performs a case-insensitive search for a health topic in the loaded records.
+        Falls back to the best typo-tolerant match (e.g. 'dengu fever' -> 'Dengue').
 
         Args:
             topic: The health topic to search for (e.g., 'Dengue').
@@ -53,12 +286,40 @@ class GSheetsService:
         Returns:
             A dictionary representing the entire row if a match is found, otherwise None.
         """
-        search_topic = topic.lower()
-        for record in self.records:
-            # Ensure the 'topic' key exists and is a string before searching
-            if 'topic' in record and isinstance(record['topic'], str) and record['topic'].lower() == search_topic:
-                logger.info(f"Found health info for topic: {topic}")
-                return record
-        
+        record = self.index.get(topic)
+        if record is None:
+            results = self.index.search(topic, k=1)
+            record = results[0].record if results else None
+
+        if record is not None:
+            logger.info(f"Found health info for topic: {topic}")
+            return record
+
         logger.warning(f"No health info found for topic: {topic}")
         return None
+
+    async def search_health_info(self, query: str, k: int = 5, min_score: float = 0.3) -> List[SearchResult]:
+        """
+        Returns up to k ranked, typo-tolerant matches for a query.
+
+        Args:
+            query: Free text such as 'dengu fever'.
+            k: Maximum number of results.
+            min_score: Minimum trigram similarity (0-1) for a row to be returned.
+
+        Returns:
+            A list of SearchResult(score, topic, record), best first.
+        """
+        return self.index.search(query, k=k, min_score=min_score)
+
+    def retrieve(self, message: str, k: int = 3, min_score: float = 0.1) -> List[RetrievedRow]:
+        """
+        Returns the rows most relevant to a user's message (TF-IDF cosine similarity).
+        This is CPU-only and takes a few milliseconds even on large sheets.
+
+        Args:
+            message: The user's message.
+            k: Maximum number of rows.
+            min_score: Minimum cosine similarity (0-1) for a row to be returned.
+        """
+        return self._current().retriever.search(message, k=k, min_score=min_score)
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from services.metrics import registry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DUPLICATES_DROPPED = registry.counter(
+    "webhook_duplicates_dropped_total", "Webhook deliveries dropped because their MessageSid was already seen."
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_messages (
+    sid TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS seen_messages_seen_at_idx ON seen_messages (seen_at);
+"""
+
+
+class SeenSet:
+    """
+    The keys seen in the last `window_seconds`, at most `max_entries` of them
+    (the oldest are forgotten first).
+    """
+    def __init__(self, window_seconds: float, max_entries: int, clock: Callable[[], float] = time.monotonic):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def __contains__(self, key: str) -> bool:
+        self._expire()
+        return key in self._seen
+
+    def add(self, key: str) -> bool:
+        """
+        Records `key`. Returns False if it was already seen within the window.
+        """
+        self._expire()
+        if key in self._seen:
+            return False
+        self._seen[key] = self._clock()
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        return True
+
+    def discard(self, key: str) -> None:
+        self._seen.pop(key, None)
+
+    def _expire(self) -> None:
+        # Keys are kept in the order they were seen, so expired ones are at the front
+        cutoff = self._clock() - self.window_seconds
+        while self._seen and next(iter(self._seen.values())) <= cutoff:
+            self._seen.popitem(last=False)
+
+
+class SQLiteSeenStore:
+    """
+    Seen message SIDs in a local SQLite file, so duplicates are still recognized
+    after a restart and by the other worker processes on the host.
+    Rows older than the window are purged every `purge_every` inserts.
+    """
+    def __init__(self, path: str, window_seconds: float, purge_every: int = 1000):
+        self.path = path
+        self.window_seconds = window_seconds
+        self.purge_every = purge_every
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._inserts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _add(self, sid: str) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # An expired row for the same SID counts as unseen and is replaced
+                self._conn.execute("DELETE FROM seen_messages WHERE sid = ? AND seen_at <= ?",
+                                   (sid, now - self.window_seconds))
+                cursor = self._conn.execute("INSERT OR IGNORE INTO seen_messages (sid, seen_at) VALUES (?, ?)", (sid, now))
+                self._inserts += 1
+                if self._inserts % self.purge_every == 0:
+                    self._conn.execute("DELETE FROM seen_messages WHERE seen_at <= ?", (now - self.window_seconds,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount == 1
+
+    def _discard(self, sid: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM seen_messages WHERE sid = ?", (sid,))
+
+    async def add(self, sid: str) -> bool:
+        return await asyncio.to_thread(self._add, sid)
+
+    async def discard(self, sid: str) -> None:
+        await asyncio.to_thread(self._discard, sid)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class MessageDeduplicator:
+    """
+    Drops repeated deliveries of the same Twilio message (identified by its
+    MessageSid), such as the webhook retries Twilio makes after a timeout.
+
+    SIDs are remembered in memory for `window_seconds` and, if a store is
+    given, in the store too, which covers restarts and other processes.
+    Duplicates found in memory cost no I/O.
+    """
+    def __init__(self, window_seconds: float = 3600.0, max_entries: int = 100_000,
+                 store: Optional[SQLiteSeenStore] = None):
+        self.seen = SeenSet(window_seconds, max_entries)
+        self.store = store
+        self.accepted = 0
+        self.dropped = 0
+
+    async def first_delivery(self, sid: str) -> bool:
+        """
+        Records the SID. Returns False if the message was already delivered
+        within the window, in which case it should be dropped.
+        """
+        if sid in self.seen:
+            return self._drop(sid)
+        if self.store is not None:
+            try:
+                if not await self.store.add(sid):
+                    self.seen.add(sid)
+                    return self._drop(sid)
+            except sqlite3.Error as e:
+                # Better to risk a duplicate reply than to drop a new message
+                logger.error(f"Failed to check MessageSid {sid} against the seen store: {e}")
+        self.seen.add(sid)
+        self.accepted += 1
+        return True
+
+    async def forget(self, sid: str) -> None:
+        """
+        Forgets a SID whose message could not be queued, so that a retry is processed.
+        """
+        self.seen.discard(sid)
+        if self.store is not None:
+            await self.store.discard(sid)
+
+    def _drop(self, sid: str) -> bool:
+        self.dropped += 1
+        DUPLICATES_DROPPED.inc()
+        logger.info(f"Dropped duplicate delivery of message {sid}.")
+        return False
+
+    def stats(self) -> Dict[str, int]:
+        return {"accepted": self.accepted, "dropped": self.dropped, "remembered": len(self.seen)}
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
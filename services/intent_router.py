@@ -0,0 +1,271 @@
+import logging
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from core.text import normalize_text
+from models.schemas import User
+from services.metrics import registry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INTENT_ROUTES = registry.counter(
+    "intent_routes_total", "Messages by how they were answered: locally (profile, topic) or by Gemini.", ("route",)
+)
+
+DISCLAIMER = "Please consult a registered medical practitioner for advice about your situation."
+
+# Canonical language names (as stored in users.language) by the words users write for them
+LANGUAGES = {
+    "english": "English", "angrezi": "English",
+    "hindi": "Hindi", "हिंदी": "Hindi", "हिन्दी": "Hindi",
+    "odia": "Odia", "oriya": "Odia", "ଓଡ଼ିଆ": "Odia",
+    "bengali": "Bengali", "bangla": "Bengali",
+    "tamil": "Tamil", "telugu": "Telugu", "marathi": "Marathi", "gujarati": "Gujarati",
+    "kannada": "Kannada", "malayalam": "Malayalam", "punjabi": "Punjabi",
+}
+
+# Condition words, by the profile field they set; anything else in a list of conditions
+# ("i have asthma and thyroid") is added to other_conditions if it is a known chronic condition
+_CONDITION_FIELDS = {
+    "diabetes": "has_diabetes", "diabetic": "has_diabetes", "sugar": "has_diabetes", "type 1 diabetes": "has_diabetes",
+    "type 2 diabetes": "has_diabetes", "sugar ki bimari": "has_diabetes", "madhumeh": "has_diabetes",
+    "hypertension": "has_hypertension", "hypertensive": "has_hypertension", "bp": "has_hypertension",
+    "high bp": "has_hypertension", "blood pressure": "has_hypertension", "high blood pressure": "has_hypertension",
+}
+_OTHER_CONDITIONS = {
+    "asthma": "Asthma", "thyroid": "Thyroid", "hypothyroidism": "Hypothyroidism", "arthritis": "Arthritis",
+    "copd": "COPD", "heart disease": "Heart disease", "kidney disease": "Kidney disease", "epilepsy": "Epilepsy",
+    "pcos": "PCOS", "anaemia": "Anaemia", "anemia": "Anaemia", "tb": "Tuberculosis", "tuberculosis": "Tuberculosis",
+}
+_CONDITION = "|".join(sorted(map(re.escape, list(_CONDITION_FIELDS) + list(_OTHER_CONDITIONS)), key=len, reverse=True))
+_LANGUAGE = "|".join(sorted(map(re.escape, LANGUAGES), key=len, reverse=True))
+_CONDITION_LIST = rf"(?:a |an )?(?:{_CONDITION})(?: patient)?(?:(?: and| aur| also| or)+ (?:a |an )?(?:{_CONDITION}))*"
+
+_CONDITION_TERM = re.compile(rf"\b({_CONDITION})\b")
+
+# Clauses (normalized, see core.text) that are nothing but a profile statement. Each pattern
+# must match a whole clause, so "i am 5 days into a fever" or "i have sugar in my tea" do not.
+_AGE_PATTERNS = [re.compile(p) for p in (
+    r"(?:my )?age(?: is)? (\d{1,3})(?: (?:years?|yrs?|yr))?(?: old)?",
+    r"(?:i am|im|i m) (\d{1,3})(?: (?:years?|yrs?|yr))?(?: old)?",
+    r"(\d{1,3}) (?:years?|yrs?|yr) old",
+    r"(?:meri )?(?:umar|umr|age) (\d{1,3})(?: (?:saal|sal|varsh))?(?: hai| h)?",
+    r"(?:main|mai|mein) (\d{1,3}) (?:saal|sal|varsh) (?:ka|ki) (?:hoon|hu|hun)",
+)]
+_HAVE_PATTERNS = [re.compile(p) for p in (
+    rf"(?:i have|i ve|ive|i have got|i got|i am having|i suffer from|i am suffering from|i also have) ({_CONDITION_LIST})",
+    rf"(?:i am|im|i m) ({_CONDITION_LIST})",
+    rf"(?:mujhe|muje|mujhko) ({_CONDITION_LIST})(?: hai| h)",
+    rf"(?:main|mai|mein) ({_CONDITION_LIST}) (?:ka|ki) (?:mareez|marij|mariz) (?:hoon|hu|hun)",
+)]
+_NOT_HAVE_PATTERNS = [re.compile(p) for p in (
+    # First person only: a bare "no sugar" is as likely to be a question or a diet note as a statement
+    rf"(?:i dont have|i do not have|i dont suffer from|i have no) ({_CONDITION_LIST})",
+    rf"(?:i am not|im not|i m not) ({_CONDITION_LIST})",
+    rf"(?:mujhe|muje) ({_CONDITION_LIST}) (?:nahi|nahin) (?:hai|h)",
+)]
+_LANGUAGE_PATTERNS = [re.compile(p) for p in (
+    rf"(?:please )?(?:reply|respond|answer|speak|talk|write|text|message)(?: to me| me)? "
+    rf"(?:in|only in) ({_LANGUAGE})(?: only)?(?: please)?",
+    rf"(?:please )?(?:change|switch|set)(?: my| the)? language(?: to)? ({_LANGUAGE})(?: please)?",
+    rf"(?:my language is|i speak|i prefer|i understand) ({_LANGUAGE})(?: only)?",
+    rf"({_LANGUAGE}) (?:mein|me|main) (?:baat karo|bolo|jawab do|likho|reply karo|batao)",
+)]
+# Greetings and fillers that may surround a statement without changing what it asks
+_FILLER_WORD = r"(?:hi|hello|hey|namaste|namaskar|ok|okay|thanks|thank you|dhanyavad|please note|note|fyi|btw|also)"
+_FILLER = re.compile(rf"{_FILLER_WORD}(?:\s+{_FILLER_WORD})*")
+_CLAUSE_SPLIT = re.compile(r"[.,;!?\n]+|\s(?:and|aur|also)\s(?=(?:i|im|my|mujhe|meri|main|please)\b)", re.IGNORECASE)
+# Words around a bare topic ("what is dengue", "tell me about malaria", "dengue kya hai")
+_TOPIC_QUESTION = re.compile(
+    r"(?:(?:what is|whats|what are|tell me about|tell me|info on|information on|information about|about|explain|"
+    r"details of|details about) )?(.+?)(?: (?:kya hai|kya h|ke bare mein|ke baare mein|ke bare me|batao|bataiye|"
+    r"symptoms|signs|prevention|treatment|causes|info|information|details))?"
+)
+
+
+class RoutedMessage(NamedTuple):
+    """
+    What the router made of a message.
+
+    `updates` are profile field changes to save before answering. `reply`
+    is the local answer, or None if the message must go to Gemini.
+    `route` names the path for metrics: profile, topic, profile+topic or gemini.
+    """
+    route: str
+    updates: Dict[str, Any]
+    reply: Optional[str]
+    topic: Optional[str] = None
+
+
+def render_record(record: Dict[str, Any]) -> str:
+    """
+    Renders a knowledge-base row as an SMS answer: the topic, then one line per field.
+    """
+    lines = [str(record.get("topic") or "")]
+    lines += [
+        f"{str(field).replace('_', ' ').capitalize()}: {value}"
+        for field, value in record.items()
+        if field != "topic" and value not in (None, "")
+    ]
+    return "\n".join(line for line in lines if line)
+
+
+def apply_profile_updates(profile: Any, updates: Dict[str, Any]) -> User:
+    """
+    The profile (a User or CachedProfile) with `updates` applied. Conditions in
+    `add_conditions` are appended to other_conditions unless already listed.
+    """
+    values = profile.to_dict() if hasattr(profile, "to_dict") else profile.model_dump()
+    for field, value in updates.items():
+        if field != "add_conditions":
+            values[field] = value
+    existing = [c.strip() for c in (values.get("other_conditions") or "").split(",") if c.strip()]
+    for condition in updates.get("add_conditions", ()):
+        if condition.lower() not in {c.lower() for c in existing}:
+            existing.append(condition)
+    values["other_conditions"] = ", ".join(existing) or None
+    return User(**values)
+
+
+class IntentRouter:
+    """
+    A fast, local stage in front of Gemini.
+
+    Messages are split into clauses, and each clause is matched against
+    whole-clause patterns for profile statements: age ("my age is 54"),
+    conditions ("I have diabetes and high BP", "I am not diabetic") and
+    reply language ("reply in Hindi"). Statements are returned as profile
+    updates. If nothing else is left, the reply is a confirmation; if what is
+    left is a bare health topic from the knowledge base ("dengue", "what is
+    malaria?"), the reply is that row. Everything else goes to Gemini, after
+    the updates are saved, so it sees the new profile.
+
+    Further classifiers (for example a small CPU model) can be passed in
+    `classifiers`: each gets the normalized leftover text and returns a
+    RoutedMessage or None, and the first answer wins.
+    """
+    def __init__(
+        self,
+        knowledge_base: Optional[Any] = None,
+        topic_min_score: float = 0.6,
+        classifiers: Optional[List[Callable[[str], Optional[RoutedMessage]]]] = None,
+    ):
+        """
+        Args:
+            knowledge_base: Object with an `index` (KnowledgeIndex), normally the GSheetsService.
+            topic_min_score: Minimum trigram similarity for a misspelt topic ("dengu") to count as a hit.
+        """
+        self.knowledge_base = knowledge_base
+        self.topic_min_score = topic_min_score
+        self.classifiers = classifiers or []
+
+    def route(self, message: str) -> RoutedMessage:
+        """
+        Classifies a message. CPU only; takes tens of microseconds.
+        """
+        routed = self._route(message)
+        INTENT_ROUTES.inc(route=routed.route)
+        if routed.reply is not None:
+            logger.info(f"Answered locally ({routed.route}) without calling Gemini.")
+        return routed
+
+    def _route(self, message: str) -> RoutedMessage:
+        updates, leftover = self._collect_statements(message)
+        if not leftover:
+            if not updates:
+                return RoutedMessage("gemini", {}, None)
+            return RoutedMessage("profile", updates, self._confirmation(updates))
+
+        if len(leftover) == 1:
+            record = self._topic_hit(leftover[0])
+            if record is not None:
+                reply = render_record(record) + "\n" + DISCLAIMER
+                if updates:
+                    reply = self._confirmation(updates) + "\n\n" + reply
+                return RoutedMessage("profile+topic" if updates else "topic", updates, reply, record.get("topic"))
+
+        for classifier in self.classifiers:
+            routed = classifier(" ".join(leftover))
+            if routed is not None:
+                return routed._replace(updates={**updates, **routed.updates})
+        return RoutedMessage("gemini", updates, None)
+
+    @classmethod
+    def _collect_statements(cls, message: str) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Splits a message into clauses; returns the profile updates they state and the other clauses.
+        """
+        updates: Dict[str, Any] = {}
+        leftover: List[str] = []
+        for clause in _CLAUSE_SPLIT.split(message):
+            clause = normalize_text(clause)
+            if not clause or _FILLER.fullmatch(clause):
+                continue
+            statement = cls._profile_statement(clause)
+            if statement is None:
+                leftover.append(clause)
+                continue
+            for field, value in statement.items():
+                if field == "add_conditions":
+                    updates.setdefault(field, []).extend(v for v in value if v not in updates.get(field, []))
+                else:
+                    updates[field] = value
+        return updates, leftover
+
+    @staticmethod
+    def _profile_statement(clause: str) -> Optional[Dict[str, Any]]:
+        for pattern in _AGE_PATTERNS:
+            match = pattern.fullmatch(clause)
+            if match and 0 < int(match.group(1)) <= 120:
+                return {"age": int(match.group(1))}
+        for patterns, present in ((_NOT_HAVE_PATTERNS, False), (_HAVE_PATTERNS, True)):
+            for pattern in patterns:
+                match = pattern.fullmatch(clause)
+                if match:
+                    return _condition_updates(match.group(1), present)
+        for pattern in _LANGUAGE_PATTERNS:
+            match = pattern.fullmatch(clause)
+            if match:
+                return {"language": LANGUAGES[match.group(1)]}
+        return None
+
+    def _topic_hit(self, clause: str) -> Optional[Dict[str, Any]]:
+        index = getattr(self.knowledge_base, "index", None)
+        if index is None:
+            return None
+        candidate = _TOPIC_QUESTION.fullmatch(clause).group(1)
+        if len(candidate.split()) > 3:
+            return None
+        record = index.get(candidate)
+        if record is None:
+            results = index.search(candidate, k=1, min_score=self.topic_min_score)
+            record = results[0].record if results else None
+        return record
+
+    @staticmethod
+    def _confirmation(updates: Dict[str, Any]) -> str:
+        notes = []
+        if "age" in updates:
+            notes.append(f"age {updates['age']}")
+        for field, name in (("has_diabetes", "diabetes"), ("has_hypertension", "high blood pressure")):
+            if field in updates:
+                notes.append(name if updates[field] else f"no {name}")
+        notes.extend(updates.get("add_conditions", ()))
+        if "language" in updates:
+            notes.append(f"replies in {updates['language']}")
+        return f"Thank you, I have updated your health profile: {', '.join(notes)}."
+
+
+def _condition_updates(conditions: str, present: bool) -> Optional[Dict[str, Any]]:
+    updates: Dict[str, Any] = {}
+    for term in _CONDITION_TERM.findall(conditions):
+        if term in _CONDITION_FIELDS:
+            updates[_CONDITION_FIELDS[term]] = present
+        elif present:
+            updates.setdefault("add_conditions", []).append(_OTHER_CONDITIONS[term])
+        else:
+            # Removing a free-text condition is left to the AI conversation
+            return None
+    return updates or None
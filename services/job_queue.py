@@ -0,0 +1,437 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from services.metrics import registry
+from services.tracing import tracer
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Job(NamedTuple):
+    """
+    A unit of background work. Jobs that share a key run one at a time, in order.
+    """
+    id: int
+    kind: str
+    key: str
+    payload: Dict[str, Any]
+    attempts: int
+    created_at: float
+    available_at: float = 0.0
+
+
+# The job a handler is running for, so a handler can mark it delivered (see JobQueue.mark_delivered)
+current_job: contextvars.ContextVar = contextvars.ContextVar("current_job", default=None)
+
+
+class JobQueue(ABC):
+    """
+    Interface for durable job queues used by WorkerPool.
+
+    claim() must never hand out a job while an earlier job with the same key is
+    still pending or running, which gives per-key (per phone number) ordering.
+
+    enqueue(..., coalesce_within=...) merges a job into the newest unfinished job
+    of the same kind and key if that job has not started yet: list values in the
+    payload are extended and the job's start is pushed back (debounced), but
+    never later than `max_wait` after the first job was queued.
+    """
+    @abstractmethod
+    async def enqueue(
+        self,
+        kind: str,
+        key: str,
+        payload: Dict[str, Any],
+        delay: float = 0.0,
+        coalesce_within: Optional[float] = None,
+        max_wait: float = 0.0,
+    ) -> int:
+        ...
+
+    @abstractmethod
+    async def claim(self) -> Optional[Job]:
+        ...
+
+    @abstractmethod
+    async def complete(self, job: Job) -> None:
+        ...
+
+    @abstractmethod
+    async def retry(self, job: Job, error: str, delay: float) -> None:
+        ...
+
+    @abstractmethod
+    async def dead_letter(self, job: Job, error: str) -> None:
+        ...
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    async def mark_delivered(self, job: Job) -> None:
+        """
+        Records that the job's effect reached the user (e.g. a reply was sent),
+        durably, so no later attempt of the job repeats it.
+        """
+
+    @abstractmethod
+    async def delivered(self, job: Job) -> bool:
+        """
+        True once mark_delivered was called for the job, by any attempt in any process.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    locked_until REAL,
+    created_at REAL NOT NULL,
+    last_error TEXT,
+    delivered_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_active_key_idx ON jobs (key, id) WHERE status IN ('pending', 'running');
+CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status, available_at);
+"""
+
+JOB_QUEUE_SECONDS = registry.histogram(
+    "job_queue_seconds", "Time from a job becoming due to a worker starting it.", ("kind",)
+)
+
+# The oldest job that is due (or whose lease expired) and has no earlier
+# unfinished job with the same key.
+_CLAIM_SQL = """
+SELECT id, kind, key, payload, attempts, created_at, available_at FROM jobs AS j
+WHERE ((j.status = 'pending' AND j.available_at <= :now) OR (j.status = 'running' AND j.locked_until <= :now))
+  AND NOT EXISTS (
+      SELECT 1 FROM jobs AS e
+      WHERE e.key = j.key AND e.id < j.id AND e.status IN ('pending', 'running')
+  )
+ORDER BY j.id
+LIMIT 1
+"""
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    The default job queue, stored in a local SQLite file so that queued work
+    survives restarts. Several processes can share the same file; claims are
+    made inside an IMMEDIATE transaction so a job is only handed out once.
+
+    A claimed job holds a lease. If its worker dies, the job becomes claimable
+    again once the lease expires.
+    """
+    def __init__(self, path: str, lease_seconds: float = 60.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # Queue files created before delivered_at existed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "delivered_at" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN delivered_at REAL")
+
+    def _enqueue(self, kind: str, key: str, payload: Dict[str, Any], delay: float) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, key, payload, available_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, key, json.dumps(payload), now + delay, now),
+            )
+            return cursor.lastrowid
+
+    def _enqueue_coalesced(self, kind: str, key: str, payload: Dict[str, Any], window: float, max_wait: float) -> int:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                job_id = self._merge_into_waiting_job(kind, key, payload, now, window, max_wait)
+                if job_id is None:
+                    job_id = self._conn.execute(
+                        "INSERT INTO jobs (kind, key, payload, available_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (kind, key, json.dumps(payload), now + window, now),
+                    ).lastrowid
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def _merge_into_waiting_job(self, kind, key, payload, now, window, max_wait) -> Optional[int]:
+        # Only the newest unfinished job for the key may absorb the new one, so order is kept
+        row = self._conn.execute(
+            "SELECT id, kind, status, attempts, payload, created_at FROM jobs "
+            "WHERE key = ? AND status IN ('pending', 'running') ORDER BY id DESC LIMIT 1",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        job_id, row_kind, status, attempts, stored, created_at = row
+        if row_kind != kind or status != 'pending' or attempts > 0:
+            return None
+
+        merged = json.loads(stored)
+        for name, value in payload.items():
+            if isinstance(value, list) and isinstance(merged.get(name), list):
+                merged[name].extend(value)
+            else:
+                merged[name] = value
+        available_at = min(now + window, created_at + max(window, max_wait))
+        self._conn.execute(
+            "UPDATE jobs SET payload = ?, available_at = ? WHERE id = ?",
+            (json.dumps(merged), available_at, job_id),
+        )
+        return job_id
+
+    def _claim(self) -> Optional[Job]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(_CLAIM_SQL, {"now": now}).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ? WHERE id = ?",
+                    (now + self.lease_seconds, row[0]),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        job_id, kind, key, payload, attempts, created_at, available_at = row
+        return Job(job_id, kind, key, json.loads(payload), attempts + 1, created_at, available_at)
+
+    def _execute(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def _stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    async def enqueue(
+        self,
+        kind: str,
+        key: str,
+        payload: Dict[str, Any],
+        delay: float = 0.0,
+        coalesce_within: Optional[float] = None,
+        max_wait: float = 0.0,
+    ) -> int:
+        """
+        Stores a job durably and returns its id (the id of the job it was merged
+        into, when coalescing).
+        """
+        if coalesce_within is not None:
+            return await asyncio.to_thread(self._enqueue_coalesced, kind, key, payload, coalesce_within, max_wait)
+        return await asyncio.to_thread(self._enqueue, kind, key, payload, delay)
+
+    async def claim(self) -> Optional[Job]:
+        """
+        Leases the next runnable job, or returns None if nothing is runnable.
+        """
+        return await asyncio.to_thread(self._claim)
+
+    async def complete(self, job: Job) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM jobs WHERE id = ?", (job.id,))
+
+    async def retry(self, job: Job, error: str, delay: float) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = 'pending', locked_until = NULL, available_at = ?, last_error = ? WHERE id = ?",
+            (time.time() + delay, error, job.id),
+        )
+
+    async def dead_letter(self, job: Job, error: str) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = 'dead', locked_until = NULL, last_error = ? WHERE id = ?",
+            (error, job.id),
+        )
+
+    async def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Returns jobs that exhausted their retries, oldest first.
+        """
+        def query():
+            with self._lock:
+                return self._conn.execute(
+                    "SELECT id, kind, key, payload, attempts, last_error FROM jobs WHERE status = 'dead' ORDER BY id LIMIT ?",
+                    (limit,),
+                ).fetchall()
+        rows = await asyncio.to_thread(query)
+        return [
+            {"id": r[0], "kind": r[1], "key": r[2], "payload": json.loads(r[3]), "attempts": r[4], "error": r[5]}
+            for r in rows
+        ]
+
+    async def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of jobs per status (pending, running, dead).
+        """
+        return await asyncio.to_thread(self._stats)
+
+    async def mark_delivered(self, job: Job) -> None:
+        await asyncio.to_thread(
+            self._execute, "UPDATE jobs SET delivered_at = ? WHERE id = ? AND delivered_at IS NULL", (time.time(), job.id)
+        )
+
+    async def delivered(self, job: Job) -> bool:
+        def query():
+            with self._lock:
+                return self._conn.execute("SELECT delivered_at FROM jobs WHERE id = ?", (job.id,)).fetchone()
+        row = await asyncio.to_thread(query)
+        return row is not None and row[0] is not None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class WorkerPool:
+    """
+    Runs jobs from a JobQueue on a fixed number of asyncio workers.
+
+    Each job kind maps to an async handler that is called with the job payload
+    as keyword arguments. A handler that raises is retried with exponential
+    backoff; after `max_attempts` the job is moved to the dead-letter state.
+    More throughput is available by running extra worker processes
+    (see worker.py) against the same queue.
+    """
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, Callable[..., Awaitable[Any]]],
+        concurrency: int = 8,
+        max_attempts: int = 5,
+        retry_base_delay: float = 2.0,
+        retry_max_delay: float = 300.0,
+        poll_interval: float = 0.5,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self._stopping = False
+        self.completed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not worker.done() for worker in self._workers)
+
+    def notify(self) -> None:
+        """
+        Wakes idle workers after a job was enqueued in this process.
+        """
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._stopping = False
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        logger.info(f"Started {self.concurrency} job workers.")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        Lets running jobs finish for up to `timeout` seconds, then cancels them.
+        Cancelled jobs are picked up again when their lease expires.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if not self._workers:
+            return
+        done, pending = await asyncio.wait(self._workers, timeout=timeout)
+        for worker in pending:
+            worker.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self, number: int) -> None:
+        while not self._stopping:
+            try:
+                job = await self.queue.claim()
+            except Exception as e:
+                logger.error(f"Job worker {number} failed to claim a job: {e}")
+                job = None
+            if job is None:
+                await self._idle()
+                continue
+            await self.run_job(job)
+
+    async def _idle(self) -> None:
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run_job(self, job: Job) -> None:
+        """
+        Runs one claimed job and records its outcome in the queue.
+        """
+        handler = self.handlers.get(job.kind)
+        if job.available_at:
+            JOB_QUEUE_SECONDS.observe(max(0.0, time.time() - job.available_at), kind=job.kind)
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind '{job.kind}'")
+            token = current_job.set(job)
+            try:
+                with tracer.span(f"job.{job.kind}", job_id=job.id, attempt=job.attempts):
+                    await handler(**job.payload)
+            finally:
+                current_job.reset(token)
+        except Exception as e:
+            await self._handle_failure(job, e)
+            return
+        await self.queue.complete(job)
+        self.completed += 1
+
+    async def _handle_failure(self, job: Job, error: Exception) -> None:
+        message = f"{type(error).__name__}: {error}"
+        if job.attempts >= self.max_attempts:
+            logger.error(f"Job {job.id} ({job.kind}) failed {job.attempts} times; moving it to dead letters: {message}")
+            await self.queue.dead_letter(job, message)
+            self.dead_lettered += 1
+            return
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (job.attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        logger.warning(f"Job {job.id} ({job.kind}) failed, retrying in {delay:.1f}s: {message}")
+        await self.queue.retry(job, message, delay)
+        self.retried += 1
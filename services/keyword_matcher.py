@@ -0,0 +1,147 @@
+import json
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from core.text import normalize_text, normalize_with_offsets
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class KeywordMatch(NamedTuple):
+    """
+    A single keyword hit inside a message.
+    start/end are character offsets into the original (un-normalized) message.
+    """
+    keyword: str
+    variant: str
+    language: str
+    start: int
+    end: int
+
+
+class KeywordMatcher:
+    """
+    Matches a large set of keywords against a message in a single pass using
+    an Aho-Corasick automaton. The automaton is compiled once; matching cost
+    depends on the message length, not on the number of keywords.
+
+    Both keywords and messages go through core.text.normalize_text, so
+    spacing, punctuation and case differences do not prevent a match.
+    A hit must start at a word boundary, so "accidentally" still matches
+    "accident" but a keyword is never matched from the middle of a word.
+    """
+    def __init__(self, patterns: Iterable[Tuple[str, str, str]], version: str = "unversioned"):
+        """
+        Compiles the automaton.
+
+        Args:
+            patterns: (keyword, variant, language) triples. The keyword is the
+                canonical name reported on a match; the variant is the text searched for.
+            version: The version string of the keyword set, for logging and auditing.
+        """
+        self.version = version
+        # Each state is a dict of transitions; outputs[state] lists pattern ids ending there.
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[int]] = [[]]
+        self._patterns: List[Tuple[str, str, str, int]] = []
+
+        seen = set()
+        for keyword, variant, language in patterns:
+            normalized = normalize_text(variant)
+            if not normalized or (keyword, normalized) in seen:
+                continue
+            seen.add((keyword, normalized))
+            self._add_pattern(normalized, (keyword, variant, language, len(normalized)))
+        self._build_failure_links()
+        logger.info(f"Compiled keyword matcher version {version} with {len(self._patterns)} patterns.")
+
+    @classmethod
+    def from_file(cls, path: str) -> "KeywordMatcher":
+        """
+        Builds a matcher from a versioned JSON keyword file.
+
+        The file has a "version" and a list of "keywords", each with a canonical
+        "keyword" and a "variants" mapping of language code to a list of variants.
+        Multi-word variants are also registered without spaces ("heartattack").
+        """
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(_iter_config_patterns(config), version=str(config.get("version", "unversioned")))
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def _add_pattern(self, text: str, pattern: Tuple[str, str, str, int]) -> None:
+        state = 0
+        for char in text:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].append(len(self._patterns))
+        self._patterns.append(pattern)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                candidate = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                # Merge outputs so each state reports every pattern that ends at it
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def _scan(self, message: str, first_only: bool) -> List[KeywordMatch]:
+        text, offsets = normalize_with_offsets(message)
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        matches: List[KeywordMatch] = []
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_id in outputs[state]:
+                keyword, variant, language, length = self._patterns[pattern_id]
+                start = index - length + 1
+                if start > 0 and text[start - 1] != " ":
+                    continue
+                matches.append(KeywordMatch(keyword, variant, language, offsets[start], offsets[index] + 1))
+                if first_only:
+                    return matches
+        return matches
+
+    def search(self, message: str) -> Optional[KeywordMatch]:
+        """
+        Returns the first keyword hit in the message (by end position), or None.
+        """
+        matches = self._scan(message, first_only=True)
+        return matches[0] if matches else None
+
+    def find_all(self, message: str) -> List[KeywordMatch]:
+        """
+        Returns every keyword hit in the message, ordered by end position.
+        """
+        return self._scan(message, first_only=False)
+
+
+def _iter_config_patterns(config: Dict) -> Iterable[Tuple[str, str, str]]:
+    for entry in config.get("keywords", []):
+        keyword = entry["keyword"]
+        for language, variants in entry.get("variants", {}).items():
+            for variant in variants:
+                yield keyword, variant, language
+                compact = normalize_text(variant).replace(" ", "")
+                if compact != normalize_text(variant):
+                    yield keyword, compact, language
@@ -0,0 +1,107 @@
+import logging
+import math
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Set
+
+from core.text import normalize_text
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SearchResult(NamedTuple):
+    """
+    A ranked knowledge-base hit. Score is the trigram similarity in [0, 1].
+    """
+    score: float
+    topic: str
+    record: Dict[str, Any]
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    Returns the set of word trigrams of a normalized string.
+    Each word is padded like PostgreSQL's pg_trgm ("  dengue ") so that word
+    starts weigh more than word middles.
+    """
+    grams: Set[str] = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class KnowledgeIndex:
+    """
+    An immutable search index over knowledge-base rows, built once per load.
+
+    Exact lookups go through a hash map of normalized topics. Typo-tolerant and
+    partial lookups go through a trigram inverted index. Only the rarest query
+    trigrams are used to collect candidates (prefix filtering): a topic that
+    shares none of them cannot reach the minimum score, so common trigrams
+    such as "  d" never have their long posting lists scanned.
+    """
+    def __init__(self, records: List[Dict[str, Any]], key: str = "topic"):
+        self.records = records
+        self._exact: Dict[str, Dict[str, Any]] = {}
+        self._topics: List[str] = []
+        self._topic_records: List[Dict[str, Any]] = []
+        self._topic_grams: List[FrozenSet[str]] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+
+        for record in records:
+            # Ensure the topic key exists and is a string before indexing
+            topic = record.get(key)
+            if not isinstance(topic, str):
+                continue
+            normalized = normalize_text(topic)
+            if not normalized or normalized in self._exact:
+                # Keep the first row for a topic, like the original linear scan did
+                continue
+            self._exact[normalized] = record
+            topic_id = len(self._topics)
+            grams = frozenset(trigrams(normalized))
+            self._topics.append(topic)
+            self._topic_records.append(record)
+            self._topic_grams.append(grams)
+            for gram in grams:
+                self._postings[gram].append(topic_id)
+        self._postings = dict(self._postings)
+
+    def __len__(self) -> int:
+        return len(self._topics)
+
+    def get(self, topic: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the row whose topic matches exactly (ignoring case, spacing and punctuation).
+        """
+        return self._exact.get(normalize_text(topic))
+
+    def search(self, query: str, k: int = 5, min_score: float = 0.3) -> List[SearchResult]:
+        """
+        Returns up to k rows ranked by trigram (Jaccard) similarity between
+        the query and the row topic. An exact topic match always ranks first.
+        """
+        normalized = normalize_text(query)
+        query_grams = trigrams(normalized)
+        if not query_grams:
+            return []
+
+        # Jaccard >= min_score needs at least this many shared trigrams, so a match
+        # must contain one of the (len - required + 1) rarest query trigrams.
+        required = max(1, math.ceil(min_score * len(query_grams)))
+        by_rarity = sorted(query_grams, key=lambda gram: len(self._postings.get(gram, ())))
+        candidates: Set[int] = set()
+        for gram in by_rarity[:len(by_rarity) - required + 1]:
+            candidates.update(self._postings.get(gram, ()))
+
+        results = []
+        for topic_id in candidates:
+            grams = self._topic_grams[topic_id]
+            overlap = len(query_grams & grams)
+            score = overlap / (len(query_grams) + len(grams) - overlap)
+            if score >= min_score:
+                results.append(SearchResult(score, self._topics[topic_id], self._topic_records[topic_id]))
+        results.sort(key=lambda result: result.score, reverse=True)
+        return results[:k]
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Dependency:
+    """
+    One external dependency of the app and the state of its startup.
+    """
+    __slots__ = ("name", "start", "stop", "required", "state", "error", "attempts", "startup_seconds")
+
+    def __init__(self, name: str, start: Callable[[], Awaitable[Any]],
+                 stop: Optional[Callable[[], Awaitable[Any]]], required: bool):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.required = required
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.startup_seconds: Optional[float] = None
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "required": self.required,
+            "attempts": self.attempts,
+            "startup_seconds": self.startup_seconds,
+            "error": self.error,
+        }
+
+
+class Dependencies:
+    """
+    Starts the app's dependencies concurrently and reports their state for health checks.
+
+    Each dependency's start() runs with a timeout. A dependency that fails is
+    retried every `retry_interval` seconds in the background, so one dead
+    service neither blocks startup nor needs a restart once it recovers.
+    The app is ready when every required dependency has started.
+    """
+    def __init__(self, start_timeout: float = 30.0, retry_interval: float = 10.0):
+        self.start_timeout = start_timeout
+        self.retry_interval = retry_interval
+        self._dependencies: List[Dependency] = []
+        self._tasks: List[asyncio.Task] = []
+        self._ready = asyncio.Event()
+        self._started_at = time.monotonic()
+
+    def add(self, name: str, start: Callable[[], Awaitable[Any]],
+            stop: Optional[Callable[[], Awaitable[Any]]] = None, required: bool = True) -> None:
+        self._dependencies.append(Dependency(name, start, stop, required))
+
+    @property
+    def ready(self) -> bool:
+        return all(dependency.state == "ready" for dependency in self._dependencies if dependency.required)
+
+    async def start(self) -> None:
+        """
+        Starts every dependency and returns once the required ones are ready.
+        Optional dependencies that fail keep retrying in the background.
+        """
+        self._started_at = time.monotonic()
+        self._ready.clear()
+        for dependency in self._dependencies:
+            dependency.state = "starting"
+        self._tasks = [asyncio.create_task(self._start_until_ready(dependency)) for dependency in self._dependencies]
+        await asyncio.gather(*(task for task, dependency in zip(self._tasks, self._dependencies) if dependency.required))
+        self._ready.set()
+
+    async def wait_ready(self) -> None:
+        await self._ready.wait()
+
+    async def stop(self) -> None:
+        """
+        Cancels pending startups and stops the started dependencies in reverse order.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for dependency in reversed(self._dependencies):
+            if dependency.state == "ready" and dependency.stop is not None:
+                try:
+                    await dependency.stop()
+                except Exception as e:
+                    logger.error(f"Failed to stop {dependency.name}: {e}")
+            dependency.state = "stopped"
+
+    async def _start_until_ready(self, dependency: Dependency) -> None:
+        while True:
+            dependency.state = "starting"
+            dependency.attempts += 1
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(dependency.start(), self.start_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                dependency.state = "failed"
+                dependency.error = f"{type(e).__name__}: {e}"
+                logger.error(f"Failed to start {dependency.name} (attempt {dependency.attempts}): {dependency.error}")
+                await asyncio.sleep(self.retry_interval)
+                continue
+            dependency.state = "ready"
+            dependency.error = None
+            dependency.startup_seconds = time.perf_counter() - started
+            logger.info(f"Started {dependency.name} in {dependency.startup_seconds:.2f}s.")
+            return
+
+    def report(self) -> Dict[str, Any]:
+        """
+        The readiness report served by /health/ready.
+        """
+        return {
+            "ready": self.ready,
+            "seconds_since_start": time.monotonic() - self._started_at,
+            "dependencies": {dependency.name: dependency.report() for dependency in self._dependencies},
+        }
@@ -1,9 +1,10 @@
-import asyncio
 import logging
-from twilio.rest import Client
-from twilio.base.exceptions import TwilioRestException
+from typing import Any, Awaitable, Callable, Optional
 
 from core.config import settings
+from services.emergency_lane import EmergencyLane, load_replies
+from services.sms_dispatcher import SmsDispatcher, TwilioHttpSender
+from services.tracing import tracer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,41 +13,115 @@ logger = logging.getLogger(__name__)
 class NotificationService:
     """
     Manages sending SMS notifications via the Twilio API.
+    Messages go through an SmsDispatcher, which rate-limits each sender number,
+    retries temporary failures and sends critical messages first. Emergency
+    (108) replies have their own EmergencyLane with reserved workers.
     """
-    def __init__(self):
+    def __init__(
+        self,
+        sender: Optional[Any] = None,
+        on_emergency_failure: Optional[Callable[[str, str], Awaitable[None]]] = None,
+        shared_limiter: Optional[Any] = None,
+    ):
         """
         Initializes the Twilio client using credentials from settings.
+
+        Args:
+            sender: Optional stand-in for TwilioHttpSender (same send, render
+                and send_rendered methods), used instead of the Twilio REST API.
+            on_emergency_failure: Called with (to_number, message_body) when an
+                emergency reply could not be sent on the fast lane.
+            shared_limiter: Optional SharedRateLimiter that applies the per-number
+                rate across all worker processes.
         """
         try:
-            self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+            self.client = sender or TwilioHttpSender(
+                settings.TWILIO_ACCOUNT_SID,
+                settings.TWILIO_AUTH_TOKEN,
+                base_url=settings.TWILIO_API_BASE_URL,
+                max_connections=settings.SMS_HTTP_MAX_CONNECTIONS,
+            )
             self.sender_number = settings.TWILIO_PHONE_NUMBER
             logger.info(f"Twilio client initialized successfully for sender: {self.sender_number}")
         except Exception as e:
             logger.error(f"Failed to initialize Twilio client: {e}")
             self.client = None
             self.sender_number = None
+        self.dispatcher = SmsDispatcher(
+            self.client,
+            rate_per_second=settings.SMS_SENDER_RATE_PER_SECOND,
+            burst=settings.SMS_SENDER_BURST,
+            concurrency=settings.SMS_DISPATCH_CONCURRENCY,
+            max_attempts=settings.SMS_MAX_ATTEMPTS,
+            retry_base_delay=settings.SMS_RETRY_BASE_SECONDS,
+            shared_limiter=shared_limiter,
+        )
+        self.emergency = None
+        if self.client:
+            self.emergency = EmergencyLane(
+                self.client,
+                load_replies(settings.CRITICAL_REPLIES_PATH),
+                sender_numbers=[self._from_number(""), self._from_number("whatsapp:")],
+                concurrency=settings.EMERGENCY_CONCURRENCY,
+                max_attempts=settings.EMERGENCY_MAX_ATTEMPTS,
+                p99_target=settings.EMERGENCY_P99_TARGET_SECONDS,
+                dispatcher=self.dispatcher,
+                on_failure=on_emergency_failure,
+            )
 
-    async def send_sms(self, to_number: str, message_body: str):
-   
+    def _from_number(self, to_number: str) -> str:
+        # WhatsApp destinations must be sent from the WhatsApp sandbox number
+        if to_number.startswith('whatsapp:'):
+            return f"whatsapp:{settings.TWILIO_WHATSAPP_NUMBER}"
+        return self.sender_number
+
+    async def start(self):
+        """
+        Starts the dispatcher and the emergency lane. Raises RuntimeError without a Twilio client.
+        """
         if not self.client:
-            logger.error("Twilio client not initialized.")
-            return
+            raise RuntimeError("Twilio client not initialized.")
+        self.dispatcher.start()
+        self.emergency.start()
+
+    async def close(self):
+        """
+        Sends queued messages and closes the HTTP connections.
+        """
+        if self.emergency:
+            await self.emergency.stop()
+        await self.dispatcher.close()
+        if self.client and hasattr(self.client, "close"):
+            await self.client.close()
 
+    async def send_sms(self, to_number: str, message_body: str, critical: bool = False):
+        """
+        Sends a message and waits until Twilio has accepted it. Failures are logged, not raised.
+        Critical messages skip ahead of everything else that is queued.
+        """
         try:
-            from_number = self.sender_number # Default to your SMS number
-
-            # Check if the destination is a WhatsApp number
-            if to_number.startswith('whatsapp:'):
-                # If so, the sender must also be the WhatsApp sandbox number
-                from_number = f"whatsapp:{settings.TWILIO_WHATSAPP_NUMBER}"
-
-            # Run the synchronous Twilio call in a separate thread
-            await asyncio.to_thread(
-                self.client.messages.create,
-                from_=from_number,
-                to=to_number,
-                body=message_body
-            )
-            logger.info(f"Successfully sent message to {to_number}")
+            await self._send(to_number, message_body, critical)
         except Exception as e:
             logger.error(f"Failed to send message to {to_number}. Twilio error: {e}")
+
+    async def send_critical_sms(self, to_number: str, message_body: str):
+        """
+        Sends a critical message. Failures are raised, so a queued job is retried and finally dead-lettered.
+        """
+        await self._send(to_number, message_body, critical=True)
+
+    async def _send(self, to_number: str, message_body: str, critical: bool):
+        if not self.client:
+            raise RuntimeError("Twilio client not initialized.")
+        with tracer.span("twilio.send", critical=critical):
+            await self.dispatcher.send(self._from_number(to_number), to_number, message_body, critical=critical)
+        logger.info(f"Successfully sent message to {to_number}")
+
+    def send_emergency(self, to_number: str, language: str, received_at: Optional[float] = None):
+        """
+        Queues the pre-rendered emergency reply in `language` on the fast lane and returns at once.
+        """
+        if not self.emergency:
+            logger.error("Twilio client not initialized.")
+            return
+        self.emergency.submit(self._from_number(to_number), to_number, language, received_at)
@@ -0,0 +1,86 @@
+import hashlib
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Union
+
+from core.text import normalize_text
+from models.schemas import User
+
+# The profile fields stored in the 'users' table, in User's order
+PROFILE_FIELDS = tuple(User.model_fields)
+
+
+def profile_segment(user_profile: "AnyProfile") -> Tuple[str, Tuple[Any, ...]]:
+    """
+    The profile fields that can change an answer: language and health conditions.
+    """
+    if isinstance(user_profile, CachedProfile):
+        return user_profile.segment
+    return (
+        user_profile.language.lower(),
+        (
+            bool(user_profile.has_diabetes),
+            bool(user_profile.has_hypertension),
+            normalize_text(user_profile.other_conditions or ""),
+        ),
+    )
+
+
+def profile_fragment(user_profile: "AnyProfile") -> str:
+    """
+    The user's health profile as the single line that goes into the prompt.
+    """
+    if isinstance(user_profile, CachedProfile):
+        return user_profile.prompt_fragment
+    fragment = f"Language: {user_profile.language}, Age: {user_profile.age or 'Not provided'}"
+    if user_profile.has_diabetes:
+        fragment += ", Condition: Diabetes"
+    if user_profile.has_hypertension:
+        fragment += ", Condition: Hypertension"
+    if user_profile.other_conditions:
+        fragment += f", Other Conditions: {user_profile.other_conditions}"
+    return fragment
+
+
+class CachedProfile(NamedTuple):
+    """
+    An immutable, validated user profile with everything a turn derives from it
+    computed once: the prompt fragment, the response-cache segment and a
+    version hash of the stored fields.
+
+    This is what the user caches hold, so a returning user's turn needs no
+    pydantic validation and no string building. A changed profile is a new
+    CachedProfile (with a new version), built by create_or_update_user.
+    """
+    phone_number: str
+    language: str
+    age: Optional[int]
+    has_diabetes: Optional[bool]
+    has_hypertension: Optional[bool]
+    other_conditions: Optional[str]
+    prompt_fragment: str
+    segment: Tuple[str, Tuple[Any, ...]]
+    version: str
+
+    @classmethod
+    def from_user(cls, user: User) -> "CachedProfile":
+        values = tuple(getattr(user, name) for name in PROFILE_FIELDS)
+        version = hashlib.blake2b(repr(values).encode(), digest_size=8).hexdigest()
+        return cls(*values, profile_fragment(user), profile_segment(user), version)
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "CachedProfile":
+        """
+        Validates a 'users' row (extra columns are ignored) into a CachedProfile.
+        """
+        return cls.from_user(User(**row))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        The stored profile fields, as User.model_dump() would return them.
+        """
+        return {name: getattr(self, name) for name in PROFILE_FIELDS}
+
+    def to_user(self) -> User:
+        return User.model_construct(**self.to_dict())
+
+
+AnyProfile = Union[User, CachedProfile]
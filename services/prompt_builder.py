@@ -0,0 +1,135 @@
+import re
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from core.text import estimate_tokens
+
+_SENTENCE_END = re.compile(r"(?<=[.!?।])\s")
+
+
+def _history_line(message: Dict[str, Any]) -> str:
+    return f"{message['sender'].capitalize()}: {message['message_text']}"
+
+
+def _fingerprint(message: Dict[str, Any]) -> Tuple[str, str]:
+    return message.get("sender", ""), message.get("message_text", "")
+
+
+def condense(message: Dict[str, Any], max_chars: int = 100) -> str:
+    """
+    A one-line extractive summary of a message: its first sentence, shortened.
+    """
+    text = " ".join(str(message.get("message_text", "")).split())
+    first_sentence = _SENTENCE_END.split(text, maxsplit=1)[0]
+    if len(first_sentence) > max_chars:
+        first_sentence = first_sentence[:max_chars - 3].rstrip() + "..."
+    return f"{message.get('sender', '').capitalize()}: {first_sentence}"
+
+
+class _Summary:
+    __slots__ = ("lines", "marker")
+
+    def __init__(self):
+        self.lines: Deque[str] = deque()
+        self.marker: Optional[Tuple[str, str]] = None
+
+
+class PromptBuilder:
+    """
+    Assembles the per-turn prompt within a token budget.
+
+    The system instruction is not part of the prompt; it is set once on the
+    model. The newest turns are kept verbatim as long as they fit. Older turns
+    are folded into a short rolling summary that is cached per conversation
+    and extended incrementally, so a turn never re-summarizes old messages.
+    """
+    def __init__(self, max_tokens: int = 1200, summary_max_tokens: int = 150, summary_cache_size: int = 10_000):
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summary_cache_size = summary_cache_size
+        self._summaries: "OrderedDict[str, _Summary]" = OrderedDict()
+
+    def build(
+        self,
+        user_message: str,
+        profile_details: str,
+        chat_history: List[Dict[str, Any]],
+        knowledge_text: str = "",
+        conversation_id: Optional[str] = None,
+    ) -> str:
+        """
+        Returns the prompt for one turn.
+
+        Args:
+            user_message: The current message.
+            profile_details: The user's health profile as a single line.
+            chat_history: Recent messages in chronological order.
+            knowledge_text: Vetted knowledge-base context for the message.
+            conversation_id: Key for the cached rolling summary, normally the phone number.
+        """
+        sections = [("User's Health Profile", profile_details)]
+        if knowledge_text:
+            sections.append(("Vetted Health Information (prefer this over general knowledge)", knowledge_text))
+        fixed = [("Current User Message", user_message)]
+
+        fixed_tokens = sum(estimate_tokens(title) + estimate_tokens(body) + 2 for title, body in sections + fixed)
+        history_budget = max(0, self.max_tokens - fixed_tokens - self.summary_max_tokens)
+        recent, older = self._split_history(chat_history, history_budget)
+
+        summary = self._summarize(conversation_id, chat_history, older)
+        if summary:
+            sections.append(("Summary of Earlier Conversation", summary))
+        if recent:
+            sections.append(("Recent Conversation History", "\n".join(_history_line(m) for m in recent)))
+        return "\n\n".join(f"**{title}:**\n{body}" for title, body in sections + fixed)
+
+    @staticmethod
+    def _split_history(chat_history: List[Dict[str, Any]], budget: int):
+        used = 0
+        split = len(chat_history)
+        while split > 0:
+            cost = estimate_tokens(_history_line(chat_history[split - 1])) + 1
+            if used + cost > budget:
+                break
+            used += cost
+            split -= 1
+        return chat_history[split:], chat_history[:split]
+
+    def _summarize(self, conversation_id: Optional[str], chat_history: List[Dict[str, Any]],
+                   older: List[Dict[str, Any]]) -> str:
+        if conversation_id is None:
+            summary = _Summary()
+            new_messages = older
+        else:
+            summary = self._cached_summary(conversation_id)
+            new_messages = older[self._first_unsummarized(summary, chat_history):]
+
+        for message in new_messages:
+            summary.lines.append(condense(message))
+        if new_messages:
+            summary.marker = _fingerprint(new_messages[-1])
+        while summary.lines and estimate_tokens("\n".join(summary.lines)) > self.summary_max_tokens:
+            summary.lines.popleft()
+        return "\n".join(summary.lines)
+
+    @staticmethod
+    def _first_unsummarized(summary: _Summary, chat_history: List[Dict[str, Any]]) -> int:
+        # Messages up to and including the marker were folded into the summary on an earlier turn.
+        # If the marker is no longer in the fetched history, everything fetched is newer than it.
+        if summary.marker is None:
+            return 0
+        for index in range(len(chat_history) - 1, -1, -1):
+            if _fingerprint(chat_history[index]) == summary.marker:
+                return index + 1
+        return 0
+
+    def _cached_summary(self, conversation_id: str) -> _Summary:
+        summary = self._summaries.get(conversation_id)
+        if summary is None:
+            summary = _Summary()
+            self._summaries[conversation_id] = summary
+            while len(self._summaries) > self.summary_cache_size:
+                self._summaries.popitem(last=False)
+        else:
+            self._summaries.move_to_end(conversation_id)
+        return summary
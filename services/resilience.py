@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Errors that mean the API is overloaded or unreachable rather than that the request was bad
+# (google.api_core exception names, matched by name so the client library need not be imported)
+OVERLOAD_ERRORS = {
+    "TimeoutError", "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded",
+    "InternalServerError", "TooManyRequests", "GatewayTimeout", "RetryError",
+}
+
+
+def is_overload(error: BaseException) -> bool:
+    """
+    Whether an error signals overload or an outage (as opposed to, say, a safety block).
+    """
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError)) or type(error).__name__ in OVERLOAD_ERRORS
+
+
+class Overloaded(Exception):
+    """
+    Raised when a call is refused without being attempted.
+    """
+
+
+class AdaptiveLimiter:
+    """
+    Caps the number of concurrent calls, adapting the cap to how the API copes (AIMD).
+
+    Every call that succeeds within `latency_target` raises the limit by about
+    one per limit's worth of calls; a call that times out, is overloaded or is
+    slower than the target cuts it by `backoff_ratio`. Cuts happen at most once
+    per `latency_target`, so a burst of failures from one slowdown counts once.
+    Callers wait up to `queue_timeout` for a slot and are refused after that.
+    """
+    def __init__(
+        self,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        latency_target: float = 8.0,
+        backoff_ratio: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self._clock = clock
+        self._condition: Optional[asyncio.Condition] = None
+        self._condition_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_cut = float("-inf")
+        self.in_flight = 0
+        self.waiting = 0
+        self.refused = 0
+
+    @asynccontextmanager
+    async def slot(self, queue_timeout: float) -> AsyncIterator[None]:
+        """
+        Holds one of the `limit` slots for the duration of a call.
+
+        Raises:
+            Overloaded: No slot became free within `queue_timeout` seconds.
+        """
+        await self._acquire(queue_timeout)
+        started = self._clock()
+        dropped = False
+        try:
+            yield
+        except BaseException as e:
+            dropped = is_overload(e)
+            raise
+        finally:
+            await self._release(self._clock() - started, dropped)
+
+    def _current_condition(self) -> asyncio.Condition:
+        # Created on first use, in the running event loop (the limiter itself is built at import time)
+        loop = asyncio.get_running_loop()
+        if self._condition_loop is not loop:
+            self._condition = asyncio.Condition()
+            self._condition_loop = loop
+        return self._condition
+
+    async def _acquire(self, queue_timeout: float) -> None:
+        condition = self._current_condition()
+        async with condition:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(condition.wait_for(lambda: self.in_flight < int(self.limit)), queue_timeout)
+            except asyncio.TimeoutError:
+                self.refused += 1
+                raise Overloaded(f"No free slot within {queue_timeout:.1f}s ({self.in_flight} calls in flight)")
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    async def _release(self, latency: float, dropped: bool) -> None:
+        condition = self._current_condition()
+        async with condition:
+            self.in_flight -= 1
+            if dropped or latency > self.latency_target:
+                now = self._clock()
+                if now - self._last_cut >= self.latency_target:
+                    self._last_cut = now
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+                    logger.warning(f"Concurrency limit cut to {int(self.limit)} (latency {latency:.1f}s, dropped={dropped}).")
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            condition.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        return {"limit": int(self.limit), "in_flight": self.in_flight, "waiting": self.waiting, "refused": self.refused}
+
+
+class CircuitBreaker:
+    """
+    Stops calling an API that keeps failing.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    allow() refuses calls. After `reset_timeout` seconds one trial call is
+    let through (half-open): its success closes the breaker, its failure
+    opens it again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_running = False
+        self.failures = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_running = False
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        Whether a call may be made now. In the half-open state only one trial call is allowed.
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self._state != self.CLOSED:
+            logger.info("Circuit closed; the API is responding again.")
+        self._state = self.CLOSED
+        self._trial_running = False
+        self.failures = 0
+
+    def record_skipped(self) -> None:
+        """
+        The call allowed by allow() was not made after all, so another trial may go ahead.
+        """
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self.failures >= self.failure_threshold):
+            self._state = self.OPEN
+            self._opened_at = self._clock()
+            self._trial_running = False
+            self.opened += 1
+            logger.error(f"Circuit opened after {self.failures} consecutive failures; retrying in {self.reset_timeout:.0f}s.")
@@ -0,0 +1,201 @@
+import math
+import re
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Callable, DefaultDict, Dict, List, Optional, Set, Tuple
+
+from core.text import normalize_text, tokenize
+from services.profile import AnyProfile, profile_segment
+
+# Words that usually refer back to earlier turns ("is it contagious?", "what about children?")
+_REFERENCE_WORDS = frozenset("""
+it its this that these those they them their he she him her same above again also more else
+previous earlier last then there
+""".split())
+
+CacheKey = Tuple[str, str, Tuple[Any, ...]]
+Segment = Tuple[str, Tuple[Any, ...]]
+
+
+class _Entry:
+    __slots__ = ("response", "expires_at", "vector")
+
+    def __init__(self, response: str, expires_at: float, vector: Dict[str, float]):
+        self.response = response
+        self.expires_at = expires_at
+        self.vector = vector
+
+
+class ResponseCache:
+    """
+    Caches AI answers keyed by the normalized message and the profile segment.
+
+    Lookups are exact first. When `similarity_threshold` is set, a miss falls
+    back to a TF-IDF cosine search over cached questions from the same profile
+    segment, so "dengue symptoms" can answer "what are the symptoms of dengue?".
+    Each question's normalized vector is computed once, when it is stored, and
+    an inverted index from term to questions per segment means a lookup only
+    scores the questions that share a term with it.
+    Entries expire after `ttl_seconds` and the least recently used entry is
+    evicted once `max_entries` is reached.
+
+    Follow-up questions that depend on the conversation are neither served
+    from nor stored in the cache (see `depends_on_history`).
+    """
+    def __init__(
+        self,
+        max_entries: int = 5_000,
+        ttl_seconds: float = 3600.0,
+        similarity_threshold: Optional[float] = 0.9,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._clock = clock
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._document_frequency: Counter = Counter()
+        self._postings: DefaultDict[Segment, DefaultDict[str, Set[CacheKey]]] = defaultdict(lambda: defaultdict(set))
+        self._average_miss_latency = 0.0
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.latency_saved = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def depends_on_history(user_message: str, chat_history: List[Dict[str, Any]]) -> bool:
+        """
+        True if the message is a follow-up whose answer depends on earlier turns.
+        """
+        if not chat_history:
+            return False
+        words = set(re.findall(r"\w+", normalize_text(user_message)))
+        return bool(words & _REFERENCE_WORDS) or not tokenize(user_message)
+
+    def get(self, user_message: str, user_profile: AnyProfile, chat_history: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Returns a cached answer, or None if the caller should ask the model.
+        """
+        if self.depends_on_history(user_message, chat_history):
+            self.bypassed += 1
+            return None
+
+        normalized = normalize_text(user_message)
+        language, conditions = profile_segment(user_profile)
+        key = (normalized, language, conditions)
+        entry = self._live_entry(key)
+        if entry is not None:
+            self.exact_hits += 1
+        elif self.similarity_threshold is not None:
+            entry = self._most_similar(Counter(tokenize(normalized)), language, conditions)
+            if entry is not None:
+                self.similar_hits += 1
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.latency_saved += self._average_miss_latency
+        return entry.response
+
+    def put(
+        self,
+        user_message: str,
+        user_profile: AnyProfile,
+        chat_history: List[Dict[str, Any]],
+        response: str,
+        latency: float = 0.0,
+    ) -> None:
+        """
+        Stores an answer. `latency` is how long the model took, used to report time saved.
+        """
+        # Exponential moving average of what a miss costs
+        self._average_miss_latency = latency if not self._average_miss_latency else (
+            0.9 * self._average_miss_latency + 0.1 * latency
+        )
+        if self.depends_on_history(user_message, chat_history):
+            return
+
+        normalized = normalize_text(user_message)
+        language, conditions = profile_segment(user_profile)
+        key = (normalized, language, conditions)
+        if key in self._entries:
+            self._remove(key)
+        tokens = Counter(tokenize(normalized))
+        self._document_frequency.update(tokens.keys())
+        self._entries[key] = _Entry(response, self._clock() + self.ttl_seconds, self._weights(tokens))
+        postings = self._postings[(language, conditions)]
+        for token in tokens:
+            postings[token].add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key)
+        self._document_frequency.subtract(entry.vector.keys())
+        segment = key[1:]
+        postings = self._postings[segment]
+        for token in entry.vector:
+            keys = postings[token]
+            keys.discard(key)
+            if not keys:
+                del postings[token]
+        if not postings:
+            del self._postings[segment]
+
+    def _live_entry(self, key: CacheKey) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= self._clock():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _weights(self, tokens: Counter) -> Dict[str, float]:
+        documents = len(self._entries) + 1
+        weights = {
+            token: count * (math.log(documents / (1 + self._document_frequency[token])) + 1.0)
+            for token, count in tokens.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        return {token: weight / norm for token, weight in weights.items()}
+
+    def _most_similar(self, tokens: Counter, language: str, conditions: Tuple[Any, ...]) -> Optional[_Entry]:
+        if not tokens:
+            return None
+        postings = self._postings.get((language, conditions))
+        if not postings:
+            return None
+        # Accumulate the dot product term by term over the questions that contain each term
+        scores: DefaultDict[CacheKey, float] = defaultdict(float)
+        for token, weight in self._weights(tokens).items():
+            for key in postings.get(token, ()):
+                scores[key] += weight * self._entries[key].vector[token]
+        best_key, best_score = None, self.similarity_threshold
+        for key, score in scores.items():
+            if score >= best_score:
+                best_key, best_score = key, score
+        return self._live_entry(best_key) if best_key is not None else None
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns hit/miss counters, the hit rate and the estimated model time saved.
+        """
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            "latency_saved_seconds": self.latency_saved,
+        }
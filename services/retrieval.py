@@ -0,0 +1,119 @@
+import math
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, NamedTuple
+
+import numpy as np
+
+from core.text import estimate_tokens, tokenize
+
+
+class RetrievedRow(NamedTuple):
+    """
+    A knowledge-base row matched for a message. Score is the cosine similarity.
+    """
+    score: float
+    record: Dict[str, Any]
+
+
+def format_record(record: Dict[str, Any]) -> str:
+    """
+    Renders a sheet row as a single line for the prompt ("Topic: Dengue | Symptoms: ...").
+    """
+    return " | ".join(
+        f"{str(field).replace('_', ' ').capitalize()}: {value}"
+        for field, value in record.items()
+        if value not in (None, "")
+    )
+
+
+class KnowledgeRetriever:
+    """
+    A TF-IDF vector index over knowledge-base rows, built once per load.
+
+    Rows are stored as an L2-normalized TF-IDF matrix in compressed sparse
+    column form (one NumPy array each for values, row ids and column offsets),
+    which keeps memory proportional to the number of words in the sheet.
+    A query only touches the columns of its own terms, and the top-k cosine
+    scores are selected with a vectorized partial sort.
+    """
+    def __init__(self, records: List[Dict[str, Any]], topic_weight: float = 2.0):
+        self.records = records
+        documents = []
+        for record in records:
+            # The topic is counted extra so that "dengue" ranks the Dengue row above rows that mention it
+            tokens = Counter(tokenize(format_record(record)))
+            for token in tokenize(str(record.get("topic") or "")):
+                tokens[token] += topic_weight
+            documents.append(tokens)
+
+        document_frequency = Counter(token for tokens in documents for token in tokens)
+        self._vocabulary = {token: column for column, token in enumerate(sorted(document_frequency))}
+        idf = [math.log((1 + len(documents)) / (1 + document_frequency[token])) + 1.0 for token in sorted(document_frequency)]
+        self._idf = np.array(idf, dtype=np.float32)
+        self._build_matrix(documents, idf)
+
+    def _build_matrix(self, documents: List[Counter], idf: List[float]) -> None:
+        columns: Dict[int, List[int]] = defaultdict(list)
+        values: Dict[int, List[float]] = defaultdict(list)
+        vocabulary = self._vocabulary
+        for row, tokens in enumerate(documents):
+            weights = {vocabulary[t]: count * idf[vocabulary[t]] for t, count in tokens.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for column, weight in weights.items():
+                columns[column].append(row)
+                values[column].append(weight / norm)
+
+        offsets = [0]
+        row_ids: List[int] = []
+        data: List[float] = []
+        for column in range(len(self._vocabulary)):
+            row_ids.extend(columns[column])
+            data.extend(values[column])
+            offsets.append(len(row_ids))
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._row_ids = np.array(row_ids, dtype=np.int32)
+        self._data = np.array(data, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.1) -> List[RetrievedRow]:
+        """
+        Returns up to k rows ranked by cosine similarity to the query.
+        """
+        counts = Counter(token for token in tokenize(query) if token in self._vocabulary)
+        if not counts or not self.records:
+            return []
+
+        query_columns = np.array([self._vocabulary[token] for token in counts], dtype=np.int64)
+        query_weights = np.array(list(counts.values()), dtype=np.float32) * self._idf[query_columns]
+        query_weights /= np.linalg.norm(query_weights)
+
+        scores = np.zeros(len(self.records), dtype=np.float32)
+        for column, weight in zip(query_columns, query_weights):
+            start, end = self._offsets[column], self._offsets[column + 1]
+            scores[self._row_ids[start:end]] += weight * self._data[start:end]
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [RetrievedRow(float(scores[i]), self.records[i]) for i in top if scores[i] >= min_score]
+
+
+def build_context(rows: List[RetrievedRow], max_tokens: int) -> str:
+    """
+    Formats retrieved rows for the prompt, best first, without exceeding max_tokens.
+    A single row that is larger than the budget is truncated.
+    """
+    lines: List[str] = []
+    used = 0
+    for row in rows:
+        line = f"- {format_record(row.record)}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            if not lines:
+                lines.append(line[:max_tokens * 4])
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
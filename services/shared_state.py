@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from services.conversation import ConversationLocks
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Deletes a lock only if it still holds our token, so an expired lock taken over
+# by another worker is never released by the previous holder
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SharedState(ABC):
+    """
+    State shared by every worker process: short-lived values, counters and
+    per-key locks. InMemorySharedState keeps it in this process (the default,
+    for a single worker); RedisSharedState shares it between processes and hosts.
+    """
+    @abstractmethod
+    async def start(self) -> None:
+        """
+        Checks that the backend is reachable.
+        """
+
+    @abstractmethod
+    async def close(self) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def incr(self, key: str, ttl: float) -> int:
+        """
+        Increments a counter and returns the new value. The counter expires
+        `ttl` seconds after it was created.
+        """
+
+    @abstractmethod
+    def lock(self, key: str, timeout: float) -> Any:
+        """
+        An async context manager that holds `key` exclusively. The lock is
+        released after `timeout` seconds even if its holder has died.
+        """
+
+
+class InMemorySharedState(SharedState):
+    """
+    SharedState for a single process. Locks are plain asyncio locks.
+    """
+    def __init__(self, max_entries: int = 100_000, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._values: Dict[str, Tuple[Any, float]] = {}
+        self._locks = ConversationLocks()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def _live(self, key: str) -> Optional[Any]:
+        item = self._values.get(key)
+        if item is None:
+            return None
+        if item[1] <= self._clock():
+            del self._values[key]
+            return None
+        return item[0]
+
+    def _store(self, key: str, value: Any, expires_at: float) -> None:
+        self._values[key] = (value, expires_at)
+        if len(self._values) > self.max_entries:
+            now = self._clock()
+            for expired in [k for k, (_, at) in self._values.items() if at <= now]:
+                del self._values[expired]
+            while len(self._values) > self.max_entries:
+                del self._values[next(iter(self._values))]
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._live(key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        self._values.pop(key, None)
+        self._store(key, value, self._clock() + ttl)
+
+    async def delete(self, key: str) -> None:
+        self._values.pop(key, None)
+
+    async def incr(self, key: str, ttl: float) -> int:
+        value = self._live(key)
+        if value is None:
+            self._store(key, 1, self._clock() + ttl)
+            return 1
+        self._values[key] = (value + 1, self._values[key][1])
+        return value + 1
+
+    def lock(self, key: str, timeout: float) -> Any:
+        # A holder in this process cannot die without releasing the lock, so no timeout is needed
+        return self._locks.hold(key)
+
+
+class RedisSharedState(SharedState):
+    """
+    SharedState in Redis (or anything that speaks its protocol), for running
+    several worker processes. `client` is a redis.asyncio.Redis created with
+    decode_responses=True, or a stand-in with the same methods.
+
+    Locks are SET NX PX keys with a random token, polled until free.
+    """
+    def __init__(self, client: Any, prefix: str = "arogya:", poll_interval: float = 0.02):
+        self.client = client
+        self.prefix = prefix
+        self.poll_interval = poll_interval
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "RedisSharedState":
+        try:
+            # Imported here: redis is only needed when workers share state
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("SHARED_STATE_URL points at Redis, but the redis package is not installed.")
+        return cls(redis.asyncio.from_url(url, decode_responses=True), **kwargs)
+
+    async def start(self) -> None:
+        await self.client.ping()
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await self.client.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self.prefix + key)
+
+    async def incr(self, key: str, ttl: float) -> int:
+        value = await self.client.incr(self.prefix + key)
+        if value == 1:
+            await self.client.pexpire(self.prefix + key, max(1, int(ttl * 1000)))
+        return value
+
+    @asynccontextmanager
+    async def lock(self, key: str, timeout: float) -> AsyncIterator[None]:
+        name = f"{self.prefix}lock:{key}"
+        token = uuid.uuid4().hex
+        while not await self.client.set(name, token, nx=True, px=max(1, int(timeout * 1000))):
+            await asyncio.sleep(self.poll_interval)
+        try:
+            yield
+        finally:
+            await self.client.eval(RELEASE_LOCK_SCRIPT, 1, name, token)
+
+
+class SharedRateLimiter:
+    """
+    Allows `rate` operations per second per key across all worker processes,
+    counted in fixed one-second windows in the shared state.
+    """
+    def __init__(self, state: SharedState, rate: float, window: float = 1.0, clock: Callable[[], float] = time.time):
+        self.state = state
+        self.limit = max(1, int(rate * window))
+        self.window = window
+        self._clock = clock
+
+    async def acquire(self, key: str) -> None:
+        """
+        Waits until an operation for `key` is allowed.
+        """
+        while True:
+            now = self._clock()
+            window = int(now // self.window)
+            if await self.state.incr(f"rate:{key}:{window}", ttl=self.window * 2) <= self.limit:
+                return
+            await asyncio.sleep((window + 1) * self.window - now)
+
+    async def take(self, key: str) -> None:
+        """
+        Counts an operation for `key` without waiting, for sends that cannot be held back.
+        """
+        await self.state.incr(f"rate:{key}:{int(self._clock() // self.window)}", ttl=self.window * 2)
+
+
+def create_shared_state(url: str) -> SharedState:
+    """
+    Returns the in-process state for an empty URL, or a Redis one for redis:// and rediss:// URLs.
+    """
+    if not url or url == "memory://":
+        return InMemorySharedState()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSharedState.from_url(url)
+    raise ValueError(f"Unsupported SHARED_STATE_URL scheme: {url}")
@@ -0,0 +1,361 @@
+import asyncio
+import itertools
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set
+from urllib.parse import urlencode
+
+import httpx
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Queue priorities: lower is sent first
+PRIORITY_CRITICAL = 0
+PRIORITY_NORMAL = 1
+_PRIORITY_STOP = 2
+
+_FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+
+class SendError(Exception):
+    """
+    A message could not be sent. `retryable` is set for rate limiting (429),
+    server errors (5xx) and network failures.
+    """
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = False,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class TwilioHttpSender:
+    """
+    Sends messages through Twilio's REST API on a pooled httpx client.
+
+    Connections are kept alive and reused across messages, so sending does not
+    need a thread per message or a new TLS handshake per request.
+    """
+    def __init__(
+        self,
+        account_sid: str,
+        auth_token: str,
+        base_url: str = "https://api.twilio.com",
+        max_connections: int = 100,
+        timeout: float = 10.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        if not account_sid or not auth_token:
+            raise ValueError("Twilio account SID and auth token are required.")
+        self.account_sid = account_sid
+        self._messages_path = f"/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            auth=(account_sid, auth_token),
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+
+    @staticmethod
+    def render(from_number: str, body: str) -> bytes:
+        """
+        Encodes the parts of a message that do not depend on the recipient.
+        Messages sent to many recipients can be rendered once and sent with send_rendered.
+        """
+        return urlencode({"From": from_number, "Body": body}).encode()
+
+    async def send(self, from_number: str, to_number: str, body: str) -> str:
+        """
+        Sends one message and returns its Twilio message SID.
+        """
+        return await self.send_rendered(self.render(from_number, body), to_number)
+
+    async def send_rendered(self, rendered: bytes, to_number: str) -> str:
+        """
+        Sends a message rendered by render() to one recipient and returns its SID.
+        """
+        try:
+            response = await self._client.post(
+                self._messages_path,
+                content=rendered + b"&" + urlencode({"To": to_number}).encode(),
+                headers=_FORM_HEADERS,
+            )
+        except httpx.TransportError as e:
+            raise SendError(f"Network error: {e}", retryable=True) from e
+
+        if response.status_code < 300:
+            return response.json().get("sid", "")
+
+        retry_after = response.headers.get("Retry-After")
+        raise SendError(
+            f"Twilio returned {response.status_code}: {response.text[:200]}",
+            status=response.status_code,
+            retryable=response.status_code == 429 or response.status_code >= 500,
+            retry_after=float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else None,
+        )
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class TokenBucket:
+    """
+    Allows `rate` operations per second on average, with bursts of up to `burst`.
+    """
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Waits until an operation is allowed.
+        """
+        async with self._lock:
+            while True:
+                now = self._clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    def take(self) -> None:
+        """
+        Uses a token without waiting. The bucket may go into debt, which later
+        acquire() calls pay back, so urgent sends still count against the rate.
+        """
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate) - 1.0
+        self._updated = now
+
+
+class _Outgoing:
+    __slots__ = ("from_number", "to_number", "body", "priority", "future", "attempts")
+
+    def __init__(self, from_number: str, to_number: str, body: str, priority: int, future: asyncio.Future):
+        self.from_number = from_number
+        self.to_number = to_number
+        self.body = body
+        self.priority = priority
+        self.future = future
+        self.attempts = 0
+
+
+class SmsDispatcher:
+    """
+    A send queue in front of the sender.
+
+    Critical messages skip the queue: each is sent by its own task, which
+    borrows a token instead of waiting, so it is never stuck behind workers
+    that hold normal messages and wait for the rate limit. Each sender
+    number has its own token bucket, so one busy number does not
+    slow the others down and Twilio's per-number limits are respected.
+    Rate limiting (429) and server errors are retried with jittered
+    exponential backoff, honouring Retry-After; after `max_attempts` the
+    error is raised to the caller.
+
+    Bulk messages sent outside the queue (see BroadcastEngine) draw from
+    the same buckets through acquire_bulk(), after the queued and critical
+    messages for that number.
+
+    With several worker processes, pass a `shared_limiter` (a
+    SharedRateLimiter) so the per-number rate holds across all of them.
+    """
+    def __init__(
+        self,
+        sender: Any,
+        rate_per_second: float = 10.0,
+        burst: float = 20.0,
+        concurrency: int = 50,
+        max_attempts: int = 4,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 30.0,
+        shared_limiter: Optional[Any] = None,
+    ):
+        self.sender = sender
+        self.shared_limiter = shared_limiter
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._buckets: Dict[str, TokenBucket] = {}
+        # Messages per sender number that are queued or waiting for a token, and bulk sends waiting behind them
+        self._waiting: Dict[str, int] = defaultdict(int)
+        self._idle: Dict[str, asyncio.Event] = {}
+        self._bulk_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._workers: List[asyncio.Task] = []
+        self._critical: Set[asyncio.Task] = set()
+        self._retry_timers: Dict[asyncio.TimerHandle, _Outgoing] = {}
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not worker.done() for worker in self._workers)
+
+    @property
+    def pending(self) -> int:
+        return (self._queue.qsize() if self._queue else 0) + len(self._retry_timers) + len(self._critical)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def send(self, from_number: str, to_number: str, body: str, critical: bool = False) -> str:
+        """
+        Queues a message and waits until it has been sent. Returns the message SID.
+
+        Raises:
+            SendError: The message could not be sent.
+        """
+        self.start()
+        message = _Outgoing(
+            from_number, to_number, body,
+            PRIORITY_CRITICAL if critical else PRIORITY_NORMAL,
+            asyncio.get_running_loop().create_future(),
+        )
+        self._enqueue(message)
+        return await message.future
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """
+        Sends what is queued, then stops the workers. Messages waiting for a retry are failed.
+        """
+        if not self.running:
+            return
+        for timer, message in self._retry_timers.items():
+            timer.cancel()
+            if not message.future.done():
+                message.future.set_exception(SendError("The dispatcher was closed before the message was sent."))
+        for _ in self._workers:
+            self._queue.put_nowait((_PRIORITY_STOP, next(self._sequence), None))
+        _, still_running = await asyncio.wait(self._workers + list(self._critical), timeout=timeout)
+        for worker in still_running:
+            worker.cancel()
+        self._workers = []
+        self._retry_timers.clear()
+        # Messages still queued were dropped with the workers; do not hold bulk sends back for them
+        self._waiting.clear()
+        for idle in self._idle.values():
+            idle.set()
+
+    def borrow(self, from_number: str) -> None:
+        """
+        Records a message sent outside the queue (see EmergencyLane) against the sender's rate limit.
+        """
+        self._bucket(from_number).take()
+
+    async def acquire_bulk(self, from_number: str) -> None:
+        """
+        Waits for the sender's rate limit on behalf of a bulk message sent
+        outside the queue. Queued and critical messages for the number go
+        first, and bulk senders take turns, so a chat reply waits behind at
+        most one bulk message.
+        """
+        async with self._bulk_locks[from_number]:
+            while self._waiting.get(from_number):
+                await self._idle_event(from_number).wait()
+            await self._bucket(from_number).acquire()
+            if self.shared_limiter is not None:
+                await self.shared_limiter.acquire(from_number)
+
+    def _enqueue(self, message: _Outgoing) -> None:
+        self._waiting[message.from_number] += 1
+        self._idle_event(message.from_number).clear()
+        if message.priority == PRIORITY_CRITICAL:
+            task = asyncio.create_task(self._deliver(message))
+            self._critical.add(task)
+            task.add_done_callback(self._critical.discard)
+            return
+        self._queue.put_nowait((message.priority, next(self._sequence), message))
+
+    def _idle_event(self, from_number: str) -> asyncio.Event:
+        idle = self._idle.get(from_number)
+        if idle is None:
+            idle = self._idle[from_number] = asyncio.Event()
+            idle.set()
+        return idle
+
+    def _bucket(self, from_number: str) -> TokenBucket:
+        bucket = self._buckets.get(from_number)
+        if bucket is None:
+            bucket = self._buckets[from_number] = TokenBucket(self.rate_per_second, self.burst)
+        return bucket
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, message = await self._queue.get()
+            if message is None:
+                return
+            await self._deliver(message)
+
+    async def _deliver(self, message: _Outgoing) -> None:
+        message.attempts += 1
+        try:
+            await self._wait_for_rate_limit(message)
+            sid = await self.sender.send(message.from_number, message.to_number, message.body)
+        except Exception as e:
+            self._handle_failure(message, e)
+        else:
+            self.sent += 1
+            if not message.future.done():
+                message.future.set_result(sid)
+
+    async def _wait_for_rate_limit(self, message: _Outgoing) -> None:
+        try:
+            if message.priority == PRIORITY_CRITICAL:
+                self._bucket(message.from_number).take()
+                if self.shared_limiter is not None:
+                    await self.shared_limiter.take(message.from_number)
+                return
+            await self._bucket(message.from_number).acquire()
+            if self.shared_limiter is not None:
+                await self.shared_limiter.acquire(message.from_number)
+        finally:
+            self._waiting[message.from_number] -= 1
+            if self._waiting[message.from_number] <= 0:
+                self._waiting.pop(message.from_number, None)
+                self._idle_event(message.from_number).set()
+
+    def _handle_failure(self, message: _Outgoing, error: Exception) -> None:
+        retryable = isinstance(error, SendError) and error.retryable
+        if not retryable or message.attempts >= self.max_attempts:
+            self.failed += 1
+            if not message.future.done():
+                message.future.set_exception(error)
+            return
+
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (message.attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        if error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+        self.retried += 1
+        logger.warning(f"Retrying message to {message.to_number} in {delay:.1f}s: {error}")
+
+        def requeue():
+            self._retry_timers.pop(timer, None)
+            self._enqueue(message)
+
+        timer = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retry_timers[timer] = message
+
+    def stats(self) -> Dict[str, int]:
+        return {"sent": self.sent, "retried": self.retried, "failed": self.failed, "pending": self.pending}
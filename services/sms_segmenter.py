@@ -0,0 +1,121 @@
+import asyncio
+import re
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+# A sentence ends with ., !, ?, or the Devanagari danda, followed by whitespace
+_SENTENCE_END = re.compile(r"[.!?।](?=\s)")
+
+
+def _cut_point(text: str, max_chars: int) -> int:
+    """
+    The best place to split `text` so the first part is at most max_chars long:
+    the last sentence end, else the last space, else a hard cut.
+    """
+    window = text[:max_chars + 1]
+    ends = [match.end() for match in _SENTENCE_END.finditer(window) if match.end() <= max_chars]
+    if ends:
+        return ends[-1]
+    space = window.rfind(" ", 0, max_chars + 1)
+    return space if space > 0 else max_chars
+
+
+class SentenceSegmenter:
+    """
+    Cuts a stream of generated text into message-sized segments at sentence boundaries.
+
+    The first segment is released as soon as it holds at least `first_min_chars`
+    characters of complete sentences, so the user gets a reply quickly. Later
+    segments are released when a full `max_chars` segment is available.
+    The complete text is kept in `text`.
+    """
+    def __init__(self, max_chars: int = 320, first_min_chars: int = 120):
+        self.max_chars = max_chars
+        self.first_min_chars = min(first_min_chars, max_chars)
+        self.text = ""
+        self._buffer = ""
+        self._segments_sent = 0
+
+    def feed(self, chunk: str) -> List[str]:
+        """
+        Adds generated text and returns the segments that are ready to send.
+        """
+        self.text += chunk
+        self._buffer += chunk
+        segments = []
+        while True:
+            segment = self._next_segment()
+            if segment is None:
+                return segments
+            segments.append(segment)
+
+    def flush(self) -> List[str]:
+        """
+        Returns the remaining text as segments once generation has finished.
+        """
+        segments = []
+        while len(self._buffer) > self.max_chars:
+            segments.append(self._take(_cut_point(self._buffer, self.max_chars)))
+        if self._buffer.strip():
+            segments.append(self._take(len(self._buffer)))
+        self._buffer = ""
+        return [segment for segment in segments if segment]
+
+    def _next_segment(self) -> Optional[str]:
+        if len(self._buffer) > self.max_chars:
+            return self._take(_cut_point(self._buffer, self.max_chars))
+        if self._segments_sent == 0:
+            ends = [m.end() for m in _SENTENCE_END.finditer(self._buffer) if m.end() >= self.first_min_chars]
+            if ends:
+                return self._take(ends[-1])
+        return None
+
+    def _take(self, length: int) -> str:
+        segment, self._buffer = self._buffer[:length].strip(), self._buffer[length:].lstrip()
+        self._segments_sent += 1
+        return segment
+
+
+def split_message(text: str, max_chars: int = 320) -> List[str]:
+    """
+    Splits a complete message into segments at sentence boundaries.
+    """
+    segmenter = SentenceSegmenter(max_chars=max_chars, first_min_chars=max_chars)
+    return segmenter.feed(text) + segmenter.flush()
+
+
+async def deliver_stream(
+    chunks: AsyncIterator[str],
+    send: Callable[[str], Awaitable[None]],
+    max_chars: int = 320,
+    first_min_chars: int = 120,
+) -> str:
+    """
+    Sends a streamed reply segment by segment while it is still being generated.
+
+    Segments are sent one at a time, in order, by a single sender task, so
+    generation is never blocked on the messaging API.
+
+    Returns:
+        The full generated text.
+    """
+    segmenter = SentenceSegmenter(max_chars=max_chars, first_min_chars=first_min_chars)
+    outbox: asyncio.Queue = asyncio.Queue()
+
+    async def sender():
+        while True:
+            segment = await outbox.get()
+            if segment is None:
+                return
+            await send(segment)
+
+    sender_task = asyncio.create_task(sender())
+    try:
+        async for chunk in chunks:
+            for segment in segmenter.feed(chunk):
+                outbox.put_nowait(segment)
+        for segment in segmenter.flush():
+            outbox.put_nowait(segment)
+    finally:
+        outbox.put_nowait(None)
+        await sender_task
+    return segmenter.text
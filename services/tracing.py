@@ -0,0 +1,149 @@
+import contextvars
+import json
+import logging
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+
+from core.config import settings
+from services.metrics import MetricsRegistry, registry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    A timed stage of a trace. The fields follow OpenTelemetry's span model
+    (hex trace and span ids, parent id, attributes) so sampled spans can be
+    forwarded to an OpenTelemetry collector by an exporter.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_time", "duration", "attributes")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_time = time.time()
+        self.duration = 0.0
+        self.attributes = attributes
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+class _UnsampledSpan:
+    """
+    Stands in for a Span in traces that were not sampled; attributes are dropped.
+    """
+    __slots__ = ()
+    trace_id = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_UNSAMPLED = _UnsampledSpan()
+
+
+def log_span(span: Span) -> None:
+    logger.debug(json.dumps(span.to_dict(), default=str))
+
+
+class Tracer:
+    """
+    Times each stage of message handling.
+
+    Every span's duration is recorded in the `stage_latency_seconds` histogram,
+    which costs two clock reads and a bucket increment. Full spans (ids,
+    parent, attributes) are only built for the `sample_rate` fraction of
+    traces; the sampling decision is made at the root span and inherited by
+    its children. Finished sampled spans are kept in `recent` and passed to
+    `exporter`.
+    """
+    def __init__(
+        self,
+        metrics: MetricsRegistry,
+        sample_rate: float = 0.01,
+        max_recent: int = 1000,
+        exporter: Optional[Callable[[Span], None]] = log_span,
+    ):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.recent: Deque[Span] = deque(maxlen=max_recent)
+        self.stage_latency = metrics.histogram(
+            "stage_latency_seconds", "Time spent in each stage of message handling.", ("stage",)
+        )
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Any]:
+        """
+        Times the enclosed block as stage `name`. Yields the span, whose
+        set_attribute() can be called freely whether or not it is sampled.
+        """
+        parent = _current_span.get()
+        if parent is None:
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+            span = Span(name, f"{random.getrandbits(128):032x}", None, attributes) if sampled else _UNSAMPLED
+        elif parent is _UNSAMPLED:
+            span = _UNSAMPLED
+        else:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.set_attribute("error", type(e).__name__)
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            _current_span.reset(token)
+            self.stage_latency.observe(duration, stage=name)
+            if span is not _UNSAMPLED:
+                span.duration = duration
+                self._finish(span)
+
+    def record(self, name: str, duration: float, **attributes: Any) -> None:
+        """
+        Records a stage that was timed elsewhere (for example across a stream)
+        as a child of the current span.
+        """
+        self.stage_latency.observe(duration, stage=name)
+        parent = _current_span.get()
+        if parent is None or parent is _UNSAMPLED:
+            return
+        span = Span(name, parent.trace_id, parent.span_id, attributes)
+        span.start_time -= duration
+        span.duration = duration
+        self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        self.recent.append(span)
+        if self.exporter is not None:
+            try:
+                self.exporter(span)
+            except Exception as e:
+                logger.error(f"Span exporter failed: {e}")
+
+
+# The process-wide tracer; stage latencies go to the /metrics registry
+tracer = Tracer(registry, sample_rate=settings.TRACE_SAMPLE_RATE)
@@ -0,0 +1,201 @@
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Union
+
+from models.schemas import User
+from services.profile import CachedProfile
+
+
+class _Entry:
+    """
+    Cached state for one phone number. `history` is None until it has been
+    loaded from the database; after that it always holds the newest messages.
+    """
+    __slots__ = ("user", "history", "expires_at")
+
+    def __init__(self, expires_at: float):
+        self.user: Optional[CachedProfile] = None
+        self.history: Optional[Deque[Dict[str, Any]]] = None
+        self.expires_at = expires_at
+
+
+class UserCache:
+    """
+    A bounded, in-process LRU cache with TTL, keyed by phone number.
+
+    Each entry holds the user's profile (as a CachedProfile) and a rolling
+    window of their most recent chat messages. DatabaseService keeps it current with write-through
+    updates, so most turns need no database reads at all.
+    """
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl_seconds: float = 300.0,
+        history_size: int = 20,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.history_size = history_size
+        self._clock = clock
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, phone_number: str) -> Optional[_Entry]:
+        entry = self._entries.get(phone_number)
+        if entry is None:
+            return None
+        if entry.expires_at <= self._clock():
+            del self._entries[phone_number]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(phone_number)
+        return entry
+
+    def _entry_for_write(self, phone_number: str) -> _Entry:
+        entry = self._lookup(phone_number)
+        if entry is None:
+            entry = _Entry(self._clock() + self.ttl_seconds)
+            self._entries[phone_number] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            entry.expires_at = self._clock() + self.ttl_seconds
+        return entry
+
+    def get_user(self, phone_number: str) -> Optional[CachedProfile]:
+        """
+        Returns the cached profile, or None (a miss) if it is not cached.
+        """
+        entry = self._lookup(phone_number)
+        if entry is None or entry.user is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.user
+
+    def put_user(self, user: Union[User, CachedProfile]) -> None:
+        """
+        Caches a profile. An unchanged profile (same version) keeps the cached object.
+        """
+        profile = user if isinstance(user, CachedProfile) else CachedProfile.from_user(user)
+        entry = self._entry_for_write(profile.phone_number)
+        if entry.user is None or entry.user.version != profile.version:
+            entry.user = profile
+
+    def get_history(self, phone_number: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Returns the newest `limit` messages in chronological order, or None (a miss)
+        if the history is not cached or `limit` is larger than the cached window.
+        """
+        entry = self._lookup(phone_number)
+        if entry is None or entry.history is None or limit > self.history_size:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return list(entry.history)[-limit:] if limit > 0 else []
+
+    def set_history(self, phone_number: str, messages: List[Dict[str, Any]]) -> None:
+        """
+        Stores history loaded from the database (chronological order).
+        The caller must have fetched at least `history_size` messages, or all of them.
+        """
+        entry = self._entry_for_write(phone_number)
+        entry.history = deque(messages, maxlen=self.history_size)
+
+    def append_message(self, phone_number: str, message: Dict[str, Any]) -> None:
+        """
+        Adds a newly saved message to the cached window, if the window is loaded.
+        """
+        entry = self._lookup(phone_number)
+        if entry is not None and entry.history is not None:
+            entry.history.append(message)
+
+    def invalidate(self, phone_number: str) -> None:
+        self._entries.pop(phone_number, None)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns hit/miss/eviction counters and the current number of entries.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": len(self._entries),
+        }
+
+
+class SharedUserCache:
+    """
+    The same profile and recent-history cache as UserCache, kept in a
+    SharedState so that every worker process sees the others' writes.
+
+    Used instead of UserCache when several processes serve the same users:
+    consecutive turns of one user may run in different processes, and the
+    history written behind by one must be visible to the next at once.
+    The methods are those of UserCache, but async.
+    """
+    def __init__(self, state: Any, ttl_seconds: float = 300.0, history_size: int = 20, max_parsed: int = 10_000):
+        self.state = state
+        self.ttl_seconds = ttl_seconds
+        self.history_size = history_size
+        self.max_parsed = max_parsed
+        self._parsed: "OrderedDict[str, CachedProfile]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get_user(self, phone_number: str) -> Optional[CachedProfile]:
+        raw = await self.state.get(f"user:{phone_number}")
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Parsed profiles are memoized by their serialized form, which other processes may have written
+        profile = self._parsed.get(raw)
+        if profile is None:
+            profile = CachedProfile.from_user(User.model_validate_json(raw))
+            self._parsed[raw] = profile
+            while len(self._parsed) > self.max_parsed:
+                self._parsed.popitem(last=False)
+        else:
+            self._parsed.move_to_end(raw)
+        return profile
+
+    async def put_user(self, user: Union[User, CachedProfile]) -> None:
+        profile = user if isinstance(user, CachedProfile) else CachedProfile.from_user(user)
+        await self.state.set(f"user:{profile.phone_number}", json.dumps(profile.to_dict()), self.ttl_seconds)
+
+    async def get_history(self, phone_number: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        raw = await self.state.get(f"history:{phone_number}")
+        if raw is None or limit > self.history_size:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)[-limit:] if limit > 0 else []
+
+    async def set_history(self, phone_number: str, messages: List[Dict[str, Any]]) -> None:
+        payload = json.dumps(messages[-self.history_size:], default=str)
+        await self.state.set(f"history:{phone_number}", payload, self.ttl_seconds)
+
+    async def append_message(self, phone_number: str, message: Dict[str, Any]) -> None:
+        # Only the user's own turn appends, and turns hold the conversation lock
+        raw = await self.state.get(f"history:{phone_number}")
+        if raw is not None:
+            await self.set_history(phone_number, json.loads(raw) + [message])
+
+    async def invalidate(self, phone_number: str) -> None:
+        await self.state.delete(f"user:{phone_number}")
+        await self.state.delete(f"history:{phone_number}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import random
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Queued by close() to tell the flusher to drain and exit
+_STOP = object()
+
+
+class BatchWriter:
+    """
+    A write-behind queue that coalesces rows into bulk writes.
+
+    Rows are flushed when `max_batch_size` rows are waiting or `flush_interval`
+    seconds after the first row of a batch arrived, whichever comes first.
+    `put()` blocks once `max_queue_size` rows are queued (backpressure).
+    Failed batches are kept in a bounded retry buffer and retried with
+    exponential backoff; when it overflows, the oldest rows are dropped.
+    """
+    def __init__(
+        self,
+        write_batch: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+        name: str = "batch",
+        max_batch_size: int = 100,
+        flush_interval: float = 0.2,
+        max_queue_size: int = 10_000,
+        max_buffered: int = 50_000,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 30.0,
+        shutdown_retries: int = 3,
+    ):
+        self._write_batch = write_batch
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.shutdown_retries = shutdown_retries
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._retry_buffer: Deque[Dict[str, Any]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = asyncio.Event()
+        self._consecutive_failures = 0
+        self.batches_written = 0
+        self.rows_written = 0
+        self.failed_writes = 0
+        self.rows_dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() + len(self._retry_buffer)
+
+    def start(self) -> None:
+        if not self.running:
+            self._closing.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, row: Dict[str, Any]) -> None:
+        """
+        Queues a row for writing. Waits while the queue is full.
+        """
+        await self._queue.put(row)
+
+    async def close(self, timeout: float = 30.0) -> None:
+        """
+        Flushes everything that is queued and stops the flusher.
+        """
+        if not self.running:
+            return
+        self._closing.set()
+        await self._queue.put(_STOP)
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out flushing the {self.name} writer; {self.pending} rows were not written.")
+        self._task = None
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping and not self._closing.is_set():
+            batch, stopping = await self._next_batch()
+            if batch and not await self._write(batch):
+                await self._sleep_unless_closing(self._backoff_delay())
+        await self._drain_retry_buffer()
+
+    async def _sleep_unless_closing(self, delay: float) -> None:
+        try:
+            await asyncio.wait_for(self._closing.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _next_batch(self):
+        batch: List[Dict[str, Any]] = []
+        while self._retry_buffer and len(batch) < self.max_batch_size:
+            batch.append(self._retry_buffer.popleft())
+
+        loop = asyncio.get_running_loop()
+        deadline = None
+        while len(batch) < self.max_batch_size:
+            if batch and deadline is None:
+                deadline = loop.time() + self.flush_interval
+            try:
+                if deadline is None:
+                    row = await self._queue.get()
+                else:
+                    row = await asyncio.wait_for(self._queue.get(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+            if row is _STOP:
+                return batch, True
+            batch.append(row)
+        return batch, False
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> bool:
+        try:
+            await self._write_batch(batch)
+        except Exception as e:
+            self.failed_writes += 1
+            self._consecutive_failures += 1
+            logger.error(f"Failed to write a batch of {len(batch)} {self.name} rows, will retry: {e}")
+            self._buffer_for_retry(batch)
+            return False
+        self._consecutive_failures = 0
+        self.batches_written += 1
+        self.rows_written += len(batch)
+        return True
+
+    def _buffer_for_retry(self, batch: List[Dict[str, Any]]) -> None:
+        # Failed rows go to the front so that they keep their original order
+        self._retry_buffer.extendleft(reversed(batch))
+        overflow = len(self._retry_buffer) - self.max_buffered
+        if overflow > 0:
+            for _ in range(overflow):
+                self._retry_buffer.popleft()
+            self.rows_dropped += overflow
+            logger.error(f"The {self.name} retry buffer is full; dropped {overflow} oldest rows.")
+
+    def _backoff_delay(self) -> float:
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (self._consecutive_failures - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _drain_retry_buffer(self) -> None:
+        # Any rows still queued behind the stop marker are written too
+        while not self._queue.empty():
+            row = self._queue.get_nowait()
+            if row is not _STOP:
+                self._retry_buffer.append(row)
+
+        attempts = 0
+        while self._retry_buffer and attempts <= self.shutdown_retries:
+            batch = [self._retry_buffer.popleft() for _ in range(min(self.max_batch_size, len(self._retry_buffer)))]
+            if await self._write(batch):
+                attempts = 0
+            else:
+                attempts += 1
+                # Keep shutdown short: never back off for more than a second here
+                await asyncio.sleep(min(1.0, self._backoff_delay()))
+
+        if self._retry_buffer:
+            self.rows_dropped += len(self._retry_buffer)
+            logger.error(f"Dropped {len(self._retry_buffer)} unwritten {self.name} rows at shutdown.")
+            self._retry_buffer.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "batches_written": self.batches_written,
+            "rows_written": self.rows_written,
+            "failed_writes": self.failed_writes,
+            "rows_dropped": self.rows_dropped,
+            "pending": self.pending,
+        }
@@ -0,0 +1,113 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from benchmarks.fakes import FakeSupabaseClient
+from services.analytics import (AnalyticsExporter, TextColumn, daily_volumes, load_table, read_spans, response_lengths,
+                                stage_latency, topic_frequencies)
+from services.database_service import DatabaseService
+
+MESSAGES = [
+    ("+911", "user", "What is dengue?", "2025-03-01T08:00:00+00:00"),
+    ("+911", "bot", "Dengue is a viral fever.", "2025-03-01T08:00:02+00:00"),
+    ("+912", "user", "my sugar is high, diabetes diet?", "2025-03-01T23:30:00+05:30"),
+    ("+912", "bot", "Eat regular meals.", "2025-03-01T23:30:03+05:30"),
+    ("+911", "user", "thanks", "2025-03-02T09:00:00+00:00"),
+]
+
+
+def add_messages(client, messages):
+    for phone, sender, text, created_at in messages:
+        client._insert_row("chat_history", {"phone_number": phone, "sender": sender, "message_text": text,
+                                            "created_at": created_at})
+
+
+@pytest.mark.asyncio
+async def test_export_is_partitioned_by_day_and_incremental(tmp_path):
+    client = FakeSupabaseClient()
+    add_messages(client, MESSAGES[:4])
+    client.tables["users"].append({"phone_number": "+911", "language": "Hindi", "age": None, "has_diabetes": True})
+    exporter = AnalyticsExporter(DatabaseService(client=client), str(tmp_path), page_size=3)
+
+    first = await exporter.run()
+
+    assert (first.messages, first.users, first.last_id) == (4, 1, 4)
+    # 23:30 at +05:30 is 18:00 UTC, the same day
+    assert sorted(os.listdir(tmp_path / "chat_history")) == ["date=2025-03-01"]
+    users = load_table(str(tmp_path), "users")
+    assert users["language"].tolist() == ["Hindi"] and np.isnan(users["age"][0]) and users["has_diabetes"][0]
+
+    add_messages(client, MESSAGES[4:])
+    client.requests.clear()
+    second = await exporter.run(users=False)
+
+    assert (second.messages, second.last_id) == (1, 5)
+    assert client.requests[("chat_history", "select")] == 1
+    chat = load_table(str(tmp_path), columns=("id", "message_text"))
+    assert chat["id"].tolist() == [1, 2, 3, 4, 5]
+    assert chat["message_text"].tolist() == [message[2] for message in MESSAGES]
+    assert load_table(str(tmp_path), columns=("id",), since="2025-03-02")["id"].tolist() == [5]
+
+
+@pytest.mark.asyncio
+async def test_export_stops_at_rows_that_may_not_have_settled(tmp_path):
+    client = FakeSupabaseClient()
+    add_messages(client, MESSAGES[:2] + [("+913", "user", "fever", "2025-03-01T08:04:00+00:00"),
+                                         ("+913", "user", "cough", "2025-03-01T08:01:00+00:00")])
+    exporter = AnalyticsExporter(DatabaseService(client=client), str(tmp_path), page_size=2, settle_seconds=300)
+
+    # Row 3 is under five minutes old, so row 4 waits behind it even though it is older
+    first = await exporter.run(users=False, now=datetime(2025, 3, 1, 8, 6, tzinfo=timezone.utc))
+    second = await exporter.run(users=False, now=datetime(2025, 3, 1, 8, 10, tzinfo=timezone.utc))
+
+    assert (first.messages, first.last_id) == (2, 2)
+    assert (second.messages, second.last_id) == (2, 4)
+    assert load_table(str(tmp_path), columns=("id",))["id"].tolist() == [1, 2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_aggregations(tmp_path):
+    client = FakeSupabaseClient()
+    add_messages(client, MESSAGES)
+    await AnalyticsExporter(DatabaseService(client=client), str(tmp_path)).run(users=False)
+    chat = load_table(str(tmp_path))
+
+    volumes = daily_volumes(chat)
+    assert [str(day) for day in volumes["day"]] == ["2025-03-01", "2025-03-02"]
+    assert volumes["user_messages"].tolist() == [2, 1]
+    assert volumes["bot_messages"].tolist() == [2, 0]
+    assert volumes["active_users"].tolist() == [2, 1]
+    assert volumes["mean_reply_chars"].tolist() == [21.0, 0.0]
+
+    assert response_lengths(chat)["max"] == 24
+    assert topic_frequencies(chat, ["Dengue", "Diabetes", "Malaria"]) == {
+        "Dengue": 1, "Diabetes": 1, "Malaria": 0, "(none)": 1
+    }
+
+
+def test_stage_latency_from_logged_spans(tmp_path):
+    path = tmp_path / "spans.log"
+    lines = ["INFO:main:started"]
+    lines += [f"DEBUG:services.tracing:{json.dumps({'name': 'reply', 'duration': d})}" for d in (0.5, 1.0, 1.5)]
+    lines += [json.dumps({"name": "router", "duration": 0.001})]
+    path.write_text("\n".join(lines))
+
+    latency = stage_latency(read_spans(str(path)))
+
+    assert latency["reply"]["count"] == 3 and latency["reply"]["p50"] == 1.0
+    assert latency["router"]["count"] == 1
+
+
+def test_text_column_search_and_selection():
+    column = TextColumn.from_strings(["Dengue kya hai?", "मधुमेह", "", "no DENGUE here, dengue"])
+
+    assert column.contains("dengue").tolist() == [False, False, False, True]
+    assert column.lower().contains("dengue").tolist() == [True, False, False, True]
+    assert column.contains("मधुमेह").tolist() == [False, True, False, False]
+    # A match may not run across two values
+    assert not TextColumn.from_strings(["deng", "ue"]).contains("dengue").any()
+    assert column[np.array([False, True, True, True])].tolist() == ["मधुमेह", "", "no DENGUE here, dengue"]
+    assert TextColumn.concatenate([column[:1], column[3:]]).tolist() == ["Dengue kya hai?", "no DENGUE here, dengue"]
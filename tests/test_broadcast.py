@@ -0,0 +1,188 @@
+import asyncio
+import sqlite3
+import time
+
+import httpx
+import pytest
+
+from benchmarks.fakes import FakeSupabaseClient, FakeTwilioServer
+from services.broadcast import BroadcastEngine, BroadcastStore
+from services.database_service import DatabaseService
+from services.sms_dispatcher import SmsDispatcher, TwilioHttpSender
+
+TEMPLATES = {"English": "Dengue alert: remove standing water.", "Hindi": "Dengue chetavani: ruka hua paani hatayein."}
+
+
+def make_users(count):
+    client = FakeSupabaseClient()
+    for i in range(count):
+        client.tables["users"].append({
+            "phone_number": f"+9190000{i:05d}",
+            "language": ["English", "Hindi", "Tamil"][i % 3],
+            "has_diabetes": i % 2 == 0,
+        })
+    return client
+
+
+def make_engine(client, server, tmp_path, dispatcher=None, **kwargs):
+    sender = TwilioHttpSender("AC123", "token", base_url="http://twilio.test", transport=httpx.ASGITransport(app=server))
+    dispatcher = dispatcher or SmsDispatcher(sender, rate_per_second=10_000, burst=10_000)
+    options = {"concurrency": 4, "page_size": 20, "checkpoint_every": 10, "retry_base_delay": 0.01}
+    options.update(kwargs)
+    return BroadcastEngine(DatabaseService(client=client), dispatcher,
+                           BroadcastStore(str(tmp_path / "broadcasts.sqlite3")), from_numbers={"": "+1000"}, **options)
+
+
+@pytest.mark.asyncio
+async def test_users_are_streamed_in_keyset_pages():
+    client = make_users(25)
+    db_service = DatabaseService(client=client)
+
+    pages = [page async for page in db_service.iter_users({"language": ["English", "Hindi"]}, page_size=6)]
+
+    phones = [row["phone_number"] for page in pages for row in page]
+    assert [len(page) for page in pages] == [6, 6, 5]
+    assert phones == sorted(phones) and len(set(phones)) == 17
+    assert client.requests[("users", "select")] == 3
+
+
+@pytest.mark.asyncio
+async def test_broadcast_reaches_matching_users_in_their_language(tmp_path):
+    server = FakeTwilioServer()
+    engine = make_engine(make_users(30), server, tmp_path)
+    await engine.store.create("dengue", TEMPLATES, {"has_diabetes": True})
+    server.failures = [429]
+
+    result = await engine.run("dengue")
+
+    assert result.report() == {"id": "dengue", "status": "done", "cursor": "+919000000028",
+                               "sent": 15, "failed": 0, "skipped": 0}
+    bodies = {message["to"]: message["body"] for message in server.messages}
+    assert len(server.messages) == 15
+    assert bodies["+919000000000"] == TEMPLATES["English"]
+    assert bodies["+919000000004"] == TEMPLATES["Hindi"]
+    # Tamil has no template, so the default language is used
+    assert bodies["+919000000002"] == TEMPLATES["English"]
+    assert (await engine.store.get("dengue")).status == "done"
+    assert await engine.run("dengue") is None
+
+
+@pytest.mark.asyncio
+async def test_interrupted_broadcast_resumes_from_its_checkpoint(tmp_path):
+    server = FakeTwilioServer(latency=0.001)
+    client = make_users(100)
+    engine = make_engine(client, server, tmp_path)
+    await engine.store.create("heatwave", TEMPLATES, {})
+
+    engine.start("heatwave")
+    while len(server.messages) < 45:
+        await asyncio.sleep(0.001)
+    await engine.stop()
+    interrupted = await engine.store.get("heatwave")
+    assert interrupted.status == "pending" and interrupted.cursor is not None
+
+    resumed = make_engine(client, server, tmp_path)
+    result = await resumed.run()
+
+    recipients = [message["to"] for message in server.messages]
+    assert set(recipients) == {row["phone_number"] for row in client.tables["users"]}
+    # Only recipients after the last checkpoint can get the message twice
+    assert len(recipients) - 100 <= 10 + 4
+    assert result.status == "done" and result.sent == 100
+
+
+@pytest.mark.asyncio
+async def test_unexpected_errors_fail_the_recipient_without_stalling_the_broadcast(tmp_path):
+    class FlakyLimiter:
+        calls = 0
+
+        async def acquire(self, key):
+            self.calls += 1
+            if self.calls % 5 == 0:
+                raise ConnectionError("redis unavailable")
+
+    server = FakeTwilioServer()
+    sender = TwilioHttpSender("AC123", "token", base_url="http://twilio.test", transport=httpx.ASGITransport(app=server))
+    dispatcher = SmsDispatcher(sender, rate_per_second=10_000, burst=10_000, shared_limiter=FlakyLimiter())
+    engine = make_engine(make_users(40), server, tmp_path, dispatcher=dispatcher)
+    await engine.store.create("flood", TEMPLATES, {})
+
+    result = await asyncio.wait_for(engine.run("flood"), timeout=5)
+
+    assert result.status == "done" and result.failed == 8
+    assert result.sent + result.failed == 40 and len(server.messages) == 32
+
+
+@pytest.mark.asyncio
+async def test_a_failing_checkpoint_stops_the_broadcast_instead_of_hanging(tmp_path):
+    server = FakeTwilioServer()
+    engine = make_engine(make_users(100), server, tmp_path)
+    await engine.store.create("flood", TEMPLATES, {})
+    checkpoint = engine.store.checkpoint
+
+    async def failing_checkpoint(broadcast_id, cursor, sent, failed, skipped, status="running"):
+        if status == "running":
+            raise sqlite3.OperationalError("disk I/O error")
+        await checkpoint(broadcast_id, cursor, sent, failed, skipped, status)
+
+    engine.store.checkpoint = failing_checkpoint
+    with pytest.raises(sqlite3.OperationalError):
+        await asyncio.wait_for(engine.run("flood"), timeout=5)
+
+    assert (await engine.store.get("flood")).status == "pending"
+
+
+@pytest.mark.asyncio
+async def test_broadcasts_share_the_sender_rate_and_let_chat_replies_go_first(tmp_path):
+    sent = []
+
+    class RecordingSender:
+        render = staticmethod(TwilioHttpSender.render)
+
+        async def send(self, from_number, to_number, body):
+            sent.append(("chat", time.perf_counter()))
+            return body
+
+        async def send_rendered(self, rendered, to_number):
+            sent.append(("broadcast", time.perf_counter()))
+            return to_number
+
+    dispatcher = SmsDispatcher(RecordingSender(), rate_per_second=50, burst=1)
+    engine = make_engine(make_users(20), FakeTwilioServer(), tmp_path, dispatcher=dispatcher)
+    await engine.store.create("heatwave", TEMPLATES, {})
+
+    broadcast = asyncio.create_task(engine.run("heatwave"))
+    while len(sent) < 5:
+        await asyncio.sleep(0.001)
+    queued_at = len(sent)
+    await asyncio.gather(*(dispatcher.send("+1000", f"+91100{i}", "Drink water.") for i in range(3)))
+    await broadcast
+    await dispatcher.close()
+
+    kinds = [kind for kind, _ in sent]
+    assert kinds.count("broadcast") == 20 and kinds.count("chat") == 3
+    # At most one broadcast message already waiting for a token goes before the replies
+    assert max(i for i, kind in enumerate(kinds) if kind == "chat") <= queued_at + 3
+    # Together they stay within the number's rate of 50 per second
+    assert sent[-1][1] - sent[0][1] >= (len(sent) - 1) / 50 * 0.9
+
+
+def test_broadcasts_are_validated():
+    with pytest.raises(ValueError):
+        BroadcastEngine.validate({}, {})
+    with pytest.raises(ValueError):
+        BroadcastEngine.validate(TEMPLATES, {"password": "x"})
+    BroadcastEngine.validate(TEMPLATES, {"language": ["Hindi"], "has_diabetes": True})
+
+
+@pytest.mark.asyncio
+async def test_broadcast_endpoints_need_the_token(monkeypatch):
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+        assert (await client.get("/api/broadcasts/x")).status_code == 404
+        monkeypatch.setattr(main.settings, "BROADCAST_API_TOKEN", "secret")
+        assert (await client.get("/api/broadcasts/x", headers={"X-Broadcast-Token": "wrong"})).status_code == 401
+        response = await client.post("/api/broadcasts", json={"templates": {}}, headers={"X-Broadcast-Token": "secret"})
+        assert response.status_code == 422
@@ -0,0 +1,80 @@
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from benchmarks.fakes import FakeSupabaseClient
+from models.schemas import ChatMessage
+from services.chat_archive import ChatArchiver, iter_archive
+from services.database_service import DatabaseService
+
+NOW = datetime(2025, 6, 15, tzinfo=timezone.utc)
+
+
+def add_history(client, phone, created_at):
+    for i, timestamp in enumerate(created_at):
+        client.tables["chat_history"].append({
+            "id": len(client.tables["chat_history"]) + 1, "phone_number": phone,
+            "sender": "user" if i % 2 == 0 else "bot", "message_text": f"message {i}", "created_at": timestamp,
+        })
+
+
+@pytest.mark.asyncio
+async def test_history_is_read_from_the_recent_window():
+    client = FakeSupabaseClient()
+    writer = DatabaseService(client=client, recent_window_size=3)
+    for i in range(5):
+        await writer.save_chat_message(ChatMessage(phone_number="+911", sender="user", message_text=f"hi {i}"))
+    writer.chat_writer.start()
+    await writer.save_chat_message(ChatMessage(phone_number="+911", sender="bot", message_text="hello"))
+    await writer.close()
+
+    reader = DatabaseService(client=client, recent_window_size=3)
+    history = await reader.get_chat_history("+911", limit=2)
+
+    assert [message["message_text"] for message in history] == ["hi 4", "hello"]
+    assert len(client.tables["chat_history"]) == 6
+    assert [m["message_text"] for m in client.tables["chat_recent"][0]["messages"]] == ["hi 3", "hi 4", "hello"]
+    assert client.requests[("chat_history", "select")] == 0
+    assert await reader.get_chat_history("+912") == []
+
+
+@pytest.mark.asyncio
+async def test_old_turns_are_archived_by_month_and_deleted(tmp_path):
+    client = FakeSupabaseClient()
+    add_history(client, "+911", ["2025-01-05T10:00:00+00:00", "2025-01-05T10:00:05+00:00",
+                                 "2025-02-01T09:00:00+00:00", "2025-06-01T08:00:00+00:00"])
+    add_history(client, "+912", ["2025-02-20T12:00:00+00:00"])
+    archiver = ChatArchiver(DatabaseService(client=client), str(tmp_path), retention_days=90, page_size=2)
+
+    result = await archiver.run(now=NOW)
+
+    assert result.messages == 4
+    assert sorted(os.listdir(tmp_path)) == ["month=2025-01", "month=2025-02"]
+    assert [row["created_at"] for row in client.tables["chat_history"]] == ["2025-06-01T08:00:00+00:00"]
+    archived = list(iter_archive(str(tmp_path)))
+    assert sorted(row["id"] for row in archived) == [1, 2, 3, 5]
+    assert [row["id"] for row in iter_archive(str(tmp_path), months=["2025-01"])] == [1, 2]
+    assert (await archiver.run(now=NOW)).messages == 0
+
+
+@pytest.mark.asyncio
+async def test_rows_are_only_deleted_once_archived(tmp_path):
+    client = FakeSupabaseClient()
+    add_history(client, "+911", ["2025-01-05T10:00:00+00:00", "2025-01-06T10:00:00+00:00"])
+    db_service = DatabaseService(client=client)
+    archiver = ChatArchiver(db_service, str(tmp_path))
+
+    async def failing_delete(ids):
+        raise ConnectionError("connection reset")
+
+    db_service.delete_chat_messages = failing_delete
+    with pytest.raises(ConnectionError):
+        await archiver.run(now=NOW)
+    assert len(client.tables["chat_history"]) == 2
+
+    del db_service.delete_chat_messages
+    assert (await archiver.run(now=NOW)).messages == 2
+
+    assert [row["id"] for row in iter_archive(str(tmp_path))] == [1, 2]
+    assert client.tables["chat_history"] == []
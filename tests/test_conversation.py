@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from services.conversation import ConversationLocks, combine_messages
+
+
+@pytest.mark.asyncio
+async def test_turns_for_one_user_are_serialized():
+    """
+    Tests that turns for the same phone number never overlap while turns for
+    different phone numbers run concurrently.
+    """
+    locks = ConversationLocks()
+    events = []
+
+    async def turn(phone, name):
+        async with locks.hold(phone):
+            events.append(f"start {name}")
+            await asyncio.sleep(0.01)
+            events.append(f"end {name}")
+
+    await asyncio.gather(turn("+911", "a1"), turn("+911", "a2"), turn("+912", "b1"))
+
+    assert events.index("end a1") < events.index("start a2")
+    assert events.index("start b1") < events.index("end a1")
+    assert len(locks) == 0
+
+
+def test_combine_messages():
+    assert combine_messages(["hi", "", "fever since 2 days"]) == "hi\nfever since 2 days"
@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from benchmarks.fakes import FakeTwilioServer
+from core.config import settings
+from services.emergency_lane import EmergencyLane, LatencyWindow, load_replies
+from services.job_queue import SQLiteJobQueue, WorkerPool
+from services.notification_service import NotificationService
+from services.sms_dispatcher import SmsDispatcher, TwilioHttpSender
+
+REPLIES = load_replies(settings.CRITICAL_REPLIES_PATH)
+
+
+def make_sender(server):
+    return TwilioHttpSender("AC123", "token", base_url="http://twilio.test", transport=httpx.ASGITransport(app=server))
+
+
+def test_replies_cover_the_keyword_languages():
+    assert set(REPLIES) >= {"en", "hi", "or"}
+    assert all("108" in reply for reply in REPLIES.values())
+
+
+def test_latency_window_percentiles():
+    window = LatencyWindow(size=100)
+    for ms in range(1, 101):
+        window.add(ms / 1000)
+
+    assert window.percentile(50) == pytest.approx(0.050, abs=0.001)
+    assert window.percentile(99) == pytest.approx(0.099, abs=0.001)
+    assert window.summary()["count"] == 100
+
+
+@pytest.mark.asyncio
+async def test_replies_are_sent_in_the_keyword_language():
+    server = FakeTwilioServer()
+    sender = make_sender(server)
+    lane = EmergencyLane(sender, REPLIES, sender_numbers=["+100", "whatsapp:+200"], concurrency=2)
+
+    lane.submit("+100", "+911", "hi", received_at=time.perf_counter())
+    lane.submit("whatsapp:+200", "whatsapp:+912", "or")
+    lane.submit("+100", "+913", "ta")
+    await lane.stop()
+    await sender.close()
+
+    sent = {m["to"]: m for m in server.messages}
+    assert sent["+911"]["body"] == REPLIES["hi"] and sent["+911"]["from"] == "+100"
+    assert sent["whatsapp:+912"]["body"] == REPLIES["or"]
+    # Languages without a reply fall back to English
+    assert sent["+913"]["body"] == REPLIES["en"]
+    assert lane.stats()["latency_seconds"]["count"] == 3
+
+
+@pytest.mark.asyncio
+async def test_emergency_replies_do_not_wait_for_a_saturated_dispatcher():
+    server = FakeTwilioServer(latency=0.05)
+    sender = make_sender(server)
+    dispatcher = SmsDispatcher(sender, concurrency=2, rate_per_second=1000, burst=1000)
+    lane = EmergencyLane(sender, REPLIES, sender_numbers=["+100"], concurrency=1, dispatcher=dispatcher)
+
+    backlog = [asyncio.create_task(dispatcher.send("+100", f"+91{i}", "normal")) for i in range(40)]
+    await asyncio.sleep(0.01)
+    lane.submit("+100", "+999", "en")
+    while lane.sent == 0:
+        await asyncio.sleep(0.01)
+
+    # The backlog needs about a second; the emergency reply needed one round trip
+    assert lane.latency.percentile(99) < 0.3
+    assert dispatcher.sent < 40
+    await asyncio.gather(*backlog)
+    await lane.stop()
+    await dispatcher.close()
+    await sender.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_replies_are_handed_over():
+    server = FakeTwilioServer()
+    server.failures = [503, 503]
+    sender = make_sender(server)
+    handed_over = []
+
+    async def on_failure(to_number, message_body):
+        handed_over.append((to_number, message_body))
+
+    lane = EmergencyLane(sender, REPLIES, sender_numbers=["+100"], max_attempts=2,
+                         retry_base_delay=0.01, on_failure=on_failure)
+    lane.submit("+100", "+911", "en")
+    await lane.stop()
+    await sender.close()
+
+    assert handed_over == [("+911", REPLIES["en"])]
+    assert lane.failed == 1 and server.messages == []
+
+
+@pytest.mark.asyncio
+async def test_handed_over_replies_are_retried_then_dead_lettered(tmp_path):
+    server = FakeTwilioServer()
+    server.failures = [400] * 3
+    sender = make_sender(server)
+    notifications = NotificationService(sender=sender)
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    pool = WorkerPool(queue, {"critical": notifications.send_critical_sms}, max_attempts=2,
+                      retry_base_delay=0.01, poll_interval=0.01)
+    await queue.enqueue("critical", "critical:+911", {"to_number": "+911", "message_body": REPLIES["en"]})
+
+    await pool.start()
+    for _ in range(200):
+        if (await queue.stats()).get("dead"):
+            break
+        await asyncio.sleep(0.01)
+    await pool.stop()
+    await notifications.dispatcher.close()
+    await sender.close()
+
+    assert [job["attempts"] for job in await queue.dead_letters()] == [2]
+    assert pool.retried == 1 and server.messages == []
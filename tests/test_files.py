@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+from core.files import atomic_write
+
+
+def test_atomic_write_replaces_the_file_only_when_complete(tmp_path):
+    path = str(tmp_path / "nested" / "snapshot.json")
+    with atomic_write(path, "w", encoding="utf-8") as f:
+        f.write("first")
+
+    with pytest.raises(RuntimeError):
+        with atomic_write(path, "w", encoding="utf-8") as f:
+            f.write("partial")
+            raise RuntimeError("interrupted")
+
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "first"
+    assert os.listdir(tmp_path / "nested") == ["snapshot.json"]
@@ -3,7 +3,7 @@ import pytest
 from dotenv import load_dotenv
 
 # This import now works correctly because of pyproject.toml
-from services.gsheets_service import GSheetsService
+from services.gsheets_service import FakeSheetBackend, GSheetsService
 
 # Load environment variables from .env file for testing
 load_dotenv()
@@ -16,13 +16,14 @@ skip_if_no_creds = pytest.mark.skipif(
 
 @skip_if_no_creds
 @pytest.mark.asyncio
-async def test_get_health_info():
+async def test_get_health_info(tmp_path):
     """
     Tests the connection to Google Sheets and retrieval of a specific topic.
     This is an integration test that requires a live connection.
     """
-    # ARRANGE: Instantiate the service and define a known topic
-    gsheets_service = GSheetsService()
+    # ARRANGE: Instantiate the service, download the sheet and define a known topic
+    gsheets_service = GSheetsService(snapshot_path=str(tmp_path / "snapshot.json"))
+    assert await gsheets_service.refresh(), "The Google Sheet could not be downloaded."
     known_topic = "Dengue"  # This must exist in your Google Sheet
 
     # ACT: Fetch the health info for the known topic
@@ -35,3 +36,50 @@ async def test_get_health_info():
     # Verify the structure and content of the returned data
     assert 'topic' in info, "The returned data must have a 'topic' key."
     assert info['topic'].lower() == known_topic.lower(), "The topic in the returned data should match the search topic."
+
+
+@pytest.mark.asyncio
+async def test_refresh_swaps_index_and_persists_snapshot(tmp_path):
+    """
+    Tests the background loader against the fake sheet backend: the first refresh
+    installs the data, and a new service instance starts from the saved snapshot.
+    """
+    # ARRANGE: A fake sheet and an empty snapshot location
+    snapshot_path = str(tmp_path / "snapshot.json")
+    backend = FakeSheetBackend([{"topic": "Dengue", "advice": "Drink fluids"}])
+    gsheets_service = GSheetsService(backend=backend, snapshot_path=snapshot_path, refresh_interval=0)
+    assert await gsheets_service.get_health_info("Dengue") is None
+
+    # ACT: Refresh from the sheet, then refresh again without changes
+    assert await gsheets_service.refresh() is True
+    assert await gsheets_service.refresh() is False
+
+    # ASSERT: The data is served now and by a fresh instance, without touching the sheet
+    assert (await gsheets_service.get_health_info("dengue"))["advice"] == "Drink fluids"
+    restarted = GSheetsService(backend=FakeSheetBackend(), snapshot_path=snapshot_path)
+    assert (await restarted.get_health_info("Dengue"))["advice"] == "Drink fluids"
+    assert restarted.backend.fetch_count == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_last_good_snapshot(tmp_path):
+    backend = FakeSheetBackend([{"topic": "Malaria"}])
+    gsheets_service = GSheetsService(backend=backend, snapshot_path=str(tmp_path / "snapshot.json"))
+    await gsheets_service.refresh()
+
+    backend.error = RuntimeError("sheet unavailable")
+    assert await gsheets_service.refresh() is False
+    assert await gsheets_service.get_health_info("Malaria") is not None
+
+
+@pytest.mark.asyncio
+async def test_start_refreshes_in_background(tmp_path):
+    backend = FakeSheetBackend([{"topic": "Heat Stroke"}])
+    gsheets_service = GSheetsService(backend=backend, snapshot_path=str(tmp_path / "snapshot.json"), refresh_interval=0)
+
+    await gsheets_service.start()
+    await gsheets_service._refresh_task
+    await gsheets_service.stop()
+
+    assert backend.fetch_count == 1
+    assert len(gsheets_service.records) == 1
@@ -0,0 +1,84 @@
+import json
+
+import httpx
+import pytest
+
+from services.idempotency import DUPLICATES_DROPPED, MessageDeduplicator, SeenSet, SQLiteSeenStore
+from services.job_queue import SQLiteJobQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_seen_set_is_bounded_and_time_windowed():
+    clock = FakeClock()
+    seen = SeenSet(window_seconds=10, max_entries=2, clock=clock)
+
+    assert seen.add("SM1") and seen.add("SM2")
+    assert not seen.add("SM1")
+    assert seen.add("SM3")
+    assert "SM1" not in seen and len(seen) == 2
+
+    clock.now = 10
+    assert "SM2" not in seen
+    assert seen.add("SM2")
+
+
+@pytest.mark.asyncio
+async def test_seen_store_survives_a_restart(tmp_path):
+    path = str(tmp_path / "seen.sqlite3")
+    first = MessageDeduplicator(store=SQLiteSeenStore(path, window_seconds=60))
+    assert await first.first_delivery("SM1")
+    first.close()
+
+    restarted = MessageDeduplicator(store=SQLiteSeenStore(path, window_seconds=60))
+    assert not await restarted.first_delivery("SM1")
+    assert await restarted.first_delivery("SM2")
+    assert restarted.stats() == {"accepted": 1, "dropped": 1, "remembered": 2}
+
+    await restarted.forget("SM2")
+    assert await restarted.first_delivery("SM2")
+    restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_expired_sids_in_the_store_are_accepted_again(tmp_path):
+    store = SQLiteSeenStore(str(tmp_path / "seen.sqlite3"), window_seconds=0.0, purge_every=1)
+
+    assert await store.add("SM1")
+    assert await store.add("SM1")
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_webhook_retries_are_dropped_before_queueing(tmp_path):
+    import main
+
+    saved = main.job_queue, main.deduplicator
+    main.job_queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    main.deduplicator = MessageDeduplicator(store=SQLiteSeenStore(str(tmp_path / "seen.sqlite3"), window_seconds=60))
+    dropped_before = DUPLICATES_DROPPED.value()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            for _ in range(3):
+                response = await client.post("/api/message", data={
+                    "From": "+15550001111", "Body": "what are dengue symptoms", "MessageSid": "SM123",
+                })
+                assert response.status_code == 204
+            await client.post("/api/message", data={"From": "+15550001111", "Body": "thanks", "MessageSid": "SM124"})
+        stats = await main.job_queue.stats()
+        payloads = [json.loads(row[0]) for row in main.job_queue._conn.execute("SELECT payload FROM jobs")]
+    finally:
+        main.job_queue.close()
+        main.deduplicator.close()
+        main.job_queue, main.deduplicator = saved
+
+    assert DUPLICATES_DROPPED.value() - dropped_before == 2
+    assert stats["pending"] == 1
+    assert payloads == [{"user_phone": "+15550001111", "user_messages": ["what are dengue symptoms", "thanks"]}]
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from benchmarks.load_pipeline import KNOWLEDGE_RECORDS, install_fakes, parse_args
+from models.schemas import User
+from services.gsheets_service import FakeSheetBackend, GSheetsService
+from services.intent_router import IntentRouter, apply_profile_updates
+
+
+@pytest.fixture
+def router(tmp_path):
+    gsheets_service = GSheetsService(backend=FakeSheetBackend(KNOWLEDGE_RECORDS), snapshot_path=str(tmp_path / "snapshot.json"))
+    asyncio.run(gsheets_service.refresh())
+    return IntentRouter(knowledge_base=gsheets_service)
+
+
+@pytest.mark.parametrize("message,updates", [
+    ("my age is 54", {"age": 54}),
+    ("Hi, I am 54 and I have diabetes.", {"age": 54, "has_diabetes": True}),
+    ("I have diabetes and high BP", {"has_diabetes": True, "has_hypertension": True}),
+    ("I am not diabetic", {"has_diabetes": False}),
+    ("mujhe sugar nahi hai", {"has_diabetes": False}),
+    ("I have no high BP", {"has_hypertension": False}),
+    ("meri umar 60 hai", {"age": 60}),
+    ("I also have thyroid", {"add_conditions": ["Thyroid"]}),
+    ("hindi mein baat karo", {"language": "Hindi"}),
+    ("ok thanks. Please change language to Odia", {"language": "Odia"}),
+])
+def test_profile_statements_are_answered_locally(router, message, updates):
+    routed = router.route(message)
+
+    assert routed.route == "profile"
+    assert routed.updates == updates
+    assert routed.reply.startswith("Thank you, I have updated your health profile")
+
+
+@pytest.mark.parametrize("message", [
+    "I am 5 days into a fever, what should I do?",
+    "I have sugar in my tea, is that bad?",
+    "my father is 70 and has diabetes",
+    "What should I eat for breakfast with diabetes?",
+    "no sugar",
+    "hello",
+])
+def test_anything_else_goes_to_gemini(router, message):
+    routed = router.route(message)
+
+    assert routed.route == "gemini"
+    assert routed.updates == {} and routed.reply is None
+
+
+@pytest.mark.parametrize("message", ["dengue", "What is dengue?", "dengu", "dengue kya hai"])
+def test_bare_topics_are_answered_from_the_knowledge_base(router, message):
+    routed = router.route(message)
+
+    assert routed.route == "topic" and routed.topic == "Dengue"
+    assert "Drink fluids, test for NS1." in routed.reply
+
+
+def test_profile_update_with_a_question_still_saves_the_update(router):
+    routed = router.route("I am 40. Which vaccines does my baby need?")
+
+    assert routed.route == "gemini"
+    assert routed.updates == {"age": 40} and routed.reply is None
+    assert router.route("I have asthma. What is dengue?").route == "profile+topic"
+
+
+def test_updates_are_merged_into_the_profile():
+    user = User(phone_number="+911", age=30, has_diabetes=False, other_conditions="asthma")
+
+    updated = apply_profile_updates(user, {"has_diabetes": True, "add_conditions": ["Asthma", "Thyroid"]})
+
+    assert updated.age == 30 and updated.has_diabetes is True
+    assert updated.other_conditions == "asthma, Thyroid"
+
+
+@pytest.mark.asyncio
+async def test_profile_update_is_saved_and_confirmed_without_gemini(tmp_path):
+    import main
+
+    options = parse_args(["--gemini-latency", "0", "--supabase-latency", "0", "--twilio-latency", "0"])
+    fakes = install_fakes(main, options, str(tmp_path))
+    await main.gsheets_service.refresh()
+
+    await main._process_turn("+919800000001", "my age is 54")
+    while main.notification_service.dispatcher.pending:
+        await asyncio.sleep(0.01)
+
+    assert fakes["gemini"].prompts == []
+    assert (await main.db_service.get_profile("+919800000001")).age == 54
+    assert [message["body"] for message in fakes["twilio"].messages] == [
+        "Thank you, I have updated your health profile: age 54."
+    ]
@@ -0,0 +1,230 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from benchmarks.load_pipeline import install_fakes, parse_args
+from services.job_queue import JobQueue, SQLiteJobQueue, WorkerPool, current_job
+from services.shared_state import InMemorySharedState
+
+
+@pytest.mark.asyncio
+async def test_jobs_with_the_same_key_run_in_order(tmp_path):
+    """
+    Tests that a second job for a phone number is not claimable while the first
+    is running, while jobs for other phone numbers are.
+    """
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    await queue.enqueue("message", "+911", {"n": 1})
+    await queue.enqueue("message", "+911", {"n": 2})
+    await queue.enqueue("message", "+912", {"n": 3})
+
+    first = await queue.claim()
+    other = await queue.claim()
+    assert (first.key, first.payload) == ("+911", {"n": 1})
+    assert (other.key, other.payload) == ("+912", {"n": 3})
+    assert await queue.claim() is None
+
+    await queue.complete(first)
+    assert (await queue.claim()).payload == {"n": 2}
+
+
+@pytest.mark.asyncio
+async def test_jobs_survive_reopening_the_queue(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    queue = SQLiteJobQueue(path)
+    await queue.enqueue("message", "+911", {"n": 1})
+    queue.close()
+
+    reopened = SQLiteJobQueue(path)
+    job = await reopened.claim()
+    assert job.payload == {"n": 1}
+    assert job.attempts == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_makes_a_job_claimable_again(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=0)
+    await queue.enqueue("message", "+911", {"n": 1})
+
+    await queue.claim()
+    job = await queue.claim()
+    assert job.attempts == 2
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_retries_then_dead_letters(tmp_path):
+    """
+    Tests that failing jobs are retried with backoff and finally dead-lettered,
+    and that later jobs for the same key still run.
+    """
+    # ARRANGE: One handler that always fails and one that records its calls
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    handled = []
+
+    async def broken(**payload):
+        raise RuntimeError("boom")
+
+    async def record(n):
+        handled.append(n)
+
+    pool = WorkerPool(queue, {"broken": broken, "ok": record}, concurrency=2,
+                      max_attempts=3, retry_base_delay=0.01, poll_interval=0.01)
+    await queue.enqueue("broken", "+911", {})
+    await queue.enqueue("ok", "+911", {"n": 1})
+
+    # ACT: Run the pool until the queue drains
+    await pool.start()
+    for _ in range(200):
+        if handled:
+            break
+        await asyncio.sleep(0.01)
+    await pool.stop()
+
+    # ASSERT: The broken job was dead-lettered after three attempts
+    dead = await queue.dead_letters()
+    assert handled == [1]
+    assert [(job["kind"], job["attempts"]) for job in dead] == [("broken", 3)]
+    assert "boom" in dead[0]["error"]
+    assert pool.retried == 2
+    assert await queue.stats() == {"dead": 1}
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_bounds_concurrency(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    running = 0
+    peak = 0
+
+    async def slow(n):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+
+    for n in range(12):
+        await queue.enqueue("slow", f"+91{n}", {"n": n})
+    pool = WorkerPool(queue, {"slow": slow}, concurrency=3, poll_interval=0.01)
+    await pool.start()
+    for _ in range(200):
+        if pool.completed == 12:
+            break
+        await asyncio.sleep(0.01)
+    await pool.stop()
+
+    assert pool.completed == 12
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_burst_messages_are_coalesced_into_one_job(tmp_path):
+    """
+    Tests that messages arriving within the debounce window extend the waiting
+    job instead of creating new ones, and that the job is not runnable until the window passes.
+    """
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    for text in ("hi", "i have fever", "since 2 days"):
+        await queue.enqueue("message", "+911", {"user_phone": "+911", "user_messages": [text]},
+                            coalesce_within=0.05, max_wait=1.0)
+
+    assert await queue.claim() is None
+    await asyncio.sleep(0.06)
+    job = await queue.claim()
+    assert job.payload["user_messages"] == ["hi", "i have fever", "since 2 days"]
+    assert await queue.stats() == {"running": 1}
+
+
+@pytest.mark.asyncio
+async def test_messages_after_a_turn_started_get_a_new_job(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    await queue.enqueue("message", "+911", {"user_messages": ["first"]}, coalesce_within=0)
+    running = await queue.claim()
+
+    await queue.enqueue("message", "+911", {"user_messages": ["second"]}, coalesce_within=0)
+    assert await queue.claim() is None  # ordered behind the running turn
+
+    await queue.complete(running)
+    assert (await queue.claim()).payload["user_messages"] == ["second"]
+
+
+def test_job_queue_is_an_interface():
+    with pytest.raises(TypeError):
+        JobQueue()
+
+
+@pytest.mark.asyncio
+async def test_a_retried_turn_does_not_send_its_reply_twice(tmp_path, monkeypatch):
+    import main
+
+    options = parse_args(["--gemini-latency", "0", "--supabase-latency", "0", "--twilio-latency", "0"])
+    fakes = install_fakes(main, options, str(tmp_path))
+    await main.gsheets_service.refresh()
+    path = str(tmp_path / "retry.sqlite3")
+    queue = SQLiteJobQueue(path, lease_seconds=0.05)
+    await queue.enqueue("message", "+919800000002", {"user_phone": "+919800000002", "user_messages": ["my age is 54"]})
+
+    async def failing_save(message):
+        raise ConnectionError("connection reset")
+
+    # The first attempt sends the reply, then saving the turn fails and the process dies
+    monkeypatch.setattr(main.db_service, "save_chat_message", failing_save)
+    monkeypatch.setattr(main, "job_queue", queue)
+    job = await queue.claim()
+    token = current_job.set(job)
+    try:
+        await main.process_message_logic("+919800000002", "my age is 54")
+    finally:
+        current_job.reset(token)
+    queue.close()
+
+    # After a restart: a new queue connection and empty in-process state, and the lease has expired
+    reopened = SQLiteJobQueue(path, lease_seconds=0.05)
+    monkeypatch.setattr(main, "job_queue", reopened)
+    monkeypatch.setattr(main, "shared_state", InMemorySharedState())
+    await asyncio.sleep(0.06)
+    retried = await reopened.claim()
+    token = current_job.set(retried)
+    try:
+        await main.process_message_logic("+919800000002", "my age is 54")
+    finally:
+        current_job.reset(token)
+    while main.notification_service.dispatcher.pending:
+        await asyncio.sleep(0.01)
+    reopened.close()
+
+    assert retried.id == job.id and retried.attempts == 2
+    assert len(fakes["twilio"].messages) == 1
+
+
+@pytest.mark.asyncio
+async def test_a_turn_that_fails_before_sending_is_retried(tmp_path, monkeypatch):
+    import main
+
+    options = parse_args(["--gemini-latency", "0", "--supabase-latency", "0", "--twilio-latency", "0"])
+    install_fakes(main, options, str(tmp_path))
+
+    async def failing_get_profile(phone):
+        raise ConnectionError("connection reset")
+
+    monkeypatch.setattr(main.db_service, "get_profile", failing_get_profile)
+    with pytest.raises(ConnectionError):
+        await main.process_message_logic("+919800000003", "hello")
+
+
+@pytest.mark.asyncio
+async def test_queue_files_from_before_delivery_tracking_are_upgraded(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, key TEXT NOT NULL, "
+                 "payload TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                 "available_at REAL NOT NULL, locked_until REAL, created_at REAL NOT NULL, last_error TEXT)")
+    conn.execute("INSERT INTO jobs (kind, key, payload, available_at, created_at) VALUES ('message', '+911', '{}', 0, 0)")
+    conn.commit()
+    conn.close()
+
+    queue = SQLiteJobQueue(path)
+    job = await queue.claim()
+    assert not await queue.delivered(job)
+    await queue.mark_delivered(job)
+    assert await queue.delivered(job)
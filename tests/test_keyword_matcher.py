@@ -0,0 +1,61 @@
+import pytest
+
+from core.config import settings
+from core.text import normalize_text, normalize_with_offsets
+from services.keyword_matcher import KeywordMatcher
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    # Uses the bundled, versioned keyword set that main.py loads at startup
+    return KeywordMatcher.from_file(settings.CRITICAL_KEYWORDS_PATH)
+
+
+@pytest.mark.parametrize("message, keyword", [
+    ("I have CHEST PAIN since morning", "chest pain"),
+    ("chest   pain!!", "chest pain"),
+    ("I cant breathe", "can't breathe"),
+    ("I can't... breathe", "can't breathe"),
+    ("heartattack?", "heart attack"),
+    ("mere papa behosh ho gaye", "unconscious"),
+    ("मुझे छाती में दर्द है", "chest pain"),
+    ("ମୋର ଛାତି ଯନ୍ତ୍ରଣା ହେଉଛି", "chest pain"),
+    ("there was an accidental fall", "accident"),
+])
+def test_detects_normalized_and_transliterated_variants(matcher, message, keyword):
+    """
+    Tests that spacing, punctuation, case and Hindi/Odia variants all match.
+    """
+    match = matcher.search(message)
+    assert match is not None, f"Expected '{keyword}' in '{message}'"
+    assert match.keyword == keyword
+
+
+@pytest.mark.parametrize("message", ["what are dengue symptoms?", "my pain is gone", "ଏହି ବିଷୟରେ କୁହ"])
+def test_ignores_normal_messages(matcher, message):
+    assert matcher.search(message) is None
+
+
+def test_reports_position_in_original_message():
+    """
+    Tests that offsets point at the matched text in the un-normalized message.
+    """
+    matcher = KeywordMatcher([("chest pain", "chest pain", "en")])
+    message = "Help!  CHEST,  pain now"
+    match = matcher.search(message)
+
+    assert match is not None
+    assert message[match.start:match.end] == "CHEST,  pain"
+
+
+def test_find_all_reports_overlapping_keywords():
+    matcher = KeywordMatcher([("he", "he", "en"), ("she", "she", "en"), ("hers", "hers", "en")], version="t1")
+    keywords = [m.keyword for m in matcher.find_all("she hers")]
+
+    assert keywords == ["she", "he", "hers"]
+    assert matcher.version == "t1"
+
+
+@pytest.mark.parametrize("text", ["  Can't   BREATHE!! ", "ମୋର ଛାତି ଯନ୍ତ୍ରଣା", "ज़हर खा लिया", "ﬁrst—second", ""])
+def test_fast_normalization_matches_offset_tracking_normalization(text):
+    assert normalize_text(text) == normalize_with_offsets(text)[0]
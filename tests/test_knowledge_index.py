@@ -0,0 +1,41 @@
+from services.knowledge_index import KnowledgeIndex
+
+RECORDS = [
+    {"topic": "Dengue", "symptoms": "High fever, joint pain"},
+    {"topic": "Malaria", "symptoms": "Fever with chills"},
+    {"topic": "Heat Stroke", "symptoms": "Hot dry skin, confusion"},
+    {"topic": "Diabetes", "symptoms": "Thirst, frequent urination"},
+    {"topic": "dengue", "symptoms": "Duplicate row that should be ignored"},
+    {"title": "Row without a topic"},
+]
+
+
+def test_exact_lookup_ignores_case_and_spacing():
+    index = KnowledgeIndex(RECORDS)
+
+    assert index.get("DENGUE")["symptoms"] == "High fever, joint pain"
+    assert index.get("heat   stroke")["topic"] == "Heat Stroke"
+    assert index.get("Typhoid") is None
+    assert len(index) == 4
+
+
+def test_search_is_typo_tolerant_and_ranked():
+    """
+    Tests that partial and misspelled queries find the intended topic first.
+    """
+    index = KnowledgeIndex(RECORDS)
+
+    results = index.search("dengu fever")
+    assert results[0].topic == "Dengue"
+
+    results = index.search("malarya", k=2)
+    assert results[0].topic == "Malaria"
+    assert len(results) <= 2
+    assert all(a.score >= b.score for a, b in zip(results, results[1:]))
+
+
+def test_search_returns_nothing_below_threshold():
+    index = KnowledgeIndex(RECORDS)
+
+    assert index.search("xyz") == []
+    assert index.search("") == []
@@ -0,0 +1,120 @@
+import asyncio
+
+import httpx
+import pytest
+
+from services.lifecycle import Dependencies
+
+
+class FakeDependency:
+    def __init__(self, delay: float = 0.0, failures: int = 0):
+        self.delay = delay
+        self.failures = failures
+        self.events = []
+
+    async def start(self):
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("unreachable")
+        self.events.append("start")
+
+    async def stop(self):
+        self.events.append("stop")
+
+
+async def _append(items, item):
+    items.append(item)
+
+
+@pytest.mark.asyncio
+async def test_dependencies_start_concurrently_and_stop_in_reverse():
+    stopped = []
+    dependencies = Dependencies(start_timeout=1.0, retry_interval=0.01)
+    for name in ("database", "gemini", "twilio"):
+        fake = FakeDependency(delay=0.1)
+        dependencies.add(name, fake.start, lambda name=name: _append(stopped, name))
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await dependencies.start()
+
+    assert loop.time() - started < 0.25
+    assert dependencies.ready
+    await dependencies.stop()
+    assert stopped == ["twilio", "gemini", "database"]
+
+
+@pytest.mark.asyncio
+async def test_failed_dependency_is_retried_until_ready():
+    flaky = FakeDependency(failures=2)
+    dependencies = Dependencies(start_timeout=1.0, retry_interval=0.01)
+    dependencies.add("database", flaky.start, flaky.stop)
+
+    await asyncio.wait_for(dependencies.start(), 1.0)
+
+    report = dependencies.report()["dependencies"]["database"]
+    assert report["state"] == "ready" and report["attempts"] == 3 and report["error"] is None
+    await dependencies.stop()
+    assert flaky.events == ["start", "stop"]
+
+
+@pytest.mark.asyncio
+async def test_optional_dependency_does_not_block_readiness():
+    down = FakeDependency(failures=1000)
+    dependencies = Dependencies(start_timeout=1.0, retry_interval=0.01)
+    dependencies.add("database", FakeDependency().start)
+    dependencies.add("knowledge_base", down.start, down.stop, required=False)
+
+    await asyncio.wait_for(dependencies.start(), 1.0)
+    await dependencies.wait_ready()
+
+    report = dependencies.report()
+    assert report["ready"] is True
+    assert report["dependencies"]["knowledge_base"]["state"] in ("failed", "starting")
+    assert report["dependencies"]["knowledge_base"]["error"] == "ConnectionError: unreachable"
+    await dependencies.stop()
+    assert down.events == []
+
+
+@pytest.mark.asyncio
+async def test_slow_start_times_out_and_is_reported():
+    dependencies = Dependencies(start_timeout=0.01, retry_interval=10.0)
+    dependencies.add("gemini", FakeDependency(delay=1.0).start)
+
+    starting = asyncio.create_task(dependencies.start())
+    await asyncio.sleep(0.05)
+
+    report = dependencies.report()
+    assert report["ready"] is False
+    assert report["dependencies"]["gemini"]["state"] == "failed"
+    assert report["dependencies"]["gemini"]["error"].startswith("TimeoutError")
+    starting.cancel()
+    await dependencies.stop()
+
+
+@pytest.mark.asyncio
+async def test_health_endpoints_report_each_dependency():
+    import main
+
+    saved = main.dependencies
+    main.dependencies = Dependencies(start_timeout=1.0, retry_interval=0.01)
+    gate = asyncio.Event()
+    main.dependencies.add("database", gate.wait)
+    try:
+        starting = asyncio.create_task(main.dependencies.start())
+        await asyncio.sleep(0)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            assert (await client.get("/health/live")).status_code == 200
+            not_ready = await client.get("/health/ready")
+            gate.set()
+            await starting
+            ready = await client.get("/health/ready")
+    finally:
+        main.dependencies = saved
+
+    assert not_ready.status_code == 503
+    assert not_ready.json()["dependencies"]["database"]["state"] == "starting"
+    assert ready.status_code == 200
+    assert ready.json()["dependencies"]["database"]["state"] == "ready"
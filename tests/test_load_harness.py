@@ -0,0 +1,50 @@
+import pytest
+
+from benchmarks.load_pipeline import compare, generate_traffic, parse_args, run_load
+
+
+def test_traffic_is_replayable_and_bursty():
+    first = generate_traffic(users=20, rate=30, duration=5, seed=1)
+    second = generate_traffic(users=20, rate=30, duration=5, seed=1)
+
+    assert first == second
+    assert 80 <= len(first) <= 220
+    assert [arrival.at for arrival in first] == sorted(arrival.at for arrival in first)
+    assert len({arrival.phone for arrival in first}) <= 20
+
+
+def test_regressions_beyond_the_threshold_are_reported():
+    baseline = {
+        "throughput_msgs_per_sec": 100.0,
+        "reply_latency": {"p99": 1.0},
+        "peak_rss_mb": 150.0,
+        "stages": {"gemini.generate": {"p99": 0.8}},
+    }
+    slower = {
+        "throughput_msgs_per_sec": 70.0,
+        "reply_latency": {"p99": 1.1},
+        "peak_rss_mb": 155.0,
+        "stages": {"gemini.generate": {"p99": 1.2}},
+    }
+
+    regressions = compare(slower, baseline, threshold=0.2)
+
+    assert [line.split(":")[0] for line in regressions] == ["throughput_msgs_per_sec", "stages.gemini.generate.p99"]
+    assert compare(baseline, baseline) == []
+
+
+@pytest.mark.asyncio
+async def test_small_load_run_answers_every_message():
+    options = parse_args([
+        "--users", "5", "--rate", "20", "--duration", "0.5", "--debounce", "0.05",
+        "--gemini-latency", "0", "--gemini-jitter", "0", "--gemini-chunk-latency", "0",
+        "--supabase-latency", "0", "--twilio-latency", "0", "--drain-timeout", "30",
+    ])
+
+    report = await run_load(options)
+
+    assert report["messages"] > 0
+    assert report["unanswered"] == 0
+    assert report["sms_sent"] > 0
+    assert report["stages"]["job.message"]["count"] > 0
+    assert report["webhook_latency"]["count"] == report["messages"]
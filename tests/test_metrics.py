@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import FakeGeminiModel
+from models.schemas import User
+from services.gemini_service import GEMINI_TOKENS, GeminiService
+from services.metrics import MetricsRegistry
+from services.response_cache import ResponseCache
+from services.tracing import Tracer, tracer
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("stage_latency_seconds", "Stage latency.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, stage="gemini")
+    registry.counter("messages_total", "Messages.").inc(2)
+    registry.gauge("queue_depth", "Queued jobs.", lambda: 7)
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE stage_latency_seconds histogram" in lines
+    assert 'stage_latency_seconds_bucket{stage="gemini",le="0.1"} 1' in lines
+    assert 'stage_latency_seconds_bucket{stage="gemini",le="1"} 3' in lines
+    assert 'stage_latency_seconds_bucket{stage="gemini",le="+Inf"} 4' in lines
+    assert 'stage_latency_seconds_count{stage="gemini"} 4' in lines
+    assert 'stage_latency_seconds_sum{stage="gemini"} 4.05' in lines
+    assert "messages_total 2" in lines
+    assert "queue_depth 7" in lines
+
+
+@pytest.mark.asyncio
+async def test_sampled_traces_record_nested_spans():
+    exported = []
+    sampled = Tracer(MetricsRegistry(), sample_rate=1.0, exporter=exported.append)
+
+    with sampled.span("job.message") as root:
+        with sampled.span("db.get_user") as child:
+            child.set_attribute("cached", True)
+            await asyncio.sleep(0)
+        sampled.record("gemini.generate", 0.25)
+
+    assert [span.name for span in exported] == ["db.get_user", "gemini.generate", "job.message"]
+    assert {span.trace_id for span in exported} == {root.trace_id}
+    assert exported[0].parent_id == root.span_id and exported[0].attributes == {"cached": True}
+    assert sampled.stage_latency.count(stage="gemini.generate") == 1
+
+
+def test_unsampled_traces_only_update_histograms():
+    exported = []
+    unsampled = Tracer(MetricsRegistry(), sample_rate=0.0, exporter=exported.append)
+
+    with unsampled.span("job.message"):
+        with unsampled.span("db.get_user") as child:
+            child.set_attribute("ignored", 1)
+
+    assert exported == [] and len(unsampled.recent) == 0
+    assert unsampled.stage_latency.count(stage="job.message") == 1
+    assert unsampled.stage_latency.count(stage="db.get_user") == 1
+
+
+def test_failed_spans_are_marked():
+    sampled = Tracer(MetricsRegistry(), sample_rate=1.0, exporter=None)
+
+    with pytest.raises(ValueError):
+        with sampled.span("db.get_user"):
+            raise ValueError("boom")
+
+    assert sampled.recent[-1].attributes == {"error": "ValueError"}
+
+
+@pytest.mark.asyncio
+async def test_gemini_token_counts_are_recorded():
+    before = GEMINI_TOKENS.value(type="completion")
+    generated_before = tracer.stage_latency.count(stage="gemini.generate")
+    model = FakeGeminiModel(reply="x" * 400)
+    service = GeminiService(model=model, response_cache=ResponseCache())
+    user = User(phone_number="+911", language="English")
+
+    await service.get_ai_response("fever", user, [])
+    assert [piece async for piece in service.stream_ai_response("cough", user, [])]
+
+    assert GEMINI_TOKENS.value(type="completion") - before == 200
+    assert GEMINI_TOKENS.value(type="prompt") > 0
+    assert tracer.stage_latency.count(stage="gemini.generate") - generated_before == 2
@@ -0,0 +1,58 @@
+import pytest
+
+from benchmarks.fakes import FakeGeminiModel
+from core.text import estimate_tokens
+from models.schemas import User
+from services.gemini_service import SYSTEM_INSTRUCTION, GeminiService
+from services.prompt_builder import PromptBuilder, condense
+
+
+def _history(turns):
+    history = []
+    for n in range(turns):
+        history.append({"sender": "user", "message_text": f"Question number {n} about my sugar levels and diet?"})
+        history.append({"sender": "bot", "message_text": f"Answer number {n}. Eat whole grains and walk daily. See a doctor."})
+    return history
+
+
+def test_prompt_fits_the_budget_and_keeps_the_newest_turns():
+    """
+    Tests that older turns are summarized while the newest are kept verbatim.
+    """
+    builder = PromptBuilder(max_tokens=200, summary_max_tokens=60)
+
+    prompt = builder.build("what about rice?", "Language: English, Age: 54", _history(10), conversation_id="+911")
+
+    assert estimate_tokens(prompt) <= 200 + 20  # section headers are estimated loosely
+    assert "Answer number 9. Eat whole grains and walk daily. See a doctor." in prompt
+    assert "**Summary of Earlier Conversation:**" in prompt
+    assert prompt.rstrip().endswith("what about rice?")
+
+
+def test_rolling_summary_is_extended_incrementally():
+    builder = PromptBuilder(max_tokens=150, summary_max_tokens=1000)
+    history = _history(6)
+
+    builder.build("next", "profile", history, conversation_id="+911")
+    first = list(builder._summaries["+911"].lines)
+    history = history[2:] + _history(7)[-2:]
+    builder.build("next", "profile", history, conversation_id="+911")
+    second = list(builder._summaries["+911"].lines)
+
+    assert second[:len(first)] == first
+    assert len(second) == len(set(second))
+
+
+def test_condense_keeps_the_first_sentence():
+    message = {"sender": "bot", "message_text": "Drink ORS.   Rest well and see a doctor."}
+    assert condense(message) == "Bot: Drink ORS."
+
+
+@pytest.mark.asyncio
+async def test_system_instruction_is_not_resent_in_the_prompt():
+    model = FakeGeminiModel()
+    gemini_service = GeminiService(model=model)
+
+    await gemini_service.get_ai_response("hello", User(phone_number="+911"), [])
+
+    assert SYSTEM_INSTRUCTION not in model.prompts[0]
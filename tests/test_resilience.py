@@ -0,0 +1,182 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import FakeGeminiModel
+from models.schemas import User
+from services.gemini_service import ERROR_MESSAGE, FALLBACK_PREFIX, GEMINI_DEGRADED, GeminiService
+from services.resilience import AdaptiveLimiter, CircuitBreaker, Overloaded
+from services.response_cache import ResponseCache
+from services.retrieval import KnowledgeRetriever
+
+RECORDS = [
+    {"topic": "Dengue", "symptoms": "High fever, joint pain", "prevention": "Avoid mosquito bites"},
+    {"topic": "Malaria", "symptoms": "Fever with chills", "prevention": "Use bed nets"},
+]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeKnowledgeBase:
+    def __init__(self):
+        self.retriever = KnowledgeRetriever(RECORDS)
+
+    def retrieve(self, message, k=3):
+        return self.retriever.search(message, k=k)
+
+
+def make_service(model, breaker=None, limiter=None, timeout=1.0):
+    service = GeminiService(model=model, response_cache=ResponseCache(), knowledge_base=FakeKnowledgeBase(),
+                            limiter=limiter, breaker=breaker)
+    service.timeout = service.first_chunk_timeout = timeout
+    service.queue_timeout = 0.05
+    return service
+
+
+@pytest.mark.asyncio
+async def test_limit_grows_on_fast_calls_and_is_cut_once_per_slowdown():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=5, latency_target=1.0, clock=clock)
+
+    for _ in range(8):
+        async with limiter.slot(queue_timeout=1):
+            pass
+    assert limiter.limit == 5
+
+    for _ in range(3):
+        with pytest.raises(asyncio.TimeoutError):
+            async with limiter.slot(queue_timeout=1):
+                raise asyncio.TimeoutError()
+    assert int(limiter.limit) == 2
+
+    clock.now = 1.0
+    async with limiter.slot(queue_timeout=1):
+        clock.now = 3.0
+    assert int(limiter.limit) == 1
+
+
+@pytest.mark.asyncio
+async def test_calls_beyond_the_limit_queue_and_are_refused_after_the_queue_timeout():
+    model = FakeGeminiModel(latency=0.05)
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=2)
+
+    async def call():
+        async with limiter.slot(queue_timeout=1):
+            return await model.generate_content_async("prompt")
+
+    await asyncio.gather(*(call() for _ in range(6)))
+    assert model.max_in_flight == 2
+
+    async with limiter.slot(queue_timeout=1), limiter.slot(queue_timeout=1):
+        with pytest.raises(Overloaded):
+            async with limiter.slot(queue_timeout=0.01):
+                pass
+    assert limiter.stats()["refused"] == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_answer_is_replaced_by_the_knowledge_base():
+    model = FakeGeminiModel(spike_probability=1.0, spike_latency=5.0)
+    service = make_service(model, timeout=0.05)
+    timeouts_before = GEMINI_DEGRADED.value(reason="timeout")
+
+    answer = await service.get_ai_response("how to prevent malaria", User(phone_number="+911"), [])
+    streamed = [part async for part in service.stream_ai_response("dengue fever", User(phone_number="+911"), [])]
+
+    assert answer.startswith(FALLBACK_PREFIX) and "Use bed nets" in answer
+    assert len(streamed) == 1 and "Avoid mosquito bites" in streamed[0]
+    assert GEMINI_DEGRADED.value(reason="timeout") - timeouts_before == 2
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_during_an_outage_and_recovers():
+    clock = FakeClock()
+    model = FakeGeminiModel(reply="Use bed nets and see a doctor.")
+    service = make_service(model, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock))
+    user = User(phone_number="+911")
+
+    # Answered once while healthy, so the cache can serve it during the outage
+    await service.get_ai_response("how to prevent malaria", user, [])
+    model.error = ConnectionError("unreachable")
+    for _ in range(2):
+        await service.get_ai_response("dengue fever", user, [])
+    calls = len(model.prompts)
+
+    assert service.breaker.state == CircuitBreaker.OPEN
+    assert "Avoid mosquito bites" in await service.get_ai_response("dengue fever", user, [])
+    assert await service.get_ai_response("how to prevent malaria", user, []) == "Use bed nets and see a doctor."
+    assert len(model.prompts) == calls
+
+    # After the reset timeout a single trial call goes through and closes the breaker
+    model.error = None
+    clock.now = 30
+    assert await service.get_ai_response("dengue fever", user, []) == "Use bed nets and see a doctor."
+    assert service.breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_request_errors_do_not_open_the_breaker():
+    model = FakeGeminiModel()
+    model.error = ValueError("response blocked by safety filters")
+    service = make_service(model, breaker=CircuitBreaker(failure_threshold=1))
+
+    assert await service.get_ai_response("dengue fever", User(phone_number="+911"), []) == ERROR_MESSAGE
+    assert service.breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_half_open_breaker_allows_one_trial_at_a_time():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock.now = 10
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_skipped()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.opened == 2
+
+
+@pytest.mark.asyncio
+async def test_the_half_open_trial_is_released_however_the_stream_ends():
+    clock = FakeClock()
+    model = FakeGeminiModel(reply="Use bed nets and see a doctor.", chunk_size=5, chunk_latency=0.01)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    service = make_service(model, breaker=breaker)
+    user = User(phone_number="+911")
+
+    def reopen():
+        breaker.record_failure()
+        clock.now += 30
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # The consumer stops reading after the first piece
+    reopen()
+    stream = service.stream_ai_response("dengue fever", user, [])
+    assert await stream.__anext__() == "Use b"
+    await stream.aclose()
+    assert breaker.allow()
+
+    # The task reading the stream is cancelled between two pieces
+    reopen()
+    model.chunk_latency = 0.05
+    reader = asyncio.create_task(service.get_ai_response("malaria fever", user, []))
+    await asyncio.sleep(0.075)
+    reader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await reader
+    assert breaker.allow()
+
+    # Building the prompt fails: the trial counts as failed and the breaker opens again
+    reopen()
+    service._build_prompt = lambda *args: {}["missing"]
+    assert await service.get_ai_response("typhoid fever", user, []) == ERROR_MESSAGE
+    assert breaker.state == CircuitBreaker.OPEN
@@ -0,0 +1,90 @@
+import pytest
+
+from benchmarks.fakes import FakeGeminiModel
+from models.schemas import User
+from services.gemini_service import GeminiService
+from services.response_cache import ResponseCache
+
+ENGLISH = User(phone_number="+911")
+DIABETIC = User(phone_number="+912", has_diabetes=True)
+HISTORY = [{"sender": "user", "message_text": "what is dengue?"}, {"sender": "bot", "message_text": "Dengue is..."}]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_exact_hits_ignore_case_and_punctuation_but_not_profile():
+    cache = ResponseCache(similarity_threshold=None)
+    cache.put("Dengue symptoms?", ENGLISH, [], "Fever and joint pain.", latency=2.0)
+
+    assert cache.get("dengue   SYMPTOMS", User(phone_number="+913"), []) == "Fever and joint pain."
+    assert cache.get("dengue symptoms", DIABETIC, []) is None
+    assert cache.stats()["exact_hits"] == 1
+    assert cache.stats()["latency_saved_seconds"] == pytest.approx(2.0)
+
+
+def test_similar_questions_hit_the_tfidf_tier():
+    cache = ResponseCache(similarity_threshold=0.8)
+    cache.put("dengue symptoms", ENGLISH, [], "Fever and joint pain.")
+    cache.put("malaria treatment", ENGLISH, [], "See a doctor for medicines.")
+
+    assert cache.get("What are the symptoms of dengue?", ENGLISH, []) == "Fever and joint pain."
+    assert cache.get("dengue treatment", ENGLISH, []) is None
+    assert cache.stats()["similar_hits"] == 1
+
+
+def test_similar_lookups_only_score_questions_sharing_a_term():
+    cache = ResponseCache(max_entries=2, similarity_threshold=0.8)
+    cache.put("dengue symptoms", ENGLISH, [], "Fever and joint pain.")
+    cache.put("dengue symptoms", DIABETIC, [], "Fever; watch your sugar.")
+    cache.put("malaria treatment", ENGLISH, [], "See a doctor for medicines.")
+
+    assert cache.get("symptoms of dengue", ENGLISH, []) is None  # evicted, and its terms left the index
+    assert cache.get("symptoms of dengue", DIABETIC, []) == "Fever; watch your sugar."
+    assert cache.get("treatment for malaria", ENGLISH, []) == "See a doctor for medicines."
+    assert sorted(sorted(postings) for postings in cache._postings.values()) == [
+        ["dengue", "symptoms"], ["malaria", "treatment"]
+    ]
+
+
+def test_follow_up_questions_bypass_the_cache():
+    cache = ResponseCache()
+    cache.put("is it contagious", ENGLISH, HISTORY, "Dengue is not contagious.")
+    cache.put("is dengue contagious", ENGLISH, [], "Dengue is not contagious.")
+
+    assert cache.get("is it contagious?", ENGLISH, HISTORY) is None
+    assert cache.get("is dengue contagious", ENGLISH, HISTORY) == "Dengue is not contagious."
+    assert len(cache) == 1
+    assert cache.stats()["bypassed"] == 1
+
+
+def test_entries_expire_and_are_evicted():
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=2, ttl_seconds=10, similarity_threshold=None, clock=clock)
+    for question in ("dengue", "malaria", "typhoid"):
+        cache.put(question, ENGLISH, [], question.upper())
+
+    assert cache.get("dengue", ENGLISH, []) is None
+    assert cache.stats()["evictions"] == 1
+    clock.now = 11
+    assert cache.get("malaria", ENGLISH, []) is None
+
+
+@pytest.mark.asyncio
+async def test_gemini_service_answers_repeated_questions_from_cache():
+    """
+    Tests that only the first of two equivalent questions reaches the model.
+    """
+    model = FakeGeminiModel(reply="Fever and joint pain.")
+    gemini_service = GeminiService(model=model)
+
+    first = await gemini_service.get_ai_response("dengue symptoms", ENGLISH, [])
+    second = await gemini_service.get_ai_response("Dengue symptoms!", ENGLISH, [])
+
+    assert first == second == "Fever and joint pain."
+    assert len(model.prompts) == 1
@@ -0,0 +1,58 @@
+import pytest
+
+from benchmarks.fakes import FakeGeminiModel
+from core.text import estimate_tokens
+from models.schemas import User
+from services.gemini_service import GeminiService
+from services.retrieval import KnowledgeRetriever, RetrievedRow, build_context
+
+RECORDS = [
+    {"topic": "Dengue", "symptoms": "High fever, severe headache, joint pain", "prevention": "Avoid mosquito bites"},
+    {"topic": "Malaria", "symptoms": "Fever with chills and sweating", "prevention": "Use bed nets"},
+    {"topic": "Heat Stroke", "symptoms": "Hot dry skin, confusion", "prevention": "Drink water, avoid noon sun"},
+    {"topic": "Diabetes", "symptoms": "Thirst, frequent urination", "prevention": "Healthy diet and exercise"},
+]
+
+
+def test_search_ranks_the_most_relevant_rows_first():
+    retriever = KnowledgeRetriever(RECORDS)
+
+    results = retriever.search("I have joint pain and high fever, is it dengue?", k=2)
+
+    assert results[0].record["topic"] == "Dengue"
+    assert len(results) <= 2
+    assert results[0].score >= results[-1].score
+
+
+def test_search_without_known_words_returns_nothing():
+    retriever = KnowledgeRetriever(RECORDS)
+
+    assert retriever.search("hello there") == []
+    assert KnowledgeRetriever([]).search("dengue") == []
+
+
+def test_context_respects_the_token_budget():
+    rows = [RetrievedRow(1.0, record) for record in RECORDS]
+
+    context = build_context(rows, max_tokens=40)
+
+    assert context.startswith("- Topic: Dengue")
+    assert estimate_tokens(context) <= 40
+
+
+class FakeKnowledgeBase:
+    def __init__(self):
+        self.retriever = KnowledgeRetriever(RECORDS)
+
+    def retrieve(self, message, k=3):
+        return self.retriever.search(message, k=k)
+
+
+@pytest.mark.asyncio
+async def test_prompt_includes_retrieved_rows():
+    model = FakeGeminiModel()
+    gemini_service = GeminiService(model=model, knowledge_base=FakeKnowledgeBase())
+
+    await gemini_service.get_ai_response("how to prevent malaria", User(phone_number="+911"), [])
+
+    assert "Use bed nets" in model.prompts[0]
@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import FakeRedis, FakeSupabaseClient
+from models.schemas import ChatMessage, User
+from services.database_service import DatabaseService
+from services.gsheets_service import FakeSheetBackend, GSheetsService
+from services.shared_state import InMemorySharedState, RedisSharedState, SharedRateLimiter, SharedState, create_shared_state
+from services.user_cache import SharedUserCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request):
+    clock = FakeClock()
+    if request.param == "memory":
+        return InMemorySharedState(clock=clock), clock
+    return RedisSharedState(FakeRedis(clock=clock)), clock
+
+
+@pytest.mark.asyncio
+async def test_values_and_counters_expire(backend):
+    state, clock = backend
+    await state.set("user:a", "profile", ttl=10)
+    assert await state.incr("rate:a", ttl=1) == 1
+    assert await state.incr("rate:a", ttl=1) == 2
+
+    clock.now = 5
+    assert await state.get("user:a") == "profile"
+    assert await state.incr("rate:a", ttl=1) == 1
+
+    clock.now = 11
+    assert await state.get("user:a") is None
+    await state.set("user:b", "x", ttl=10)
+    await state.delete("user:b")
+    assert await state.get("user:b") is None
+
+
+@pytest.mark.asyncio
+async def test_lock_serializes_holders_of_the_same_key(backend):
+    state, _ = backend
+    events = []
+
+    async def turn(name: str, key: str):
+        async with state.lock(key, timeout=5):
+            events.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            events.append(f"{name} end")
+
+    await asyncio.gather(turn("a1", "conversation:a"), turn("a2", "conversation:a"), turn("b", "conversation:b"))
+
+    assert [event for event in events if event.startswith("a")] == ["a1 start", "a1 end", "a2 start", "a2 end"]
+    # Other conversations are not held up
+    assert events.index("b start") < events.index("a1 end")
+
+
+@pytest.mark.asyncio
+async def test_expired_redis_lock_is_not_released_by_its_old_holder():
+    clock = FakeClock()
+    redis = FakeRedis(clock=clock)
+    first, second = RedisSharedState(redis), RedisSharedState(redis)
+
+    async with first.lock("conversation:a", timeout=1):
+        # The first holder stalls past the timeout and another worker takes over
+        clock.now = 2
+        taken = asyncio.Event()
+        release = asyncio.Event()
+
+        async def take_over():
+            async with second.lock("conversation:a", timeout=60):
+                taken.set()
+                await release.wait()
+
+        task = asyncio.create_task(take_over())
+        await taken.wait()
+
+    assert await redis.get("arogya:lock:conversation:a") is not None
+    release.set()
+    await task
+    assert await redis.get("arogya:lock:conversation:a") is None
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_shares_one_budget_between_processes():
+    redis = FakeRedis()
+    limiters = [SharedRateLimiter(RedisSharedState(redis), rate=4, window=0.1) for _ in range(2)]
+    loop = asyncio.get_running_loop()
+
+    started = loop.time()
+    await asyncio.gather(*(limiters[i % 2].acquire("+15550000000") for i in range(10)))
+
+    # 10 operations at 4 per window need at least three windows, whichever process runs them
+    assert loop.time() - started >= 0.15
+
+
+@pytest.mark.asyncio
+async def test_history_written_by_one_process_is_seen_by_the_next():
+    """
+    Two DatabaseService instances stand in for two worker processes that share
+    Redis; consecutive turns of one user run in different processes.
+    """
+    client = FakeSupabaseClient()
+    redis = FakeRedis()
+    processes = [
+        DatabaseService(client=client, shared_cache=SharedUserCache(RedisSharedState(redis), history_size=5))
+        for _ in range(2)
+    ]
+    await processes[0].create_or_update_user(User(phone_number="+911", has_diabetes=True))
+
+    for turn, text in enumerate(["hello", "fever", "thanks"]):
+        db_service = processes[turn % 2]
+        await db_service.get_user("+911")
+        await db_service.get_chat_history("+911")
+        await db_service.save_chat_message(ChatMessage(phone_number="+911", sender="user", message_text=text))
+
+    history = await processes[1].get_chat_history("+911")
+    assert [m["message_text"] for m in history] == ["hello", "fever", "thanks"]
+    assert (await processes[1].get_user("+911"))["has_diabetes"] is True
+    assert client.requests[("users", "select")] == 0
+    assert client.requests[("chat_history", "select")] == 1
+
+
+@pytest.mark.asyncio
+async def test_only_one_process_downloads_the_sheet(tmp_path):
+    snapshot_path = str(tmp_path / "snapshot.json")
+    leader_backend = FakeSheetBackend([{"topic": "Dengue"}])
+    follower_backend = FakeSheetBackend([{"topic": "Dengue"}])
+    leader = GSheetsService(backend=leader_backend, snapshot_path=snapshot_path, refresh_interval=0)
+    follower = GSheetsService(backend=follower_backend, snapshot_path=snapshot_path, refresh_interval=0)
+
+    await leader.start()
+    await leader._refresh_task
+    await follower.start()
+    await follower._refresh_task
+
+    assert leader_backend.fetch_count == 1 and follower_backend.fetch_count == 0
+    assert await follower.get_health_info("Dengue") is not None
+
+    # A newer download by the leader is picked up from the file
+    leader_backend.records.append({"topic": "Malaria"})
+    await leader.refresh()
+    assert await asyncio.to_thread(follower._reload_if_changed)
+    assert len(follower.records) == 2
+
+    # When the leader stops, another process takes over
+    await leader.stop()
+    assert follower._try_lead()
+    await follower.stop()
+
+
+def test_shared_state_url_selects_the_backend():
+    assert isinstance(create_shared_state(""), InMemorySharedState)
+    with pytest.raises(ValueError):
+        create_shared_state("memcached://localhost")
+    with pytest.raises(TypeError):
+        SharedState()
@@ -0,0 +1,122 @@
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks.fakes import FakeTwilioServer
+from services.sms_dispatcher import SendError, SmsDispatcher, TokenBucket, TwilioHttpSender
+
+
+def make_sender(server):
+    return TwilioHttpSender("AC123", "token", base_url="http://twilio.test", transport=httpx.ASGITransport(app=server))
+
+
+@pytest.mark.asyncio
+async def test_messages_are_sent_through_the_fake_server():
+    server = FakeTwilioServer()
+    sender = make_sender(server)
+    dispatcher = SmsDispatcher(sender, rate_per_second=1000, burst=1000, concurrency=4)
+
+    sids = await asyncio.gather(*(dispatcher.send("+100", f"+91{i}", f"hello {i}") for i in range(20)))
+    await dispatcher.close()
+    await sender.close()
+
+    assert len(set(sids)) == 20
+    assert sorted(m["body"] for m in server.messages) == sorted(f"hello {i}" for i in range(20))
+    assert dispatcher.stats()["sent"] == 20
+
+
+@pytest.mark.asyncio
+async def test_rate_limits_and_server_errors_are_retried():
+    server = FakeTwilioServer()
+    server.failures = [429, 503]
+    sender = make_sender(server)
+    dispatcher = SmsDispatcher(sender, concurrency=1, retry_base_delay=0.01, retry_max_delay=0.02)
+
+    await dispatcher.send("+100", "+911", "hello")
+    await dispatcher.close()
+    await sender.close()
+
+    assert server.requests == 3
+    assert [m["body"] for m in server.messages] == ["hello"]
+    assert dispatcher.retried == 2
+
+
+@pytest.mark.asyncio
+async def test_client_errors_and_exhausted_retries_are_raised():
+    server = FakeTwilioServer()
+    sender = make_sender(server)
+    dispatcher = SmsDispatcher(sender, concurrency=1, max_attempts=2, retry_base_delay=0.01)
+
+    server.failures = [400]
+    with pytest.raises(SendError) as error:
+        await dispatcher.send("+100", "+911", "bad number")
+    assert error.value.status == 400 and not error.value.retryable
+
+    server.failures = [500, 500]
+    with pytest.raises(SendError):
+        await dispatcher.send("+100", "+911", "hello")
+    await dispatcher.close()
+    await sender.close()
+
+    assert dispatcher.failed == 2
+    assert server.messages == []
+
+
+@pytest.mark.asyncio
+async def test_critical_messages_are_sent_first():
+    sent = []
+
+    class RecordingSender:
+        async def send(self, from_number, to_number, body):
+            sent.append(body)
+            await asyncio.sleep(0.001)
+            return body
+
+    dispatcher = SmsDispatcher(RecordingSender(), concurrency=1, rate_per_second=1000, burst=1000)
+    dispatcher.start()
+    normal = [asyncio.create_task(dispatcher.send("+100", "+911", f"normal {i}")) for i in range(5)]
+    critical = asyncio.create_task(dispatcher.send("+100", "+912", "call 108", critical=True))
+    await asyncio.gather(*normal, critical)
+    await dispatcher.close()
+
+    # The worker may already hold the first normal message; the critical one comes next
+    assert sent.index("call 108") <= 1
+
+
+@pytest.mark.asyncio
+async def test_critical_messages_do_not_wait_behind_rate_limited_ones():
+    sent = []
+
+    class RecordingSender:
+        async def send(self, from_number, to_number, body):
+            sent.append(body)
+            return body
+
+    # Every worker is parked on an empty bucket with a normal message
+    dispatcher = SmsDispatcher(RecordingSender(), concurrency=4, rate_per_second=5, burst=1)
+    dispatcher.start()
+    normal = [asyncio.create_task(dispatcher.send("+100", "+911", f"normal {i}")) for i in range(6)]
+    await asyncio.sleep(0.01)
+    critical = await asyncio.wait_for(dispatcher.send("+100", "+912", "call 108", critical=True), timeout=0.1)
+    for task in normal:
+        task.cancel()
+    await dispatcher.close(timeout=0.1)
+
+    assert critical == "call 108"
+    assert sent[:2] == ["normal 0", "call 108"]
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_the_rate():
+    now = [0.0]
+    bucket = TokenBucket(rate=10, burst=2, clock=lambda: now[0])
+
+    await bucket.acquire()
+    await bucket.acquire()
+    waiter = asyncio.create_task(bucket.acquire())
+    await asyncio.sleep(0.02)
+    assert not waiter.done()
+
+    now[0] = 0.1
+    await asyncio.wait_for(waiter, timeout=1)
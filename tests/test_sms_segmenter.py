@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import FakeGeminiModel
+from models.schemas import User
+from services.gemini_service import ERROR_MESSAGE, GeminiService
+from services.response_cache import ResponseCache
+from services.sms_segmenter import SentenceSegmenter, deliver_stream, split_message
+
+REPLY = (
+    "Dengue spreads through mosquito bites. Common signs are high fever, headache and joint pain. "
+    "Drink plenty of fluids and rest. Avoid painkillers like ibuprofen unless a doctor advises them. "
+    "Seek care at once if you notice bleeding, vomiting or severe stomach pain. "
+    "Please consult a registered medical practitioner."
+)
+
+
+def test_split_message_cuts_at_sentence_boundaries():
+    segments = split_message(REPLY, max_chars=120)
+
+    assert all(len(segment) <= 120 for segment in segments)
+    assert all(segment.endswith(".") for segment in segments)
+    assert " ".join(segments) == REPLY
+
+
+def test_split_message_falls_back_to_spaces_and_hard_cuts():
+    assert split_message("word " * 10, max_chars=12) == ["word word", "word word", "word word", "word word", "word word"]
+    assert split_message("x" * 25, max_chars=10) == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_first_segment_is_released_early():
+    """
+    Tests that the first complete sentences go out before a full segment has been generated.
+    """
+    segmenter = SentenceSegmenter(max_chars=320, first_min_chars=30)
+
+    assert segmenter.feed("Dengue spreads through mosquito") == []
+    assert segmenter.feed(" bites. Common signs") == ["Dengue spreads through mosquito bites."]
+    assert segmenter.feed(" are fever and pain.") == []
+    assert segmenter.flush() == ["Common signs are fever and pain."]
+    assert segmenter.text == "Dengue spreads through mosquito bites. Common signs are fever and pain."
+
+
+@pytest.mark.asyncio
+async def test_deliver_stream_sends_in_order_while_generating():
+    sent = []
+    generated = []
+
+    async def chunks():
+        for start in range(0, len(REPLY), 25):
+            generated.append(start)
+            yield REPLY[start:start + 25]
+            await asyncio.sleep(0)
+
+    async def send(segment):
+        sent.append((len(generated), segment))
+        await asyncio.sleep(0.001)
+
+    full_text = await deliver_stream(chunks(), send, max_chars=120, first_min_chars=60)
+
+    assert full_text == REPLY
+    assert " ".join(segment for _, segment in sent) == REPLY
+    # The first segment was sent before generation finished
+    assert sent[0][0] < len(generated)
+
+
+@pytest.mark.asyncio
+async def test_stream_ai_response_caches_the_full_text():
+    model = FakeGeminiModel(reply=REPLY, chunk_size=30)
+    service = GeminiService(model=model, response_cache=ResponseCache())
+    user = User(phone_number="+911", language="English")
+
+    pieces = [piece async for piece in service.stream_ai_response("dengue symptoms", user, [])]
+    assert len(pieces) > 1
+    assert "".join(pieces) == REPLY
+
+    cached = [piece async for piece in service.stream_ai_response("dengue symptoms", user, [])]
+    assert cached == [REPLY]
+    assert len(model.prompts) == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_ai_response_errors():
+    user = User(phone_number="+911", language="English")
+
+    model = FakeGeminiModel(reply=REPLY)
+    model.error = RuntimeError("quota exceeded")
+    service = GeminiService(model=model, response_cache=ResponseCache())
+    assert [piece async for piece in service.stream_ai_response("fever", user, [])] == [ERROR_MESSAGE]
+
+    # Text that was already generated is kept; no apology is appended
+    model = FakeGeminiModel(reply=REPLY, chunk_size=50)
+    model.stream_error = RuntimeError("connection reset")
+    service = GeminiService(model=model, response_cache=ResponseCache())
+    assert "".join([piece async for piece in service.stream_ai_response("fever", user, [])]) == REPLY
+    assert len(service.response_cache) == 0
@@ -0,0 +1,117 @@
+import pytest
+
+from benchmarks.fakes import FakeSupabaseClient
+from models.schemas import ChatMessage, User
+from services.database_service import DatabaseService
+from services.profile import CachedProfile, profile_fragment, profile_segment
+from services.user_cache import UserCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction_and_ttl_expiry():
+    """
+    Tests that the least recently used entry is evicted first and that entries expire.
+    """
+    clock = FakeClock()
+    cache = UserCache(max_entries=2, ttl_seconds=10, clock=clock)
+    cache.put_user(User(phone_number="a"))
+    cache.put_user(User(phone_number="b"))
+    assert cache.get_user("a") is not None  # "a" is now the most recently used
+
+    cache.put_user(User(phone_number="c"))
+    assert cache.get_user("b") is None
+    assert cache.stats()["evictions"] == 1
+
+    clock.now = 11
+    assert cache.get_user("a") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 1, "expirations": 1, "size": 1}
+
+
+def test_history_window_is_only_served_once_loaded():
+    cache = UserCache(history_size=3)
+    cache.append_message("a", {"sender": "user", "message_text": "ignored"})
+    assert cache.get_history("a", 2) is None
+
+    cache.set_history("a", [{"message_text": "1"}, {"message_text": "2"}])
+    cache.append_message("a", {"message_text": "3"})
+    cache.append_message("a", {"message_text": "4"})
+
+    assert [m["message_text"] for m in cache.get_history("a", 3)] == ["2", "3", "4"]
+    assert cache.get_history("a", 4) is None
+
+
+@pytest.mark.asyncio
+async def test_returning_user_turn_needs_no_database_reads():
+    """
+    Tests that after the first turn, the profile and history come from the cache
+    and saved messages are written through to it.
+    """
+    # ARRANGE: A fake Supabase with one existing user
+    client = FakeSupabaseClient()
+    client.tables["users"].append(User(phone_number="+15550001111", has_diabetes=True).model_dump())
+    db_service = DatabaseService(client=client)
+
+    # ACT: Two turns of fetching the profile and history and saving messages
+    for text in ("hello", "dengue symptoms"):
+        await db_service.get_user("+15550001111")
+        await db_service.get_chat_history("+15550001111")
+        await db_service.save_chat_message(ChatMessage(phone_number="+15550001111", sender="user", message_text=text))
+
+    # ASSERT: Only the first turn read from the database, and history includes the writes
+    assert client.requests[("users", "select")] == 1
+    assert client.requests[("chat_history", "select")] == 1
+    history = await db_service.get_chat_history("+15550001111")
+    assert [m["message_text"] for m in history] == ["hello", "dengue symptoms"]
+    assert (await db_service.get_user("+15550001111"))["has_diabetes"] is True
+
+
+@pytest.mark.asyncio
+async def test_history_rows_with_the_same_timestamp_keep_their_insert_order():
+    """
+    Tests that a user row and bot row inserted in one batch (same created_at) come back in order.
+    """
+    client = FakeSupabaseClient()
+    for sender, text in (("user", "what is dengue"), ("bot", "A viral fever."), ("user", "thanks"), ("bot", "Welcome")):
+        client._insert_row("chat_history", {"phone_number": "+911", "sender": sender, "message_text": text,
+                                            "created_at": "2025-01-01T00:00:00+00:00"})
+
+    history = await DatabaseService(client=client).get_chat_history("+911", limit=4)
+
+    assert [m["message_text"] for m in history] == ["what is dengue", "A viral fever.", "thanks", "Welcome"]
+
+
+def test_cached_profile_matches_the_user_it_was_built_from():
+    user = User(phone_number="+911", age=60, has_hypertension=True, other_conditions="Asthma")
+    profile = CachedProfile.from_user(user)
+
+    assert profile.prompt_fragment == profile_fragment(user)
+    assert profile.segment == profile_segment(user)
+    assert profile.to_dict() == user.model_dump()
+    assert profile.version == CachedProfile.from_user(user.model_copy()).version
+    assert profile.version != CachedProfile.from_user(user.model_copy(update={"age": 61})).version
+
+
+@pytest.mark.asyncio
+async def test_profile_is_only_rebuilt_when_it_changes():
+    client = FakeSupabaseClient()
+    client.tables["users"].append({**User(phone_number="+911").model_dump(), "created_at": "2024-01-01"})
+    db_service = DatabaseService(client=client)
+
+    first = await db_service.get_profile("+911")
+    assert await db_service.get_profile("+911") is first
+
+    # Saving the same profile keeps the cached object; a changed one replaces it
+    await db_service.create_or_update_user(User(phone_number="+911"))
+    assert await db_service.get_profile("+911") is first
+    await db_service.create_or_update_user(User(phone_number="+911", has_diabetes=True))
+    updated = await db_service.get_profile("+911")
+    assert updated.version != first.version
+    assert "Condition: Diabetes" in updated.prompt_fragment
+    assert client.requests[("users", "select")] == 1
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import FakeSupabaseClient
+from models.schemas import ChatMessage
+from services.database_service import DatabaseService
+from services.write_behind import BatchWriter
+
+
+@pytest.mark.asyncio
+async def test_messages_from_many_conversations_are_coalesced():
+    """
+    Tests that concurrent saves become a few bulk inserts and are flushed on close.
+    """
+    # ARRANGE: A database service with the write-behind flusher running
+    client = FakeSupabaseClient()
+    db_service = DatabaseService(client=client)
+    await db_service.start()
+
+    # ACT: 50 conversations each save a user message and a bot reply
+    await asyncio.gather(*(
+        db_service.save_chat_message(ChatMessage(phone_number=f"+91{i}", sender=sender, message_text="hi"))
+        for i in range(50) for sender in ("user", "bot")
+    ))
+    await db_service.close()
+
+    # ASSERT: All 100 rows were written with a single insert
+    assert len(client.tables["chat_history"]) == 100
+    assert client.requests[("chat_history", "insert")] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_batches_are_retried_in_order():
+    written = []
+    failures = [RuntimeError("database down")]
+
+    async def write_batch(rows):
+        if failures:
+            raise failures.pop()
+        written.extend(rows)
+
+    writer = BatchWriter(write_batch, flush_interval=0.01, retry_base_delay=0.01)
+    writer.start()
+    for i in range(5):
+        await writer.put({"n": i})
+    await writer.close()
+
+    assert [row["n"] for row in written] == [0, 1, 2, 3, 4]
+    assert writer.stats()["failed_writes"] == 1
+    assert writer.stats()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_buffer_is_bounded():
+    async def write_batch(rows):
+        raise RuntimeError("database down")
+
+    writer = BatchWriter(write_batch, max_batch_size=2, max_buffered=3, retry_base_delay=0.001, shutdown_retries=0)
+    writer.start()
+    for i in range(6):
+        await writer.put({"n": i})
+    await writer.close()
+
+    assert writer.rows_written == 0
+    assert writer.rows_dropped == 6
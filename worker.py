@@ -0,0 +1,40 @@
+import asyncio
+import logging
+import signal
+
+# Importing main builds the services, the job queue and the worker pool
+from main import app, dependencies, lifespan, worker_pool
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def run_worker():
+    """
+    Runs background jobs without serving the webhook.
+
+    Start one of these per CPU core (with JOB_RUN_IN_PROCESS=false on the web
+    process) to spread message processing across processes; they all share
+    the SQLite job queue at JOB_QUEUE_PATH.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with lifespan(app):
+        # Jobs need the database, Gemini and Twilio; wait until they have started (or we are stopped)
+        ready = asyncio.create_task(dependencies.wait_ready())
+        stopping = asyncio.create_task(stop.wait())
+        await asyncio.wait({ready, stopping}, return_when=asyncio.FIRST_COMPLETED)
+        ready.cancel()
+        if not stop.is_set():
+            await worker_pool.start()
+            logger.info("Worker process started; waiting for jobs.")
+        await stopping
+    logger.info("Worker process stopped.")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())